@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Async Microsoft Graph Transport
+``httpx.AsyncClient`` counterpart of ``GraphTransport`` for asyncio code.
+"""
+import asyncio
+import httpx
+from typing import Dict
+from app.settings import settings
+from app.email_ingest.graph_scheduler import IDEMPOTENT_METHODS, mailbox_from_url
+from app.email_ingest.graph_transport import DEFAULT_TIMEOUT, GraphTransport, get_transport
+
+RETRY_EXCEPTIONS = (httpx.TransportError,)  # connection failures and timeouts
+
+
+class AsyncGraphTransport:
+    """Authenticated, connection-pooled async access to Microsoft Graph.
+
+    Shares the app token and the ``GraphScheduler`` (per-mailbox pacing and
+    retry counters) of the process-wide ``GraphTransport``, so sync and async
+    clients in one process stay within the same Graph limits. Token renewal
+    runs MSAL in a worker thread so the event loop never blocks on it.
+    """
+
+    def __init__(self, sync_transport: GraphTransport = None, pool_size: int = None):
+        self.sync_transport = sync_transport or get_transport()
+        self.scheduler = self.sync_transport.scheduler
+        pool_size = pool_size or settings.GRAPH_POOL_SIZE
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=DEFAULT_TIMEOUT
+        )
+
+    async def get_token(self, force_refresh: bool = False) -> str:
+        token = None if force_refresh else self.sync_transport.cached_token()
+        return token or await asyncio.to_thread(self.sync_transport.get_token, force_refresh)
+
+    async def request(self, method: str, url: str, headers: Dict[str, str] = None, mailbox: str = None,
+                      cost: float = 1.0, stream: bool = False, idempotent: bool = None,
+                      **kwargs) -> httpx.Response:
+        """Send an authenticated request through the scheduler (see ``GraphTransport.request``).
+
+        With ``stream=True`` the body is not read; use ``aiter_bytes`` and
+        ``aclose`` on the response.
+        """
+        mailbox = (mailbox or mailbox_from_url(url)).lower()
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        if isinstance(kwargs.get("data"), (str, bytes)):
+            kwargs["content"] = kwargs.pop("data")  # httpx takes raw bodies as content=
+
+        async def send():
+            token = await self.get_token()
+            request = self.client.build_request(
+                method, url,
+                headers={"Authorization": f"Bearer {token}", "Accept": "application/json", **(headers or {})},
+                **kwargs
+            )
+            return await self.client.send(request, stream=stream)
+
+        resp = await self.scheduler.send_async(mailbox, send, cost, RETRY_EXCEPTIONS, idempotent)
+        if resp.status_code == 401:
+            await resp.aclose()
+            await self.get_token(force_refresh=True)
+            resp = await self.scheduler.send_async(mailbox, send, cost, RETRY_EXCEPTIONS, idempotent)
+        return resp
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
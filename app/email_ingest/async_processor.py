@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+"""
+Async Email Ingestion Processor
+asyncio version of EmailProcessor: listing, attachment downloads and moves
+overlap on one event loop, with disk writes and SQLite state (ledger, folder
+cache, delta links, conversation index) offloaded to worker threads.
+"""
+import asyncio
+import hashlib
+from collections import deque
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+from app.settings import settings
+from app.email_ingest.async_graph import AsyncGraphTransport
+from app.email_ingest.email_processor import DOWNLOAD_CHUNK_SIZE, LIST_FIELDS, MESSAGE_FIELDS, EmailProcessor
+from app.email_ingest.graph_batch import GraphBatch, MAX_BATCH_SIZE
+from app.email_ingest.ingest_ledger import MOVED, SAVED
+
+
+class AsyncEmailProcessor:
+    """Same public API as ``EmailProcessor``, with coroutines for everything that talks to Graph.
+
+    Local state (data directory layout, ingestion ledger, blob store,
+    conversation index and reply rules) is shared with an internal
+    ``EmailProcessor``, so both produce identical results on disk.
+    Use as ``async with AsyncEmailProcessor() as p: await p.process_emails(...)``
+    or call ``aclose()`` when done.
+    """
+
+    def __init__(self, download_workers: int = None, server_filter: bool = None):
+        self.local = EmailProcessor(download_workers=download_workers, server_filter=server_filter)
+        self.transport = AsyncGraphTransport(self.local.transport)
+        self.data_dir = self.local.data_dir
+        self.conversation_index = self.local.conversation_index
+        self.download_workers = self.local.download_workers
+
+    @property
+    def graph_root(self) -> str:
+        return self.local.graph_root
+
+    @graph_root.setter
+    def graph_root(self, value: str) -> None:
+        self.local.graph_root = value
+
+    async def __aenter__(self) -> "AsyncEmailProcessor":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+    def _graph_batch(self) -> GraphBatch:
+        return GraphBatch(self.transport, self.graph_root)
+
+    async def get_folder_id(self, user: str, path_segments: List[str]) -> str:
+        """Resolve a folder path; usually a cache hit, otherwise resolved in a worker thread."""
+        return await asyncio.to_thread(self.local.get_folder_id, user, path_segments)
+
+    def is_original_inbound_email(self, email_data: Dict) -> bool:
+        """See ``EmailProcessor.is_original_inbound_email``; answered from prefetched conversations."""
+        return self.local.is_original_inbound_email(email_data)
+
+    async def prefetch_conversations(self, messages: List[Dict]) -> None:
+        batch = self._graph_batch()
+        requested = await asyncio.to_thread(self.local._queue_conversations, messages, batch)
+        if requested:
+            self.local._store_conversations(requested, await batch.execute_async())
+
+    async def _select_originals(self, user: str, page: List[Dict], original_only: bool,
+                                two_phase: bool) -> List[Dict]:
+        """Async ``EmailProcessor._select_originals``."""
+        await asyncio.to_thread(self.local.conversation_index.observe, user, page)
+        if original_only:
+            page = [m for m in page if self.local._passes_header_rules(m)]
+            await self.prefetch_conversations(page)
+            # Conversations are cached now; anything the prefetch missed is checked off the loop
+            checks = await asyncio.gather(*(asyncio.to_thread(self.is_original_inbound_email, m) for m in page))
+            page = [m for m, keep in zip(page, checks) if keep]
+        if two_phase:
+            missing = [m['id'] for m in page if 'body' not in m]
+            full = await self.get_messages_batch(user, missing) if missing else {}
+            page = [full.get(m['id']) if m['id'] in full else m for m in page]
+            page = [m for m in page if m]
+        return page
+
+    async def iter_messages(self, user: str, folder_id: str, page_size: int = 50, original_only: bool = True,
+                            delta: bool = False, server_filter: bool = None) -> AsyncIterator[Dict]:
+        """Async generator version of ``EmailProcessor.iter_messages``."""
+        local = self.local
+        two_phase = original_only and (local.server_filter if server_filter is None else server_filter)
+        local.current_mailbox = user  # Store for filtering
+        headers = None
+
+        if delta:
+            local.pending_delta = None
+            select = LIST_FIELDS if two_phase else MESSAGE_FIELDS
+            delta_url = f"{self.graph_root}/users/{user}/mailFolders/{folder_id}/messages/delta?$select={select}"
+            url = await asyncio.to_thread(local.delta_store.get, user, folder_id)
+            if url:
+                print("🔁 Resuming delta sync from saved state")
+            else:
+                print("🆕 No delta state for this folder, starting a full sync")
+                url = delta_url
+            # Delta queries ignore $top; page size is requested through the Prefer header
+            headers = {"Prefer": f"odata.maxpagesize={page_size}"}
+
+        def first_page_url():
+            url = (f"{self.graph_root}/users/{user}/mailFolders/{folder_id}/messages"
+                   f"?$select={LIST_FIELDS if two_phase else MESSAGE_FIELDS}&$top={page_size}")
+            filters = local._server_filters(user)
+            if two_phase and local._filter_level < len(filters):
+                url += f"&$filter={filters[local._filter_level]}"
+            return url
+
+        if not delta:
+            url = first_page_url()
+        first_page = True
+        while url:
+            resp = await self.transport.get(url, headers=headers)
+            if delta and resp.status_code == 410:
+                print("⚠️  Delta state expired, restarting full sync")
+                await asyncio.to_thread(local.delta_store.clear, user, folder_id)
+                url = delta_url
+                continue
+            if not delta and resp.status_code == 400 and first_page and "$filter=" in url:
+                local._filter_level += 1
+                print(f"⚠️  Graph rejected server-side filter, falling back (level {local._filter_level})")
+                url = first_page_url()
+                continue
+            if resp.status_code == 404:
+                await asyncio.to_thread(local.folder_cache.invalidate_id, user, folder_id)
+                if delta:
+                    await asyncio.to_thread(local.delta_store.clear, user, folder_id)
+            if resp.status_code != 200:
+                raise RuntimeError(f"{'Delta message' if delta else 'Message'} fetch failed: {resp.text}")
+            first_page = False
+            data = resp.json()
+            # Deleted or moved-out messages only carry an id and @removed
+            page = [m for m in data.get("value", []) if "@removed" not in m]
+            for msg in await self._select_originals(user, page, original_only, two_phase):
+                yield msg
+            url = data.get("@odata.nextLink")
+            if delta and data.get("@odata.deltaLink"):
+                # Stored by process_emails once the round's messages are saved
+                local.pending_delta = (user, folder_id, data["@odata.deltaLink"])
+
+    async def get_messages_batch(self, user: str, msg_ids: List[str]) -> Dict[str, Optional[Dict]]:
+        batch = self._graph_batch()
+        requested = {
+            batch.add("GET", f"{self.graph_root}/users/{user}/messages/{msg_id}?$select={MESSAGE_FIELDS}"): msg_id
+            for msg_id in msg_ids
+        }
+        messages = {msg_id: None for msg_id in msg_ids}
+        for request_id, resp in (await batch.execute_async()).items():
+            if request_id not in requested:
+                continue
+            if resp["status"] == 200:
+                messages[requested[request_id]] = resp["body"]
+            elif resp["status"] != 404:
+                raise RuntimeError(f"Message fetch failed: {resp['body']}")
+        return messages
+
+    async def get_attachments(self, user: str, msg_id: str) -> List[Dict]:
+        """Get all attachments for a message."""
+        url = f"{self.graph_root}/users/{user}/messages/{msg_id}/attachments?$select=id,name,contentType,size"
+        resp = await self.transport.get(url)
+        if resp.status_code != 200:
+            print(f"⚠️  Failed to fetch attachments: {resp.text}")
+            return []
+        return resp.json().get("value", [])
+
+    async def get_attachments_batch(self, user: str, msg_ids: List[str]) -> Dict[str, List[Dict]]:
+        batch = self._graph_batch()
+        requested = {
+            batch.add("GET", f"{self.graph_root}/users/{user}/messages/{msg_id}/attachments"
+                             f"?$select=id,name,contentType,size"): msg_id
+            for msg_id in msg_ids
+        }
+        attachments = {msg_id: [] for msg_id in msg_ids}
+        for request_id, resp in (await batch.execute_async()).items():
+            if request_id not in requested:
+                continue
+            if resp["status"] != 200:
+                print(f"⚠️  Failed to fetch attachments: {resp['body']}")
+                continue
+            attachments[requested[request_id]] = resp["body"].get("value", [])
+        return attachments
+
+    async def download_attachment(self, user: str, msg_id: str, attachment: Dict) -> Optional[bytes]:
+        """Download a single attachment into memory."""
+        url = f"{self.graph_root}/users/{user}/messages/{msg_id}/attachments/{attachment['id']}/$value"
+        resp = await self.transport.get(url)
+        if resp.status_code != 200:
+            print(f"⚠️  Cannot download {attachment['name']}: {resp.text}")
+            return None
+        return resp.content
+
+    async def download_attachment_to_file(self, user: str, msg_id: str, attachment: Dict, dest_path: Path) -> bool:
+        """Stream an attachment to ``dest_path`` (see ``EmailProcessor.download_attachment_to_file``).
+
+        Chunks are written by a worker thread while the loop keeps other
+        downloads and requests moving.
+        """
+        filename = attachment["name"]
+        url = f"{self.graph_root}/users/{user}/messages/{msg_id}/attachments/{attachment['id']}/$value"
+        part_path = dest_path.with_name(dest_path.name + ".part")
+        resp = await self.transport.get(url, stream=True)
+        try:
+            if resp.status_code != 200:
+                await resp.aread()
+                print(f"⚠️  Cannot download {filename}: {resp.text}")
+                return False
+            digest = hashlib.sha256()
+            f = await asyncio.to_thread(open, part_path, 'wb')
+            try:
+                async for chunk in resp.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    digest.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+            except Exception as e:
+                f.close()
+                part_path.unlink(missing_ok=True)
+                print(f"⚠️  Cannot download {filename}: {e}")
+                return False
+            await asyncio.to_thread(f.close)
+        finally:
+            await resp.aclose()
+        await asyncio.to_thread(self.local.blob_store.add_file, part_path, dest_path, digest.hexdigest())
+        return True
+
+    async def _download_and_record(self, user: str, msg_id: str, attachment: Dict, dest_path: Path,
+                                   slots: asyncio.Semaphore) -> bool:
+        async with slots:
+            ok = await self.download_attachment_to_file(user, msg_id, attachment, dest_path)
+        if ok:
+            await asyncio.to_thread(self.local.ledger.record_attachment, user, msg_id, attachment["id"], dest_path)
+        return ok
+
+    async def save_email_data(self, email_data: Dict, attachments: List[Tuple[str, Union[bytes, Path]]],
+                              email_dir: Path = None) -> str:
+        """Write metadata, attachments and summary in a worker thread."""
+        return await asyncio.to_thread(self.local.save_email_data, email_data, attachments, email_dir)
+
+    async def move_message(self, user: str, msg_id: str, dest_folder_id: str) -> bool:
+        """Move a message to a different folder."""
+        resp = await self.transport.post(f"{self.graph_root}/users/{user}/messages/{msg_id}/move",
+                                         json={"destinationId": dest_folder_id})
+        return resp.status_code in (200, 201)
+
+    async def move_messages_batch(self, user: str, msg_ids: List[str], dest_folder_id: str) -> Dict[str, bool]:
+        batch = self._graph_batch()
+        requested = {
+            batch.add("POST", f"{self.graph_root}/users/{user}/messages/{msg_id}/move",
+                      body={"destinationId": dest_folder_id}): msg_id
+            for msg_id in msg_ids
+        }
+        moved = {msg_id: False for msg_id in msg_ids}
+        for request_id, resp in (await batch.execute_async()).items():
+            if request_id in requested:
+                moved[requested[request_id]] = resp["status"] in (200, 201)
+        return moved
+
+    async def _start_batch(self, mailbox: str, messages: List[Dict], slots: asyncio.Semaphore,
+                           results: Dict) -> List[Tuple[Dict, Path, Optional[List]]]:
+        """List attachments for a batch and start their downloads as tasks (see ``EmailProcessor._start_batch``)."""
+        local = self.local
+        entries = await asyncio.to_thread(local.ledger.get_many, mailbox, [m['id'] for m in messages])
+        to_list = local._needs_listing(messages, entries)
+        try:
+            attachments_by_msg = await self.get_attachments_batch(mailbox, [m['id'] for m in to_list]) if to_list else {}
+        except Exception as e:
+            print(f"❌ Failed to list attachments for {len(to_list)} messages: {e}")
+            results["failed_messages"] += len(to_list)
+            results["failed_ids"].extend(m['id'] for m in to_list)
+            to_list, attachments_by_msg = [], {}
+
+        plans = await asyncio.to_thread(local._plan_batch, mailbox, messages, entries, to_list,
+                                        attachments_by_msg, results)
+        started = []
+        for msg, email_dir, plan in plans:
+            if plan is None:
+                started.append((msg, email_dir, None))
+                continue
+            downloads = []
+            for att, path, done in plan:
+                if done:
+                    task = asyncio.get_running_loop().create_future()
+                    task.set_result(True)
+                else:
+                    task = asyncio.create_task(self._download_and_record(mailbox, msg['id'], att, path, slots))
+                downloads.append((att, path, task))
+            started.append((msg, email_dir, downloads))
+        return started
+
+    async def _finish_batch(self, mailbox: str, started: List[Tuple[Dict, Path, Optional[List]]],
+                            dest_id: Optional[str], move_processed: bool, results: Dict) -> None:
+        """Save each message in order once its downloads finish, then move the batch."""
+        saved = []
+        for msg, email_dir, downloads in started:
+            if downloads is None:
+                saved.append(msg)  # saved by an earlier run, only the move is left
+                continue
+            try:
+                downloaded_attachments = []
+                for att, path, task in downloads:
+                    if await task:
+                        downloaded_attachments.append((att.get('name'), path))
+                        results["total_attachments"] += 1
+
+                saved_location = await self.save_email_data(msg, downloaded_attachments, email_dir=email_dir)
+                await asyncio.to_thread(self.local.ledger.mark, mailbox, [msg['id']], SAVED, email_dir)
+                results["saved_locations"].append(saved_location)
+                results["processed_messages"] += 1
+                saved.append(msg)
+                print(f"✅ Saved to: {saved_location}")
+            except Exception as e:
+                print(f"❌ Failed to process message: {e}")
+                results["failed_messages"] += 1
+                results["failed_ids"].append(msg['id'])
+
+        if move_processed and dest_id and saved:
+            moved = await self.move_messages_batch(mailbox, [m['id'] for m in saved], dest_id)
+            await asyncio.to_thread(self.local.ledger.mark, mailbox, [msg_id for msg_id, ok in moved.items() if ok], MOVED)
+            for msg in saved:
+                state = "✅ saved & moved" if moved.get(msg['id']) else "⚠️  saved, move failed"
+                print(f"{state}: {msg.get('subject','(no subject)')[:60]}")
+
+    async def process_emails(self,
+                             mailbox: str = None,
+                             src_path: List[str] = None,
+                             dest_folder: str = "archive_processed",
+                             move_processed: bool = True,
+                             max_emails: int = None,
+                             original_only: bool = True,
+                             debug_conversations: bool = False,
+                             delta_sync: bool = False,
+                             download_workers: int = None,
+                             server_filter: bool = None) -> Dict:
+        """Async ``EmailProcessor.process_emails``; returns the same results dict.
+
+        Batches of 20 are listed, downloaded and moved as tasks: while one
+        batch is saved and moved the next is already downloading, and at
+        most ``download_workers`` attachment downloads run at once.
+        """
+        mailbox = mailbox or settings.SHARED_MAILBOX
+        src_path = src_path or [settings.MAILBOX_FOLDER]
+
+        print(f"🔍 Looking for messages in {mailbox}/{'/'.join(src_path)}")
+        src_id = await self.get_folder_id(mailbox, src_path)
+        dest_id = await self.get_folder_id(mailbox, src_path + [dest_folder]) if move_processed else None
+
+        # Messages an earlier run left half done are not listed again in delta mode
+        results = await asyncio.to_thread(
+            self.local.process_message_ids, mailbox, [], src_path=src_path, dest_folder=dest_folder,
+            move_processed=move_processed, original_only=original_only, download_workers=download_workers,
+            resume_unfinished=True
+        )
+        slots = asyncio.Semaphore(max(1, download_workers or self.download_workers))
+        batch = []
+        pending = deque()  # started batches awaiting save/move
+        message_count = 0
+
+        try:
+            async for msg in self.iter_messages(mailbox, src_id, original_only=original_only, delta=delta_sync,
+                                                server_filter=server_filter):
+                if max_emails and message_count >= max_emails:
+                    break
+                message_count += 1
+                results["total_messages"] += 1
+                if not await asyncio.to_thread(self.local.admit_message, msg, message_count, original_only,
+                                               debug_conversations, results):
+                    continue
+
+                batch.append(msg)
+                if len(batch) >= MAX_BATCH_SIZE:
+                    pending.append(await self._start_batch(mailbox, batch, slots, results))
+                    batch = []
+                    while len(pending) > 1:
+                        await self._finish_batch(mailbox, pending[0], dest_id, move_processed, results)
+                        pending.popleft()
+
+            if batch:
+                pending.append(await self._start_batch(mailbox, batch, slots, results))
+            while pending:
+                await self._finish_batch(mailbox, pending[0], dest_id, move_processed, results)
+                pending.popleft()
+        finally:
+            # Listing or saving raised: don't leave downloads running behind the caller's back
+            tasks = [task for started in pending for _, _, downloads in started if downloads
+                     for _, _, task in downloads if not task.done()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if delta_sync:
+            await asyncio.to_thread(self.local.commit_delta, results)
+        self.local.print_summary(results)
+        return results
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+"""
+Content-Addressed Attachment Store
+Keeps one copy of each distinct attachment under data/blobs, keyed by SHA-256,
+and hardlinks it into every email directory that received it.
+"""
+import hashlib
+import os
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+from app.settings import settings
+from app.storage.state_db import connect_state_db
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def file_sha256(path: Path) -> str:
+    """Hash a file without loading it into memory."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """SHA-256 keyed blob storage with a refcount index.
+
+    References are named ``<email dir name>/<relative path>`` so they stay
+    valid when email directories are archived or moved as a whole.
+    """
+
+    def __init__(self, root: Path = None, db_path: str = None):
+        self.root = Path(root or settings.BLOB_STORE_DIR)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.conn = connect_state_db(db_path)
+        self.lock = threading.Lock()
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER,
+                refcount INTEGER NOT NULL DEFAULT 0,
+                s3_key TEXT,
+                created_at TEXT
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS blob_refs (
+                ref TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def blob_path(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256
+
+    @staticmethod
+    def ref_for(path: Path) -> str:
+        """Reference name for a file inside an email directory (``<dir>/attachments/<name>``)."""
+        path = Path(path)
+        return f"{path.parent.parent.name}/{path.parent.name}/{path.name}"
+
+    def add_file(self, src: Path, dest: Path, sha256: str = None) -> str:
+        """Move ``src`` into the store (or drop it if already stored) and link it at ``dest``.
+
+        ``sha256`` may be passed when the caller hashed the data while writing it.
+        Returns the content hash.
+        """
+        src, dest = Path(src), Path(dest)
+        sha256 = sha256 or file_sha256(src)
+        blob = self.blob_path(sha256)
+        ref = self.ref_for(dest)
+        
+        with self.lock:
+            if blob.exists():
+                src.unlink()
+            else:
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(src, blob)
+            
+            if dest.exists():
+                dest.unlink()
+            try:
+                os.link(blob, dest)
+            except OSError:
+                # Filesystems without hardlinks (or a store on another device) get a copy
+                shutil.copyfile(blob, dest)
+            
+            previous = self.conn.execute("SELECT sha256 FROM blob_refs WHERE ref = ?", (ref,)).fetchone()
+            if previous and previous[0] == sha256:
+                return sha256
+            if previous:
+                self._decrement(previous[0])
+            self.conn.execute(
+                "INSERT INTO blobs (sha256, size, refcount, created_at) VALUES (?, ?, 0, ?) "
+                "ON CONFLICT(sha256) DO NOTHING",
+                (sha256, blob.stat().st_size, datetime.now().isoformat())
+            )
+            self.conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?", (sha256,))
+            self.conn.execute("INSERT OR REPLACE INTO blob_refs (ref, sha256) VALUES (?, ?)", (ref, sha256))
+            self.conn.commit()
+        return sha256
+
+    def add_bytes(self, content: bytes, dest: Path) -> str:
+        """Store in-memory content and link it at ``dest``."""
+        dest = Path(dest)
+        part_path = dest.with_name(dest.name + ".part")
+        part_path.write_bytes(content)
+        return self.add_file(part_path, dest, hashlib.sha256(content).hexdigest())
+
+    def _decrement(self, sha256: str) -> None:
+        self.conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = ?", (sha256,))
+        row = self.conn.execute("SELECT refcount FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        if row and row[0] <= 0:
+            self.blob_path(sha256).unlink(missing_ok=True)
+            self.conn.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+
+    def release(self, path: Path) -> None:
+        """Drop the reference held by an email file; the blob is deleted with its last reference."""
+        ref = self.ref_for(path)
+        with self.lock:
+            row = self.conn.execute("SELECT sha256 FROM blob_refs WHERE ref = ?", (ref,)).fetchone()
+            if not row:
+                return
+            self.conn.execute("DELETE FROM blob_refs WHERE ref = ?", (ref,))
+            self._decrement(row[0])
+            self.conn.commit()
+
+    def release_dir(self, email_dir: Path) -> int:
+        """Drop every reference held by an email directory, e.g. when it is archived or deleted.
+
+        Works from the index alone, so the directory may already be gone.
+        Returns the number of references released.
+        """
+        prefix = f"{Path(email_dir).name}/"
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT ref, sha256 FROM blob_refs WHERE substr(ref, 1, ?) = ?", (len(prefix), prefix)
+            ).fetchall()
+            for ref, sha256 in rows:
+                self.conn.execute("DELETE FROM blob_refs WHERE ref = ?", (ref,))
+                self._decrement(sha256)
+            self.conn.commit()
+        return len(rows)
+
+    def sha_for(self, path: Path) -> Optional[str]:
+        """Content hash recorded for an email file, or None if it is not in the store."""
+        with self.lock:
+            row = self.conn.execute("SELECT sha256 FROM blob_refs WHERE ref = ?", (self.ref_for(path),)).fetchone()
+        return row[0] if row else None
+
+    def uploaded_key(self, sha256: str) -> Optional[str]:
+        """S3 key this blob was first uploaded under, if any."""
+        with self.lock:
+            row = self.conn.execute("SELECT s3_key FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        return row[0] if row else None
+
+    def mark_uploaded(self, sha256: str, s3_key: str) -> None:
+        with self.lock:
+            self.conn.execute("UPDATE blobs SET s3_key = ? WHERE sha256 = ? AND s3_key IS NULL", (s3_key, sha256))
+            self.conn.commit()
+
+    def stats(self) -> Dict:
+        """Blob count, stored bytes and bytes saved by deduplication."""
+        with self.lock:
+            blobs, stored, referenced = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(size * refcount), 0) FROM blobs"
+            ).fetchone()
+        return {"blobs": blobs, "stored_bytes": stored, "deduplicated_bytes": referenced - stored}
+
+
+_blob_store: Optional[BlobStore] = None
+_blob_store_lock = threading.Lock()
+
+def get_blob_store() -> BlobStore:
+    """Return the process-wide blob store, so every processor in a multi-source run shares its lock."""
+    global _blob_store
+    with _blob_store_lock:
+        if _blob_store is None:
+            _blob_store = BlobStore()
+        return _blob_store
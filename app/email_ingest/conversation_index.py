@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Conversation Origin Index
+Remembers the earliest known message of each Outlook conversation so the
+original-vs-reply check can skip the Graph conversation query for known threads.
+"""
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from app.storage.state_db import connect_state_db
+
+
+class ConversationIndex:
+    """SQLite table of ``(mailbox, conversationId) -> earliest message``.
+
+    Rows learned from a Graph conversation query are marked *verified*: their
+    earliest message is the mailbox-wide first one. Rows learned only from
+    messages we happened to list (delta sync, ingested directories) are not,
+    since the thread may have started in another folder. Either kind proves
+    a later message is a reply; only verified rows prove a message is the original.
+    """
+
+    def __init__(self, db_path: str = None):
+        self.conn = connect_state_db(db_path)
+        self.lock = threading.Lock()
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                mailbox TEXT NOT NULL,
+                conversation_id TEXT NOT NULL,
+                earliest_message_id TEXT NOT NULL,
+                earliest_received TEXT NOT NULL,
+                verified INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT,
+                PRIMARY KEY (mailbox, conversation_id)
+            )
+        """)
+        self.conn.commit()
+
+    def is_first(self, mailbox: str, email_data: Dict) -> Optional[bool]:
+        """Decide locally whether a message starts its conversation.
+
+        Returns True/False when the index knows the answer, or None when the
+        Graph conversation query is still needed.
+        """
+        conversation_id = email_data.get('conversationId')
+        message_id = email_data.get('id')
+        received = email_data.get('receivedDateTime')
+        if not conversation_id or not message_id or not received:
+            return None
+        
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT earliest_message_id, earliest_received, verified FROM conversations "
+                "WHERE mailbox = ? AND conversation_id = ?",
+                (mailbox.lower(), conversation_id)
+            ).fetchone()
+        if not row:
+            return None
+        earliest_id, earliest_received, verified = row
+        if earliest_id != message_id and earliest_received < received:
+            return False  # an earlier message of this thread is already known
+        if earliest_id == message_id and verified:
+            return True
+        return None
+
+    def _upsert(self, mailbox: str, conversation_id: str, message_id: str, received: str, verified: bool) -> None:
+        row = self.conn.execute(
+            "SELECT earliest_received FROM conversations WHERE mailbox = ? AND conversation_id = ?",
+            (mailbox, conversation_id)
+        ).fetchone()
+        # Verified answers replace what we had; local sightings only ever move the start earlier
+        if row and not verified and row[0] <= received:
+            return
+        self.conn.execute(
+            "INSERT OR REPLACE INTO conversations "
+            "(mailbox, conversation_id, earliest_message_id, earliest_received, verified, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (mailbox, conversation_id, message_id, received, int(verified), datetime.now().isoformat())
+        )
+
+    def observe(self, mailbox: str, messages: Iterable[Dict]) -> None:
+        """Record messages seen while listing a folder (not verified)."""
+        with self.lock:
+            for msg in messages:
+                if msg.get('conversationId') and msg.get('id') and msg.get('receivedDateTime'):
+                    self._upsert(mailbox.lower(), msg['conversationId'], msg['id'], msg['receivedDateTime'], False)
+            self.conn.commit()
+
+    def record_conversation(self, mailbox: str, conversation_id: str, messages: Iterable[Dict]) -> None:
+        """Record the result of a Graph conversation query as the verified thread start."""
+        dated = [m for m in messages if m.get('id') and m.get('receivedDateTime')]
+        if not dated:
+            return
+        earliest = min(dated, key=lambda m: m['receivedDateTime'])
+        with self.lock:
+            self._upsert(mailbox.lower(), conversation_id, earliest['id'], earliest['receivedDateTime'], True)
+            self.conn.commit()
+
+    def backfill_from_directory(self, mailbox: str, data_dir: Path) -> int:
+        """Seed the index from ``email_metadata.json`` files of already-ingested emails."""
+        messages = []
+        for metadata_file in Path(data_dir).glob("**/email_metadata.json"):
+            try:
+                messages.append(json.loads(metadata_file.read_text(encoding='utf-8')))
+            except (OSError, ValueError) as e:
+                print(f"⚠️  Skipping unreadable {metadata_file}: {e}")
+        self.observe(mailbox, messages)
+        return len(messages)
@@ -0,0 +1,48 @@
+"""Persistent store for Microsoft Graph delta links, one per mailbox folder."""
+import threading
+from datetime import datetime
+from typing import Optional
+from app.storage.state_db import connect_state_db
+
+
+class DeltaLinkStore:
+    def __init__(self, db_path: str = None):
+        self.conn = connect_state_db(db_path)
+        self.lock = threading.Lock()
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS delta_links (
+                mailbox TEXT NOT NULL,
+                folder_id TEXT NOT NULL,
+                delta_link TEXT NOT NULL,
+                updated_at TEXT,
+                PRIMARY KEY (mailbox, folder_id)
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, mailbox: str, folder_id: str) -> Optional[str]:
+        """Return the saved deltaLink for a folder, or None if it has never been synced."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT delta_link FROM delta_links WHERE mailbox = ? AND folder_id = ?",
+                (mailbox.lower(), folder_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    def save(self, mailbox: str, folder_id: str, delta_link: str) -> None:
+        """Remember the deltaLink returned at the end of a completed sync round."""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO delta_links (mailbox, folder_id, delta_link, updated_at) VALUES (?, ?, ?, ?)",
+                (mailbox.lower(), folder_id, delta_link, datetime.now().isoformat())
+            )
+            self.conn.commit()
+
+    def clear(self, mailbox: str, folder_id: str) -> None:
+        """Forget a folder's deltaLink so the next sync starts from scratch."""
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM delta_links WHERE mailbox = ? AND folder_id = ?",
+                (mailbox.lower(), folder_id)
+            )
+            self.conn.commit()
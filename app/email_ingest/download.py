@@ -1,14 +1,33 @@
 """Iterates new messages in Outlook folder, uploads raw blobs to S3, inserts stub row in SQLite."""
 from datetime import datetime
+import requests
 from app.storage import s3, db
 from .graph_client import graph_get
+from .delta_state import DeltaLinkStore
 from app.settings import settings
 
 def run():
     print("pulling messages…")
-    # example only – implement delta query for production
-    url = f"https://graph.microsoft.com/v1.0/users/{settings.SHARED_MAILBOX}/mailFolders/{settings.MAILBOX_FOLDER}/messages?$top=10"
-    data = graph_get(url)
-    for msg in data.get("value", []):
-        db.add_stub(msg)       # implement in storage.db
-        s3.upload_raw(msg)     # implement in storage.s3
+    # Incremental: replay the saved deltaLink so only new/changed messages come back
+    store = DeltaLinkStore()
+    full_sync_url = f"{settings.GRAPH_ROOT}/users/{settings.SHARED_MAILBOX}/mailFolders/{settings.MAILBOX_FOLDER}/messages/delta"
+    url = store.get(settings.SHARED_MAILBOX, settings.MAILBOX_FOLDER) or full_sync_url
+    while url:
+        try:
+            data = graph_get(url)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 410:
+                raise
+            # Sync state expired or was reset on the server: start over
+            print("⚠️  Delta state expired, restarting full sync")
+            store.clear(settings.SHARED_MAILBOX, settings.MAILBOX_FOLDER)
+            url = full_sync_url
+            continue
+        for msg in data.get("value", []):
+            if "@removed" in msg:
+                continue
+            db.add_stub(msg)       # implement in storage.db
+            s3.upload_raw(msg)     # implement in storage.s3
+        url = data.get("@odata.nextLink")
+        if data.get("@odata.deltaLink"):
+            store.save(settings.SHARED_MAILBOX, settings.MAILBOX_FOLDER, data["@odata.deltaLink"])
@@ -4,88 +4,140 @@ Email Ingestion Processor
 Fetches emails with metadata and attachments, saves locally, and provides S3 upload capability.
 """
 import os
+import hashlib
 import json
-import requests
 import sys
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-from msal import ConfidentialClientApplication
+from typing import Dict, List, Optional, Tuple, Union
 from app.settings import settings
+from app.email_ingest.blob_store import get_blob_store
+from app.email_ingest.conversation_index import ConversationIndex
+from app.email_ingest.delta_state import DeltaLinkStore
+from app.email_ingest.folder_cache import get_folder_cache
+from app.email_ingest.graph_batch import GraphBatch, MAX_BATCH_SIZE
+from app.email_ingest.graph_transport import get_transport
+from app.email_ingest.ingest_ledger import FETCHED, MOVED, SAVED, IngestLedger
+from app.storage.email_layout import EmailLayout
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # bytes per streamed write
+
+MESSAGE_FIELDS = ("id,subject,hasAttachments,receivedDateTime,from,toRecipients,ccRecipients,"
+                  "bccRecipients,body,importance,isRead,conversationId,uniqueBody,parentFolderId")
+# Just enough to decide whether a message is an original inbound email
+LIST_FIELDS = "id,subject,hasAttachments,receivedDateTime,from,conversationId,parentFolderId"
+
+REPLY_PREFIXES = (
+    're:', 're :', 're-', 're -',
+    'fw:', 'fw :', 'fw-', 'fw -',
+    'fwd:', 'fwd :', 'fwd-', 'fwd -',
+    'reply:', 'reply :', 'reply-', 'reply -'
+)
+# Prefixes Graph can rule out server-side (startswith is case-insensitive there)
+SERVER_REPLY_PREFIXES = ("RE:", "FW:", "FWD:")
 
 class EmailProcessor:
-    def __init__(self):
-        self.graph_root = "https://graph.microsoft.com/v1.0"
-        self.headers = self._get_auth_headers()
-        self.data_dir = Path("data/emails")
-        self.data_dir.mkdir(parents=True, exist_ok=True)
-        
-    def _get_auth_headers(self) -> Dict[str, str]:
-        """Get authentication headers for Microsoft Graph API."""
-        app = ConfidentialClientApplication(
-            client_id=settings.GRAPH_CLIENT_ID,
-            client_credential=settings.GRAPH_CLIENT_SECRET,
-            authority=f"https://login.microsoftonline.com/{settings.GRAPH_TENANT_ID}"
-        )
+    def __init__(self, download_workers: int = None, server_filter: bool = None):
+        self.graph_root = settings.GRAPH_ROOT
+        self.transport = get_transport()
+        self.data_dir = Path(settings.EMAIL_DATA_DIR)
+        # Message-ID-keyed, sharded directories plus a manifest for listing
+        self.layout = EmailLayout(self.data_dir)
+        self.delta_store = DeltaLinkStore()
+        self.pending_delta = None  # (mailbox, folder_id, deltaLink) of a delta round not yet committed
+        self.folder_cache = get_folder_cache()
+        # Identical attachments are stored once and hardlinked into each email directory
+        self.blob_store = get_blob_store()
+        # Attachment downloads run on a bounded thread pool shared across messages
+        self.download_workers = max(1, download_workers or settings.DOWNLOAD_WORKERS)
+        # Persistent thread-start index; answers most reply checks without a Graph call
+        self.conversation_index = ConversationIndex()
+        # (mailbox, conversationId) -> conversation messages, filled by $batch prefetches
+        self._conversation_cache: Dict[Tuple[str, str], List[Dict]] = {}
+        # Per-message progress so an interrupted run resumes where it stopped
+        self.ledger = IngestLedger()
+        # Filter replies/internal senders in the Graph query and fetch bodies only for survivors
+        self.server_filter = settings.SERVER_SIDE_FILTER if server_filter is None else server_filter
+        self._filter_level = 0  # index into _server_filters(); advanced when Graph rejects one
         
-        token = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
-        if "access_token" not in token:
-            raise RuntimeError(f"❌ Couldn't obtain token: {token.get('error_description')}")
-            
-        return {
-            "Authorization": f"Bearer {token['access_token']}",
-            "Accept": "application/json"
-        }
-    
-    def get_folder_id(self, user: str, path_segments: List[str]) -> str:
-        """Walk a human path like ['Inbox','foo','bar'] and return folderId."""
-        # First segment may be special well-known folder; get its id quickly
-        seg0 = path_segments[0]
+    def get_folder_id(self, user: str, path_segments: List[str], _retried: bool = False) -> str:
+        """Walk a human path like ['Inbox','foo','bar'] and return folderId.
+
+        Resolved IDs (and those of every ancestor) are kept in the shared
+        folder cache, so repeat lookups make no Graph calls until the TTL
+        expires or the folder turns out to be gone.
+        """
+        cached = self.folder_cache.get(user, path_segments)
+        if cached:
+            return cached
         
-        # Try to get the folder as a well-known folder first
-        try:
-            resp = requests.get(f"{self.graph_root}/users/{user}/mailFolders/{seg0}", headers=self.headers)
-            if resp.status_code == 200:
-                folder = resp.json()
-            else:
-                # If it's not a well-known folder, try to find it as a subfolder
+        # Resume the walk from the deepest cached ancestor, if any
+        folder = None
+        start = 1
+        for depth in range(len(path_segments) - 1, 0, -1):
+            folder_id = self.folder_cache.get(user, path_segments[:depth])
+            if folder_id:
+                folder = {"id": folder_id}
+                start = depth
+                break
+        
+        if folder is None:
+            # First segment may be special well-known folder; get its id quickly
+            seg0 = path_segments[0]
+            
+            # Try to get the folder as a well-known folder first
+            try:
+                resp = self.transport.get(f"{self.graph_root}/users/{user}/mailFolders/{seg0}")
+                if resp.status_code == 200:
+                    folder = resp.json()
+                else:
+                    # If it's not a well-known folder, try to find it as a subfolder
+                    folder = self._find_subfolder_by_name(user, seg0)
+                    if not folder:
+                        raise RuntimeError(f"Cannot find folder {seg0}: {resp.text}")
+            except Exception as e:
+                # Try to find it as a subfolder
                 folder = self._find_subfolder_by_name(user, seg0)
                 if not folder:
-                    raise RuntimeError(f"Cannot find folder {seg0}: {resp.text}")
-        except Exception as e:
-            # Try to find it as a subfolder
-            folder = self._find_subfolder_by_name(user, seg0)
-            if not folder:
-                raise RuntimeError(f"Cannot find folder {seg0}: {str(e)}")
+                    raise RuntimeError(f"Cannot find folder {seg0}: {str(e)}")
+            self.folder_cache.put(user, path_segments[:1], folder["id"])
         
         # Walk through remaining path segments
-        for name in path_segments[1:]:
+        for depth in range(start, len(path_segments)):
+            name = path_segments[depth]
             escaped_name = name.replace("'", "''")
             q = (f"{self.graph_root}/users/{user}/mailFolders/{folder['id']}/childFolders"
                  f"?$filter=displayName eq '{escaped_name}'"
                  f"&$select=id,displayName")
-            resp = requests.get(q, headers=self.headers)
+            resp = self.transport.get(q)
+            if resp.status_code == 404 and not _retried:
+                # A cached ancestor no longer exists: forget it and resolve from the top
+                self.folder_cache.invalidate(user, path_segments[:depth])
+                return self.get_folder_id(user, path_segments, _retried=True)
             data = resp.json().get("value", [])
             if not data:
                 # create it and continue
                 body = {"displayName": name, "isHidden": False}
-                resp = requests.post(
+                resp = self.transport.post(
                     f"{self.graph_root}/users/{user}/mailFolders/{folder['id']}/childFolders",
-                    headers={**self.headers, "Content-Type": "application/json"},
+                    headers={"Content-Type": "application/json"},
                     data=json.dumps(body)
                 )
                 if resp.status_code not in (200, 201):
                     raise RuntimeError(f"Cannot create/find folder {name}: {resp.text}")
                 data = [resp.json()]
             folder = data[0]
+            self.folder_cache.put(user, path_segments[:depth + 1], folder["id"])
         return folder["id"]
     
     def _find_subfolder_by_name(self, user: str, folder_name: str) -> Optional[Dict]:
         """Find a subfolder by name by searching through all folders."""
         # Get all mail folders
         url = f"{self.graph_root}/users/{user}/mailFolders"
-        resp = requests.get(url, headers=self.headers)
+        resp = self.transport.get(url)
         if resp.status_code != 200:
             return None
         
@@ -100,42 +152,78 @@ class EmailProcessor:
     
     def is_original_inbound_email(self, email_data: Dict) -> bool:
         """Check if this is an original inbound email using robust conversation analysis."""
-        # Method 1: Check if this is the first message in a conversation
+        # Cheap header checks first: reply subjects and internal senders
+        if not self._passes_header_rules(email_data):
+            return False
+        
+        # Then check if this is the first message in a conversation
         conversation_id = email_data.get('conversationId')
         if conversation_id:
             # Get all messages in this conversation to see if this is the first
             if not self._is_first_in_conversation(email_data):
                 return False
         
-        # Method 2: Check subject line for reply indicators (backup method)
-        subject = email_data.get('subject', '').lower()
-        reply_indicators = [
-            're:', 're :', 're-', 're -',
-            'fw:', 'fw :', 'fw-', 'fw -',
-            'fwd:', 'fwd :', 'fwd-', 'fwd -',
-            'reply:', 'reply :', 'reply-', 'reply -'
-        ]
-        
-        for indicator in reply_indicators:
-            if subject.startswith(indicator):
-                return False
+        return True
+    
+    def _passes_header_rules(self, email_data: Dict) -> bool:
+        """Subject and sender checks that need no extra Graph calls."""
+        # Check subject line for reply indicators
+        subject = (email_data.get('subject') or '').lower()
+        if subject.startswith(REPLY_PREFIXES):
+            return False
         
-        # Method 3: Check sender - skip internal emails
-        from_info = email_data.get('from', {})
+        # Check sender - skip internal emails
+        from_info = email_data.get('from') or {}
         from_email = from_info.get('emailAddress', {}).get('address', '').lower()
         
         # Skip if it's from the same mailbox (internal emails)
         if from_email == self.current_mailbox.lower():
             return False
         
-        # Skip if it's from common internal domains
-        internal_domains = ['clarity-dx.com', 'yourcompany.com']  # Add your internal domains
-        for domain in internal_domains:
+        # Skip if it's from internal domains
+        for domain in settings.INTERNAL_EMAIL_DOMAINS:
             if domain in from_email:
                 return False
         
         return True
     
+    def _server_filters(self, user: str) -> List[str]:
+        """``$filter`` expressions for the header rules, most selective first.
+
+        Graph's support for ``not``/``endswith`` on messages varies, so a
+        rejected expression falls back to the next one, and finally to none.
+        The header rules are still applied locally either way.
+        """
+        quote = lambda value: value.replace("'", "''")
+        sender = f"from/emailAddress/address ne '{quote(user)}'"
+        subjects = [f"not startswith(subject,'{prefix}')" for prefix in SERVER_REPLY_PREFIXES]
+        domains = [f"not endswith(from/emailAddress/address,'@{quote(domain)}')"
+                   for domain in settings.INTERNAL_EMAIL_DOMAINS]
+        return [
+            " and ".join([sender] + subjects + domains),
+            " and ".join([sender] + subjects),
+            sender,
+        ]
+    
+    def _select_originals(self, user: str, page: List[Dict], original_only: bool, two_phase: bool) -> List[Dict]:
+        """Apply the original-inbound rules to a listed page.
+
+        In two-phase mode the page was listed with ``LIST_FIELDS`` only, and
+        full messages (bodies included) are fetched in $batch requests for
+        the messages that pass.
+        """
+        self.conversation_index.observe(user, page)
+        if original_only:
+            page = [m for m in page if self._passes_header_rules(m)]
+            self.prefetch_conversations(page)
+            page = [m for m in page if self.is_original_inbound_email(m)]
+        if two_phase:
+            missing = [m['id'] for m in page if 'body' not in m]
+            full = self.get_messages_batch(user, missing) if missing else {}
+            page = [full.get(m['id']) if m['id'] in full else m for m in page]
+            page = [m for m in page if m]  # deleted between listing and fetching
+        return page
+    
     def _is_first_in_conversation(self, email_data: Dict) -> bool:
         """Check if this email is the first message in its conversation."""
         conversation_id = email_data.get('conversationId')
@@ -145,19 +233,17 @@ class EmailProcessor:
         if not conversation_id or not message_id or not received_time:
             return True  # If we can't determine, assume it's original
         
+        known = self.conversation_index.is_first(self.current_mailbox, email_data)
+        if known is not None:
+            return known
+        
         try:
-            # Use a simpler query without ordering to avoid "InefficientFilter" error
-            url = (f"{self.graph_root}/users/{self.current_mailbox}/messages"
-                   f"?$filter=conversationId eq '{conversation_id}'"
-                   f"&$select=id,receivedDateTime,subject"
-                   f"&$top=10")  # Limit to first 10 messages in conversation
-            
-            resp = requests.get(url, headers=self.headers)
-            if resp.status_code != 200:
-                print(f"⚠️  Could not fetch conversation: {resp.text}")
+            conversation_messages, error = self._get_conversation_messages(conversation_id)
+            if error is not None:
+                print(f"⚠️  Could not fetch conversation: {error}")
                 return True  # Assume original if we can't check
             
-            conversation_messages = resp.json().get("value", [])
+            self.conversation_index.record_conversation(self.current_mailbox, conversation_id, conversation_messages)
             
             if not conversation_messages:
                 return True
@@ -181,6 +267,59 @@ class EmailProcessor:
             print(f"⚠️  Error checking conversation order: {e}")
             return True  # Assume original if we can't check
     
+    def _conversation_url(self, conversation_id: str) -> str:
+        """Build the query listing a conversation's messages."""
+        # Use a simpler query without ordering to avoid "InefficientFilter" error
+        return (f"{self.graph_root}/users/{self.current_mailbox}/messages"
+                f"?$filter=conversationId eq '{conversation_id}'"
+                f"&$select=id,receivedDateTime,subject,from"
+                f"&$top=10")  # Limit to first 10 messages in conversation
+    
+    def _get_conversation_messages(self, conversation_id: str) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        """Return ``(messages, error)`` for a conversation, preferring prefetched results."""
+        key = (self.current_mailbox, conversation_id)
+        if key in self._conversation_cache:
+            return self._conversation_cache[key], None
+        
+        resp = self.transport.get(self._conversation_url(conversation_id))
+        if resp.status_code != 200:
+            return None, resp.text
+        messages = resp.json().get("value", [])
+        self._conversation_cache[key] = messages
+        return messages, None
+    
+    def prefetch_conversations(self, messages: List[Dict]) -> None:
+        """Load the conversations of a page of messages with $batch requests.
+
+        Conversation checks and debug analysis for these messages are then
+        answered from memory instead of one GET per message.
+        """
+        batch = self._graph_batch()
+        requested = self._queue_conversations(messages, batch)
+        if requested:
+            self._store_conversations(requested, batch.execute())
+    
+    def _queue_conversations(self, messages: List[Dict], batch: GraphBatch) -> Dict[str, str]:
+        """Add a query to ``batch`` for each conversation not yet decided; returns request id -> conversation id."""
+        requested = {}
+        for msg in messages:
+            conversation_id = msg.get('conversationId')
+            if not conversation_id or (self.current_mailbox, conversation_id) in self._conversation_cache:
+                continue
+            if self.conversation_index.is_first(self.current_mailbox, msg) is not None:
+                continue  # already decided locally
+            if conversation_id in requested.values():
+                continue
+            requested[batch.add("GET", self._conversation_url(conversation_id))] = conversation_id
+        return requested
+    
+    def _store_conversations(self, requested: Dict[str, str], responses: Dict[str, Dict]) -> None:
+        for request_id, resp in responses.items():
+            # Failures are left uncached and retried individually when checked
+            if resp["status"] == 200 and request_id in requested:
+                key = (self.current_mailbox, requested[request_id])
+                self._conversation_cache[key] = resp["body"].get("value", [])
+    
     def get_conversation_analysis(self, email_data: Dict) -> Dict:
         """Get detailed analysis of a conversation for debugging."""
         conversation_id = email_data.get('conversationId')
@@ -190,20 +329,12 @@ class EmailProcessor:
             return {"error": "No conversation ID"}
         
         try:
-            # Use simpler query to avoid "InefficientFilter" error
-            url = (f"{self.graph_root}/users/{self.current_mailbox}/messages"
-                   f"?$filter=conversationId eq '{conversation_id}'"
-                   f"&$select=id,receivedDateTime,subject,from"
-                   f"&$top=10")  # Limit results
-            
-            resp = requests.get(url, headers=self.headers)
-            if resp.status_code != 200:
-                return {"error": f"API error: {resp.text}"}
-            
-            messages = resp.json().get("value", [])
+            messages, error = self._get_conversation_messages(conversation_id)
+            if error is not None:
+                return {"error": f"API error: {error}"}
             
             # Sort by received time manually
-            messages.sort(key=lambda x: x.get('receivedDateTime', '9999-12-31T23:59:59Z'))
+            messages = sorted(messages, key=lambda x: x.get('receivedDateTime', '9999-12-31T23:59:59Z'))
             
             analysis = {
                 "conversation_id": conversation_id,
@@ -231,34 +362,160 @@ class EmailProcessor:
         except Exception as e:
             return {"error": f"Exception: {str(e)}"}
     
-    def iter_messages(self, user: str, folder_id: str, page_size: int = 50, original_only: bool = True):
-        """Yield messages page-by-page, optionally filtering for original inbound emails."""
-        url = (f"{self.graph_root}/users/{user}/mailFolders/{folder_id}/messages"
-               f"?$select=id,subject,hasAttachments,receivedDateTime,from,toRecipients,ccRecipients,bccRecipients,body,importance,isRead,conversationId,uniqueBody&$top={page_size}")
+    def iter_messages(self, user: str, folder_id: str, page_size: int = 50, original_only: bool = True,
+                      delta: bool = False, server_filter: bool = None):
+        """Yield messages page-by-page, optionally filtering for original inbound emails.
+
+        With ``delta=True`` only messages created or changed since the last
+        completed delta sync of this folder are returned (see ``iter_message_changes``).
+
+        With ``server_filter`` (default ``self.server_filter``) and
+        ``original_only``, replies and internal senders are excluded in the
+        Graph query where Graph allows it, pages are listed with a minimal
+        ``$select``, and bodies are fetched only for messages that pass.
+        """
+        two_phase = original_only and (self.server_filter if server_filter is None else server_filter)
+        if delta:
+            yield from self.iter_message_changes(user, folder_id, page_size, original_only, two_phase)
+            return
         
         self.current_mailbox = user  # Store for filtering
         
+        def first_page_url():
+            url = (f"{self.graph_root}/users/{user}/mailFolders/{folder_id}/messages"
+                   f"?$select={LIST_FIELDS if two_phase else MESSAGE_FIELDS}&$top={page_size}")
+            filters = self._server_filters(user)
+            if two_phase and self._filter_level < len(filters):
+                url += f"&$filter={filters[self._filter_level]}"
+            return url
+        
+        url = first_page_url()
+        first_page = True
         while url:
-            resp = requests.get(url, headers=self.headers)
+            resp = self.transport.get(url)
+            if resp.status_code == 400 and first_page and "$filter=" in url:
+                # Graph rejected the filter expression: try a simpler one
+                self._filter_level += 1
+                print(f"⚠️  Graph rejected server-side filter, falling back (level {self._filter_level})")
+                url = first_page_url()
+                continue
+            if resp.status_code == 404:
+                # Folder deleted or recreated since its ID was cached
+                self.folder_cache.invalidate_id(user, folder_id)
             if resp.status_code != 200:
                 raise RuntimeError(f"Message fetch failed: {resp.text}")
+            first_page = False
             data = resp.json()
-            for m in data.get("value", []):
-                # Apply filtering if requested
-                if original_only and not self.is_original_inbound_email(m):
-                    continue
-                yield m
+            yield from self._select_originals(user, data.get("value", []), original_only, two_phase)
+            url = data.get("@odata.nextLink")
+    
+    def iter_message_changes(self, user: str, folder_id: str, page_size: int = 50, original_only: bool = True,
+                             two_phase: bool = False):
+        """Yield new or changed messages using the Graph ``messages/delta`` endpoint.
+
+        The first run pages through the whole folder; afterwards the saved
+        deltaLink is replayed so only changes since the last run come back.
+        The new deltaLink is only kept in ``pending_delta`` once the final
+        page has been consumed; ``process_emails`` stores it after every
+        message of the round is saved, so an interrupted or partly failed run
+        repeats the same round next time.
+        Delta queries cannot be filtered, but ``two_phase`` still lists with
+        ``LIST_FIELDS`` and fetches bodies only for messages that pass.
+        """
+        self.current_mailbox = user  # Store for filtering
+        self.pending_delta = None
+        select = LIST_FIELDS if two_phase else MESSAGE_FIELDS
+        
+        url = self.delta_store.get(user, folder_id)
+        if url:
+            print("🔁 Resuming delta sync from saved state")
+        else:
+            print("🆕 No delta state for this folder, starting a full sync")
+            url = f"{self.graph_root}/users/{user}/mailFolders/{folder_id}/messages/delta?$select={select}"
+        # Delta queries ignore $top; page size is requested through the Prefer header
+        headers = {"Prefer": f"odata.maxpagesize={page_size}"}
+        
+        while url:
+            resp = self.transport.get(url, headers=headers)
+            if resp.status_code == 410:
+                # Sync state expired or was reset on the server: start over
+                print("⚠️  Delta state expired, restarting full sync")
+                self.delta_store.clear(user, folder_id)
+                url = f"{self.graph_root}/users/{user}/mailFolders/{folder_id}/messages/delta?$select={select}"
+                continue
+            if resp.status_code == 404:
+                self.folder_cache.invalidate_id(user, folder_id)
+                self.delta_store.clear(user, folder_id)
+            if resp.status_code != 200:
+                raise RuntimeError(f"Delta message fetch failed: {resp.text}")
+            data = resp.json()
+            # Deleted or moved-out messages only carry an id and @removed
+            page = [m for m in data.get("value", []) if "@removed" not in m]
+            yield from self._select_originals(user, page, original_only, two_phase)
             url = data.get("@odata.nextLink")
+            delta_link = data.get("@odata.deltaLink")
+            if delta_link:
+                self.pending_delta = (user, folder_id, delta_link)
+    
+    def commit_delta(self, results: Dict) -> None:
+        """Store the deltaLink of a finished delta round unless some of its messages failed.
+
+        Keeping the previous link makes the next run list the failed
+        messages again; the ones already saved are skipped via the ledger.
+        """
+        if not self.pending_delta:
+            return
+        user, folder_id, delta_link = self.pending_delta
+        self.pending_delta = None
+        if results["failed_ids"]:
+            print(f"⚠️  {len(results['failed_ids'])} messages failed, keeping the previous delta state so they are retried")
+            return
+        self.delta_store.save(user, folder_id, delta_link)
+    
+    def get_messages_batch(self, user: str, msg_ids: List[str]) -> Dict[str, Optional[Dict]]:
+        """Fetch several messages by ID with $batch requests; IDs that no longer exist map to None."""
+        batch = self._graph_batch()
+        requested = {
+            batch.add("GET", f"{self.graph_root}/users/{user}/messages/{msg_id}?$select={MESSAGE_FIELDS}"): msg_id
+            for msg_id in msg_ids
+        }
+        messages = {msg_id: None for msg_id in msg_ids}
+        for request_id, resp in batch.execute().items():
+            if request_id not in requested:
+                continue
+            if resp["status"] == 200:
+                messages[requested[request_id]] = resp["body"]
+            elif resp["status"] != 404:
+                raise RuntimeError(f"Message fetch failed: {resp['body']}")
+        return messages
     
     def get_attachments(self, user: str, msg_id: str) -> List[Dict]:
         """Get all attachments for a message."""
         url = f"{self.graph_root}/users/{user}/messages/{msg_id}/attachments?$select=id,name,contentType,size"
-        resp = requests.get(url, headers=self.headers)
+        resp = self.transport.get(url)
         if resp.status_code != 200:
             print(f"⚠️  Failed to fetch attachments: {resp.text}")
             return []
         return resp.json().get("value", [])
     
+    def get_attachments_batch(self, user: str, msg_ids: List[str]) -> Dict[str, List[Dict]]:
+        """Get the attachment lists of several messages with $batch requests."""
+        batch = self._graph_batch()
+        requested = {
+            batch.add("GET", f"{self.graph_root}/users/{user}/messages/{msg_id}/attachments"
+                             f"?$select=id,name,contentType,size"): msg_id
+            for msg_id in msg_ids
+        }
+        attachments = {msg_id: [] for msg_id in msg_ids}
+        for request_id, resp in batch.execute().items():
+            if request_id not in requested:
+                continue
+            if resp["status"] != 200:
+                print(f"⚠️  Failed to fetch attachments: {resp['body']}")
+                continue
+            attachments[requested[request_id]] = resp["body"].get("value", [])
+        return attachments
+    
     def download_attachment(self, user: str, msg_id: str, attachment: Dict) -> Optional[bytes]:
         """Download a single attachment."""
         att_id = attachment["id"]
@@ -266,7 +523,7 @@ class EmailProcessor:
         
         # Always download using the $value endpoint for consistency
         url = f"{self.graph_root}/users/{user}/messages/{msg_id}/attachments/{att_id}/$value"
-        r = requests.get(url, headers=self.headers)
+        r = self.transport.get(url)
         if r.status_code != 200:
             print(f"⚠️  Cannot download {filename}: {r.text}")
             return None
@@ -274,22 +531,74 @@ class EmailProcessor:
         
         return bin_data
     
-    def save_email_data(self, email_data: Dict, attachments: List[Tuple[str, bytes]]) -> str:
-        """Save email metadata and attachments to local storage."""
-        # Create timestamp-based directory
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        email_id = email_data.get('id', 'unknown')
+    def download_attachment_to_file(self, user: str, msg_id: str, attachment: Dict, dest_path: Path) -> bool:
+        """Stream a single attachment straight to ``dest_path`` in fixed-size chunks.
+
+        Data goes to a ``.part`` file and is hashed on the way; once complete
+        it is handed to the blob store, which keeps one copy per distinct
+        content and links it at ``dest_path``. Memory use stays flat and a
+        half-written file never looks finished.
+        """
+        att_id = attachment["id"]
+        filename = attachment["name"]
         
-        # Better filename sanitization for Windows
-        subject = email_data.get('subject', 'no_subject')
-        # Remove or replace problematic characters
-        safe_subject = "".join(c for c in subject if c.isalnum() or c in (' ', '-', '_', '.'))
-        safe_subject = safe_subject.replace(' ', '_').replace('__', '_').strip('_')
-        safe_subject = safe_subject[:30]  # Limit length more aggressively
+        url = f"{self.graph_root}/users/{user}/messages/{msg_id}/attachments/{att_id}/$value"
+        part_path = dest_path.with_name(dest_path.name + ".part")
+        with self.transport.get(url, stream=True) as r:
+            if r.status_code != 200:
+                print(f"⚠️  Cannot download {filename}: {r.text}")
+                return False
+            digest = hashlib.sha256()
+            try:
+                with open(part_path, 'wb') as f:
+                    for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                        digest.update(chunk)
+            except Exception as e:
+                part_path.unlink(missing_ok=True)
+                print(f"⚠️  Cannot download {filename}: {e}")
+                return False
+        self.blob_store.add_file(part_path, dest_path, digest.hexdigest())
+        return True
+    
+    def create_email_dir(self, email_data: Dict) -> Path:
+        """Create the local directory an email and its attachments are saved into.
+
+        The directory is derived from the message ID (see ``EmailLayout``), so
+        the same message always maps to the same place.
+        """
+        email_dir = self.layout.path_for(email_data.get('id', 'unknown'))
+        (email_dir / "attachments").mkdir(parents=True, exist_ok=True)
+        return email_dir
+    
+    def reserve_attachment_path(self, email_dir: Path, filename: str, reserved: set) -> Path:
+        """Pick a sanitized, unused file path for an attachment and mark it as taken."""
+        # Sanitize attachment filename
+        safe_filename = "".join(c for c in filename if c.isalnum() or c in (' ', '-', '_', '.'))
+        safe_filename = safe_filename.replace(' ', '_')
         
-        # Create a shorter, safer directory name
-        email_dir = self.data_dir / f"{timestamp}_{email_id[:20]}_{safe_subject}"
-        email_dir.mkdir(parents=True, exist_ok=True)
+        file_path = email_dir / "attachments" / safe_filename
+        # Handle duplicate filenames
+        counter = 1
+        original_path = file_path
+        while file_path.exists() or file_path in reserved:
+            stem = original_path.stem
+            suffix = original_path.suffix
+            file_path = original_path.parent / f"{stem}_{counter}{suffix}"
+            counter += 1
+        reserved.add(file_path)
+        return file_path
+    
+    def save_email_data(self, email_data: Dict, attachments: List[Tuple[str, Union[bytes, Path]]],
+                        email_dir: Path = None) -> str:
+        """Save email metadata and attachments to local storage.
+
+        Each attachment is ``(filename, content)`` where content is either the
+        file's bytes or the ``Path`` it was already streamed to inside
+        ``email_dir`` (see ``download_attachment_to_file``).
+        """
+        email_id = email_data.get('id', 'unknown')
+        email_dir = email_dir or self.create_email_dir(email_data)
         
         # Save email metadata
         metadata_file = email_dir / "email_metadata.json"
@@ -301,25 +610,22 @@ class EmailProcessor:
         attachments_dir.mkdir(exist_ok=True)
         
         saved_attachments = []
+        attachment_hashes = {}
+        reserved = set()
         for filename, content in attachments:
-            if content:
-                # Sanitize attachment filename
-                safe_filename = "".join(c for c in filename if c.isalnum() or c in (' ', '-', '_', '.'))
-                safe_filename = safe_filename.replace(' ', '_')
-                
-                file_path = attachments_dir / safe_filename
-                # Handle duplicate filenames
-                counter = 1
-                original_path = file_path
-                while file_path.exists():
-                    stem = original_path.stem
-                    suffix = original_path.suffix
-                    file_path = original_path.parent / f"{stem}_{counter}{suffix}"
-                    counter += 1
-                
-                with open(file_path, 'wb') as f:
-                    f.write(content)
-                saved_attachments.append(str(file_path.relative_to(email_dir)))
+            if isinstance(content, Path):
+                # Already written in place by a streaming download
+                file_path = content
+                sha256 = self.blob_store.sha_for(file_path)
+            elif content:
+                file_path = self.reserve_attachment_path(email_dir, filename, reserved)
+                sha256 = self.blob_store.add_bytes(content, file_path)
+            else:
+                continue
+            relative = str(file_path.relative_to(email_dir))
+            saved_attachments.append(relative)
+            if sha256:
+                attachment_hashes[relative] = sha256
         
         # Create summary file
         summary = {
@@ -331,6 +637,7 @@ class EmailProcessor:
             "has_attachments": email_data.get('hasAttachments'),
             "attachments_count": len(attachments),
             "saved_attachments": saved_attachments,
+            "attachment_sha256": attachment_hashes,
             "processed_at": datetime.now().isoformat()
         }
         
@@ -338,19 +645,167 @@ class EmailProcessor:
         with open(summary_file, 'w', encoding='utf-8') as f:
             json.dump(summary, f, indent=2, default=str)
         
+        self.layout.register(email_dir, email_data)
         return str(email_dir)
     
     def move_message(self, user: str, msg_id: str, dest_folder_id: str) -> bool:
         """Move a message to a different folder."""
         url = f"{self.graph_root}/users/{user}/messages/{msg_id}/move"
         body = {"destinationId": dest_folder_id}
-        resp = requests.post(
+        resp = self.transport.post(
             url, 
-            headers={**self.headers, "Content-Type": "application/json"},
+            headers={"Content-Type": "application/json"},
             data=json.dumps(body)
         )
         return resp.status_code in (200, 201)
     
+    def move_messages_batch(self, user: str, msg_ids: List[str], dest_folder_id: str) -> Dict[str, bool]:
+        """Move several messages with $batch requests; returns success per message id."""
+        batch = self._graph_batch()
+        requested = {
+            batch.add("POST", f"{self.graph_root}/users/{user}/messages/{msg_id}/move",
+                      body={"destinationId": dest_folder_id}): msg_id
+            for msg_id in msg_ids
+        }
+        moved = {msg_id: False for msg_id in msg_ids}
+        for request_id, resp in batch.execute().items():
+            if request_id in requested:
+                moved[requested[request_id]] = resp["status"] in (200, 201)
+        return moved
+    
+    def _graph_batch(self) -> GraphBatch:
+        """Start a new $batch request on the shared transport."""
+        return GraphBatch(self.transport, self.graph_root)
+    
+    def _download_and_record(self, user: str, msg_id: str, attachment: Dict, dest_path: Path) -> bool:
+        """Download an attachment and note it in the ledger so a restart does not fetch it again."""
+        ok = self.download_attachment_to_file(user, msg_id, attachment, dest_path)
+        if ok:
+            self.ledger.record_attachment(user, msg_id, attachment["id"], dest_path)
+        return ok
+    
+    def _start_batch(self, mailbox: str, messages: List[Dict], pool: ThreadPoolExecutor,
+                     results: Dict) -> List[Tuple[Dict, Path, Optional[List]]]:
+        """List attachments for a batch of messages and queue their downloads on the pool.
+
+        Messages the ledger already has as saved come back with ``None``
+        downloads (they only still need moving); moved ones are dropped.
+        A message interrupted mid-download reuses its directory and only
+        fetches the attachments that are not on disk yet.
+        """
+        entries = self.ledger.get_many(mailbox, [m['id'] for m in messages])
+        to_list = self._needs_listing(messages, entries)
+        try:
+            attachments_by_msg = self.get_attachments_batch(mailbox, [m['id'] for m in to_list]) if to_list else {}
+        except Exception as e:
+            print(f"❌ Failed to list attachments for {len(to_list)} messages: {e}")
+            results["failed_messages"] += len(to_list)
+            results["failed_ids"].extend(m['id'] for m in to_list)
+            to_list, attachments_by_msg = [], {}
+        
+        started = []
+        for msg, email_dir, plan in self._plan_batch(mailbox, messages, entries, to_list, attachments_by_msg, results):
+            if plan is None:
+                started.append((msg, email_dir, None))
+                continue
+            downloads = []
+            for att, path, done in plan:
+                if done:
+                    future = Future()
+                    future.set_result(True)
+                else:
+                    future = pool.submit(self._download_and_record, mailbox, msg['id'], att, path)
+                downloads.append((att, path, future))
+            started.append((msg, email_dir, downloads))
+        return started
+    
+    @staticmethod
+    def _needs_listing(messages: List[Dict], entries: Dict[str, Dict]) -> List[Dict]:
+        """Messages whose attachments still have to be listed (new, or interrupted mid-download)."""
+        return [m for m in messages if entries.get(m['id'], {}).get("state") in (None, FETCHED)]
+    
+    def _plan_batch(self, mailbox: str, messages: List[Dict], entries: Dict[str, Dict], listed: List[Dict],
+                    attachments_by_msg: Dict[str, List[Dict]], results: Dict) -> List[Tuple[Dict, Path, Optional[List]]]:
+        """Decide, per message, its directory and which attachment downloads are still needed.
+
+        Returns ``(message, email_dir, [(attachment, path, already_downloaded)])``,
+        with ``None`` instead of the list for messages that were saved before.
+        Target paths are fixed up front, in listing order, so parallel
+        downloads can stream straight into their final files.
+        """
+        listed_ids = {m['id'] for m in listed}
+        planned = []
+        for msg in messages:
+            entry = entries.get(msg['id'])
+            if entry and entry["state"] in (SAVED, MOVED):
+                results["skipped_messages"] += 1
+                print(f"↩️  Already saved: {msg.get('subject', '(no subject)')[:60]} ({entry['email_dir']})")
+                if entry["state"] == SAVED:
+                    planned.append((msg, Path(entry["email_dir"]), None))
+                continue
+            if msg['id'] not in listed_ids:
+                continue
+            attachments = attachments_by_msg.get(msg['id'], [])
+            print(f"📎 Found {len(attachments)} attachments for: {msg.get('subject', '(no subject)')[:60]}")
+            if entry and entry["email_dir"] and Path(entry["email_dir"]).exists():
+                email_dir = Path(entry["email_dir"])
+                done = {att_id: path for att_id, path in self.ledger.attachments(mailbox, msg['id']).items()
+                        if path.exists()}
+                print(f"   ↩️  Resuming in {email_dir} ({len(done)} attachments already downloaded)")
+            else:
+                email_dir = self.create_email_dir(msg)
+                self.ledger.mark(mailbox, [msg['id']], FETCHED, email_dir, folder_id=msg.get('parentFolderId'))
+                done = {}
+            reserved = set(done.values())
+            plan = []
+            for att in attachments:
+                print(f"   - {att.get('name')} ({att.get('contentType')}, {att.get('size')} bytes)")
+                if att['id'] in done:
+                    plan.append((att, done[att['id']], True))
+                else:
+                    path = self.reserve_attachment_path(email_dir, att.get('name') or att['id'], reserved)
+                    plan.append((att, path, False))
+            planned.append((msg, email_dir, plan))
+        return planned
+    
+    def _finish_batch(self, mailbox: str, started: List[Tuple[Dict, Path, Optional[List]]],
+                      dest_id: Optional[str], move_processed: bool, results: Dict) -> None:
+        """Save each message of a batch in order once its downloads finish, then move them together."""
+        saved = []
+        for msg, email_dir, downloads in started:
+            if downloads is None:
+                saved.append(msg)  # saved by an earlier run, only the move is left
+                continue
+            try:
+                # Collect downloads in listing order so the summary stays deterministic
+                downloaded_attachments = []
+                for att, path, future in downloads:
+                    if future.result():
+                        downloaded_attachments.append((att.get('name'), path))
+                        results["total_attachments"] += 1
+                
+                # Save everything locally
+                saved_location = self.save_email_data(msg, downloaded_attachments, email_dir=email_dir)
+                self.ledger.mark(mailbox, [msg['id']], SAVED, email_dir)
+                results["saved_locations"].append(saved_location)
+                results["processed_messages"] += 1
+                saved.append(msg)
+                
+                print(f"✅ Saved to: {saved_location}")
+                
+            except Exception as e:
+                print(f"❌ Failed to process message: {e}")
+                results["failed_messages"] += 1
+                results["failed_ids"].append(msg['id'])
+        
+        # Move saved messages if requested
+        if move_processed and dest_id and saved:
+            moved = self.move_messages_batch(mailbox, [m['id'] for m in saved], dest_id)
+            self.ledger.mark(mailbox, [msg_id for msg_id, ok in moved.items() if ok], MOVED)
+            for msg in saved:
+                state = "✅ saved & moved" if moved.get(msg['id']) else "⚠️  saved, move failed"
+                print(f"{state}: {msg.get('subject','(no subject)')[:60]}")
+    
     def process_emails(self, 
                       mailbox: str = None, 
                       src_path: List[str] = None,
@@ -358,8 +813,23 @@ class EmailProcessor:
                       move_processed: bool = True,
                       max_emails: int = None,
                       original_only: bool = True,
-                      debug_conversations: bool = False) -> Dict:
-        """Main method to process emails from a folder."""
+                      debug_conversations: bool = False,
+                      delta_sync: bool = False,
+                      download_workers: int = None,
+                      server_filter: bool = None) -> Dict:
+        """Main method to process emails from a folder.
+
+        Set ``delta_sync`` to only fetch messages that are new or changed since
+        the previous delta run of the same mailbox folder. Set ``server_filter``
+        to filter replies in the Graph query and download bodies only for the
+        messages kept (see ``iter_messages``).
+        
+        Messages are handled in groups of up to 20: attachment listing and
+        moves for a group go out as single Graph $batch requests. Attachments
+        are streamed to disk by up to ``download_workers`` threads (default
+        ``settings.DOWNLOAD_WORKERS``), overlapping across messages; each
+        message is still saved in the order it was listed.
+        """
         mailbox = mailbox or settings.SHARED_MAILBOX
         src_path = src_path or [settings.MAILBOX_FOLDER]
         
@@ -374,93 +844,86 @@ class EmailProcessor:
             dest_id = self.get_folder_id(mailbox, src_path + [dest_folder])
             print(f"📁 Destination folder ID: {dest_id}")
         
-        processed = 0
         message_count = 0
-        skipped_count = 0
-        results = {
-            "total_messages": 0,
-            "processed_messages": 0,
-            "failed_messages": 0,
-            "skipped_messages": 0,
-            "total_attachments": 0,
-            "saved_locations": []
-        }
+        # Messages an earlier run left half done are not listed again in delta or notification mode
+        results = self.process_message_ids(mailbox, [], src_path=src_path, dest_folder=dest_folder,
+                                           move_processed=move_processed, original_only=original_only,
+                                           download_workers=download_workers, resume_unfinished=True)
         
-        for msg in self.iter_messages(mailbox, src_id, original_only=original_only):
-            if max_emails and message_count >= max_emails:
-                break
+        workers = max(1, download_workers or self.download_workers)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="attachment-download") as pool:
+            batch = []         # messages waiting for their attachment listing
+            pending = deque()  # started batches: [(message, email_dir, [(attachment, path, Future)])]
+        
+            for msg in self.iter_messages(mailbox, src_id, original_only=original_only, delta=delta_sync,
+                                          server_filter=server_filter):
+                if max_emails and message_count >= max_emails:
+                    break
                 
-            message_count += 1
-            results["total_messages"] += 1
+                message_count += 1
+                results["total_messages"] += 1
+                if not self.admit_message(msg, message_count, original_only, debug_conversations, results):
+                    continue
             
-            # Check if this is an original inbound email
-            if original_only and not self.is_original_inbound_email(msg):
-                skipped_count += 1
-                results["skipped_messages"] += 1
-                print(f"⏭️  Skipping reply/forward: {msg.get('subject', '(no subject)')[:60]}")
-                
-                # Show conversation analysis if debug is enabled
-                if debug_conversations:
-                    analysis = self.get_conversation_analysis(msg)
-                    if "error" not in analysis:
-                        print(f"   📊 Conversation: {analysis['total_messages']} messages, this is #{analysis['current_message_position']}")
-                        for m in analysis['messages'][:3]:  # Show first 3 messages
-                            marker = " 👈 CURRENT" if m['is_current'] else ""
-                            print(f"   {m['position']}. {m['subject'][:40]}... ({m['from']}){marker}")
-                        if analysis['total_messages'] > 3:
-                            print(f"   ... and {analysis['total_messages'] - 3} more messages")
-                    else:
-                        print(f"   ⚠️  Could not analyze conversation: {analysis['error']}")
-                continue
+                batch.append(msg)
+                if len(batch) >= MAX_BATCH_SIZE:
+                    pending.append(self._start_batch(mailbox, batch, pool, results))
+                    batch = []
+                    # Let the next batch download while the previous one is saved
+                    while len(pending) > 1:
+                        self._finish_batch(mailbox, pending.popleft(), dest_id, move_processed, results)
             
-            print(f"\n📧 Processing message {message_count}: {msg.get('subject', '(no subject)')}")
-            print(f"   Received: {msg.get('receivedDateTime')}")
-            print(f"   From: {msg.get('from', {}).get('emailAddress', {}).get('address', 'unknown')}")
-            print(f"   Has Attachments: {msg.get('hasAttachments')}")
+            if batch:
+                pending.append(self._start_batch(mailbox, batch, pool, results))
+            while pending:
+                self._finish_batch(mailbox, pending.popleft(), dest_id, move_processed, results)
+        
+        if delta_sync:
+            self.commit_delta(results)
+        
+        self.print_summary(results)
+        return results
+    
+    def admit_message(self, msg: Dict, message_number: int, original_only: bool, debug_conversations: bool,
+                      results: Dict) -> bool:
+        """Print a listed message before processing; False (counted as skipped) for replies/forwards."""
+        # Check if this is an original inbound email
+        if original_only and not self.is_original_inbound_email(msg):
+            results["skipped_messages"] += 1
+            print(f"⏭️  Skipping reply/forward: {msg.get('subject', '(no subject)')[:60]}")
             
             # Show conversation analysis if debug is enabled
             if debug_conversations:
                 analysis = self.get_conversation_analysis(msg)
                 if "error" not in analysis:
                     print(f"   📊 Conversation: {analysis['total_messages']} messages, this is #{analysis['current_message_position']}")
-                    if analysis['total_messages'] > 1:
-                        print(f"   ✅ Original message in conversation")
+                    for m in analysis['messages'][:3]:  # Show first 3 messages
+                        marker = " 👈 CURRENT" if m['is_current'] else ""
+                        print(f"   {m['position']}. {m['subject'][:40]}... ({m['from']}){marker}")
+                    if analysis['total_messages'] > 3:
+                        print(f"   ... and {analysis['total_messages'] - 3} more messages")
                 else:
                     print(f"   ⚠️  Could not analyze conversation: {analysis['error']}")
-            
-            try:
-                # Get attachments
-                attachments = self.get_attachments(mailbox, msg['id'])
-                print(f"📎 Found {len(attachments)} attachments:")
-                
-                # Download attachments
-                downloaded_attachments = []
-                for att in attachments:
-                    print(f"   - {att.get('name')} ({att.get('contentType')}, {att.get('size')} bytes)")
-                    content = self.download_attachment(mailbox, msg['id'], att)
-                    if content:
-                        downloaded_attachments.append((att.get('name'), content))
-                        results["total_attachments"] += 1
-                
-                # Save everything locally
-                saved_location = self.save_email_data(msg, downloaded_attachments)
-                results["saved_locations"].append(saved_location)
-                
-                print(f"✅ Saved to: {saved_location}")
-                
-                # Move message if requested
-                if move_processed and dest_id:
-                    moved = self.move_message(mailbox, msg['id'], dest_id)
-                    state = "✅ saved & moved" if moved else "⚠️  saved, move failed"
-                    print(f"{state}: {msg.get('subject','(no subject)')[:60]}")
-                
-                processed += 1
-                results["processed_messages"] += 1
-                
-            except Exception as e:
-                print(f"❌ Failed to process message: {e}")
-                results["failed_messages"] += 1
+            return False
+        
+        print(f"\n📧 Processing message {message_number}: {msg.get('subject', '(no subject)')}")
+        print(f"   Received: {msg.get('receivedDateTime')}")
+        print(f"   From: {msg.get('from', {}).get('emailAddress', {}).get('address', 'unknown')}")
+        print(f"   Has Attachments: {msg.get('hasAttachments')}")
         
+        # Show conversation analysis if debug is enabled
+        if debug_conversations:
+            analysis = self.get_conversation_analysis(msg)
+            if "error" not in analysis:
+                print(f"   📊 Conversation: {analysis['total_messages']} messages, this is #{analysis['current_message_position']}")
+                if analysis['total_messages'] > 1:
+                    print(f"   ✅ Original message in conversation")
+            else:
+                print(f"   ⚠️  Could not analyze conversation: {analysis['error']}")
+        return True
+    
+    def print_summary(self, results: Dict) -> None:
+        """Print the run summary and add the Graph request counters to ``results``."""
         print(f"\n📊 Summary:")
         print(f"- Total messages found: {results['total_messages']}")
         print(f"- Original inbound emails: {results['processed_messages']}")
@@ -469,6 +932,82 @@ class EmailProcessor:
         print(f"- Total attachments: {results['total_attachments']}")
         print(f"- Data saved to: {self.data_dir}")
         
+        graph_stats = self.transport.scheduler.stats()
+        results["graph_requests"] = graph_stats
+        print(f"- Graph requests: {graph_stats['requests']} "
+              f"(throttled {graph_stats['throttled']}, retried {graph_stats['retries']}, in flight {graph_stats['in_flight']})")
+    
+    def process_message_ids(self,
+                            mailbox: str,
+                            message_ids: List[str],
+                            src_path: List[str] = None,
+                            dest_folder: str = "archive_processed",
+                            move_processed: bool = True,
+                            original_only: bool = True,
+                            download_workers: int = None,
+                            resume_unfinished: bool = False) -> Dict:
+        """Fetch, save and move specific messages, e.g. ones announced by change notifications.
+
+        Uses the same download/save/move path as ``process_emails``. Messages
+        that were deleted or are no longer in the source folder (already
+        handled by another run) are skipped. IDs that failed are returned in
+        ``results["failed_ids"]``. With ``resume_unfinished``, messages of the
+        source folder that the ledger has as fetched or saved but not moved
+        are processed as well.
+        """
+        mailbox = mailbox or settings.SHARED_MAILBOX
+        src_path = src_path or [settings.MAILBOX_FOLDER]
+        src_id = self.get_folder_id(mailbox, src_path)
+        dest_id = self.get_folder_id(mailbox, src_path + [dest_folder]) if move_processed else None
+        self.current_mailbox = mailbox  # Store for filtering
+        
+        if resume_unfinished:
+            unfinished = [msg_id for msg_id in self.ledger.unfinished(mailbox, src_id) if msg_id not in message_ids]
+            if unfinished:
+                print(f"🔁 Resuming {len(unfinished)} message(s) left unfinished by an earlier run")
+                message_ids = list(message_ids) + unfinished
+        
+        results = {
+            "total_messages": len(message_ids),
+            "processed_messages": 0,
+            "failed_messages": 0,
+            "skipped_messages": 0,
+            "total_attachments": 0,
+            "saved_locations": [],
+            "failed_ids": []
+        }
+        
+        if not message_ids:
+            return results
+        
+        messages = []
+        for msg_id, msg in self.get_messages_batch(mailbox, message_ids).items():
+            if msg is None or msg.get("parentFolderId") != src_id:
+                results["skipped_messages"] += 1
+                print(f"⏭️  Skipping {msg_id[:20]}...: no longer in {'/'.join(src_path)}")
+                # Stop resuming it from this folder
+                self.ledger.set_folder(mailbox, [msg_id], msg.get("parentFolderId") if msg else None)
+                continue
+            messages.append(msg)
+        
+        self.conversation_index.observe(mailbox, messages)
+        if original_only:
+            self.prefetch_conversations(messages)
+            originals = []
+            for msg in messages:
+                if self.is_original_inbound_email(msg):
+                    originals.append(msg)
+                    continue
+                results["skipped_messages"] += 1
+                print(f"⏭️  Skipping reply/forward: {msg.get('subject', '(no subject)')[:60]}")
+            messages = originals
+        
+        workers = max(1, download_workers or self.download_workers)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="attachment-download") as pool:
+            for i in range(0, len(messages), MAX_BATCH_SIZE):
+                started = self._start_batch(mailbox, messages[i:i + MAX_BATCH_SIZE], pool, results)
+                self._finish_batch(mailbox, started, dest_id, move_processed, results)
+        
         return results
 
 def main():
@@ -0,0 +1,500 @@
+#!/usr/bin/env python
+"""
+Fake Microsoft Graph Server
+Local stand-in for the Graph mail endpoints used by ingestion (mailFolders,
+messages with paging and $filter, attachments/$value, move, delta, $batch,
+subscriptions) serving synthetic mailboxes, with optional latency and 429
+throttling. Used by the tests and by scripts/benchmark_email_ingestion.py;
+point ``GRAPH_ROOT`` at it and set ``GRAPH_STATIC_TOKEN`` to skip MSAL.
+"""
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlsplit
+
+WELL_KNOWN_FOLDERS = ("Inbox", "Archive", "SentItems", "DeletedItems")
+DEFAULT_PAGE_SIZE = 10
+MAX_BATCH_SIZE = 20
+
+# One clause of a $filter: "not startswith(subject,'RE:')", "from/emailAddress/address ne 'x'"
+FILTER_FUNCTION_RE = re.compile(r"^(not\s+)?(\w+)\(([\w/]+),\s*'((?:[^']|'')*)'\)$")
+FILTER_COMPARE_RE = re.compile(r"^([\w/]+)\s+(eq|ne)\s+'((?:[^']|'')*)'$")
+
+
+class GraphError(Exception):
+    def __init__(self, status: int, code: str, message: str = ""):
+        super().__init__(message or code)
+        self.status = status
+        self.body = {"error": {"code": code, "message": message or code}}
+
+
+def _field(item: Dict, path: str):
+    for part in path.split("/"):
+        item = item.get(part) if isinstance(item, dict) else None
+    return item
+
+
+def _graph_time(ts: datetime) -> str:
+    return ts.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class FakeGraphState:
+    """Synthetic mailboxes plus request counters, shared by every server thread.
+
+    Each mailbox gets ``messages`` emails in its Inbox: about ``reply_ratio``
+    of them are replies (``RE:``) in an earlier message's conversation and
+    ``internal_ratio`` come from ``internal_domain``. Every message carries
+    ``attachments`` deterministic PDF-like files of ``attachment_size`` bytes.
+    ``throttle_every=N`` answers every Nth request (or $batch sub-request)
+    with 429 and ``Retry-After: retry_after``; ``latency`` seconds are added
+    to every HTTP request.
+    """
+
+    def __init__(self, mailboxes=("intake@example.com",), messages: int = 100, attachments: int = 2,
+                 attachment_size: int = 50_000, reply_ratio: float = 0.3, internal_ratio: float = 0.1,
+                 internal_domain: str = "yourcompany.com", latency: float = 0.0, throttle_every: int = 0,
+                 retry_after: int = 1, token: str = None, unsupported_filters=("endswith",), seed: int = 0):
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.attachment_size = attachment_size
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.token = token
+        self.unsupported_filters = tuple(unsupported_filters)
+        self.internal_domain = internal_domain
+        self.folders: Dict[str, Dict[str, Dict]] = {}    # mailbox -> folder id -> folder
+        self.messages: Dict[str, Dict[str, Dict]] = {}   # mailbox -> message id -> message
+        self.removed: Dict[str, List[Tuple[int, str, str]]] = {}  # mailbox -> [(seq, folder id, message id)]
+        self.subscriptions: Dict[str, Dict] = {}
+        self.seq = 0
+        self.stats = {"http_requests": 0, "requests": 0, "batch_requests": 0, "throttled": 0, "bytes_sent": 0,
+                      "attachment_bytes": 0, "moves": 0}
+        self.started = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        for mailbox in mailboxes:
+            self.add_mailbox(mailbox)
+            self.add_messages(mailbox, messages, attachments, reply_ratio, internal_ratio)
+
+    def add_mailbox(self, mailbox: str) -> None:
+        mailbox = mailbox.lower()
+        with self.lock:
+            self.folders.setdefault(mailbox, {})
+            self.messages.setdefault(mailbox, {})
+            self.removed.setdefault(mailbox, [])
+            for name in WELL_KNOWN_FOLDERS:
+                folder_id = self._new_id("folder", mailbox, name)
+                self.folders[mailbox][folder_id] = {"id": folder_id, "displayName": name,
+                                                   "parentFolderId": None, "wellKnownName": name.lower()}
+
+    def add_messages(self, mailbox: str, count: int, attachments: int = 2, reply_ratio: float = 0.3,
+                     internal_ratio: float = 0.1, folder: str = "Inbox") -> List[str]:
+        """Deliver ``count`` new synthetic messages to a folder and return their IDs."""
+        mailbox = mailbox.lower()
+        with self.lock:
+            folder_id = self._resolve_folder(mailbox, folder)["id"]
+            box = self.messages[mailbox]
+            originals = [m for m in box.values() if not m["subject"].startswith("RE:")]
+            added = []
+            for _ in range(count):
+                index = len(box)
+                received = self.started + timedelta(minutes=index)
+                if originals and self.random.random() < reply_ratio:
+                    parent = self.random.choice(originals)
+                    subject, conversation_id = f"RE: {parent['subject']}", parent["conversationId"]
+                else:
+                    subject, conversation_id = f"Referral {index:06d}", self._new_id("conv", mailbox, index)
+                domain = self.internal_domain if self.random.random() < internal_ratio else "provider.example"
+                message_id = self._new_id("msg", mailbox, index)
+                sender = {"emailAddress": {"name": f"Sender {index}", "address": f"sender{index}@{domain}"}}
+                message = {
+                    "id": message_id,
+                    "subject": subject,
+                    "hasAttachments": attachments > 0,
+                    "receivedDateTime": _graph_time(received),
+                    "from": sender,
+                    "toRecipients": [{"emailAddress": {"name": "Intake", "address": mailbox}}],
+                    "ccRecipients": [],
+                    "bccRecipients": [],
+                    "body": {"contentType": "text", "content": f"Please see the attached referral {index}.\n" * 20},
+                    "uniqueBody": {"contentType": "text", "content": f"Please see the attached referral {index}."},
+                    "importance": "normal",
+                    "isRead": False,
+                    "conversationId": conversation_id,
+                    "parentFolderId": folder_id,
+                    "_seq": self._next_seq(),
+                    "_attachments": [
+                        {"id": f"att{n}", "name": f"referral_{index}_{n}.pdf", "contentType": "application/pdf",
+                         "size": self.attachment_size}
+                        for n in range(attachments)
+                    ],
+                }
+                box[message_id] = message
+                if not subject.startswith("RE:"):
+                    originals.append(message)
+                added.append(message_id)
+            return added
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return dict(self.stats)
+
+    def folder_counts(self, mailbox: str) -> Dict[str, int]:
+        """Message count per folder display name."""
+        mailbox = mailbox.lower()
+        with self.lock:
+            names = {f["id"]: f["displayName"] for f in self.folders[mailbox].values()}
+            counts = {name: 0 for name in names.values()}
+            for message in self.messages[mailbox].values():
+                counts[names[message["parentFolderId"]]] += 1
+            return counts
+
+    # -- helpers (called with the lock held) --
+
+    def _new_id(self, kind: str, *parts) -> str:
+        digest = hashlib.sha1("/".join(str(p) for p in (kind,) + parts).encode()).hexdigest()[:24]
+        return f"AAMk{kind.upper()}{digest}"
+
+    def _next_seq(self) -> int:
+        self.seq += 1
+        return self.seq
+
+    def _mailbox(self, user: str) -> str:
+        mailbox = unquote(user).lower()
+        if mailbox not in self.folders:
+            raise GraphError(404, "ErrorInvalidUser", f"The requested user '{user}' is invalid.")
+        return mailbox
+
+    def _resolve_folder(self, mailbox: str, folder: str) -> Dict:
+        folders = self.folders[mailbox]
+        folder = unquote(folder)
+        if folder in folders:
+            return folders[folder]
+        for f in folders.values():
+            if f.get("wellKnownName") == folder.lower():
+                return f
+        raise GraphError(404, "ErrorItemNotFound", "The specified folder could not be found in the store.")
+
+    def _message(self, mailbox: str, message_id: str) -> Dict:
+        message = self.messages[mailbox].get(unquote(message_id))
+        if not message:
+            raise GraphError(404, "ErrorItemNotFound", "The specified object was not found in the store.")
+        return message
+
+    def _throttled(self) -> bool:
+        """Count a request and decide whether to answer it with 429."""
+        self.stats["requests"] += 1
+        if self.throttle_every and self.stats["requests"] % self.throttle_every == 0:
+            self.stats["throttled"] += 1
+            return True
+        return False
+
+
+def _select(item: Dict, select: Optional[str]) -> Dict:
+    public = {k: v for k, v in item.items() if not k.startswith("_")}
+    if not select:
+        return public
+    fields = set(select.split(",")) | {"id"}
+    return {k: v for k, v in public.items() if k in fields}
+
+
+def _filter_predicate(expression: str, unsupported: Tuple[str, ...]):
+    """Compile the subset of OData ``$filter`` that ingestion sends (``and`` of simple clauses)."""
+    checks = []
+    for clause in re.split(r"\s+and\s+", expression.strip()):
+        clause = clause.strip()
+        match = FILTER_FUNCTION_RE.match(clause)
+        if match:
+            negate, function, path, value = match.groups()
+            value = value.replace("''", "'").lower()
+            if function in unsupported or function not in ("startswith", "endswith", "contains"):
+                raise GraphError(400, "ErrorInvalidUrlQueryFilter", f"The query filter '{clause}' is not supported.")
+            test = {"startswith": str.startswith, "endswith": str.endswith,
+                    "contains": lambda s, v: v in s}[function]
+            checks.append(lambda m, p=path, v=value, t=test, n=bool(negate): t(str(_field(m, p) or "").lower(), v) != n)
+            continue
+        match = FILTER_COMPARE_RE.match(clause)
+        if match:
+            path, op, value = match.groups()
+            value = value.replace("''", "'").lower()
+            checks.append(lambda m, p=path, v=value, eq=(op == "eq"): (str(_field(m, p) or "").lower() == v) == eq)
+            continue
+        raise GraphError(400, "BadRequest", f"Invalid filter clause: {clause}")
+    return lambda message: all(check(message) for check in checks)
+
+
+class FakeGraphRouter:
+    """Answers one Graph request (``method``, version-relative URL, JSON body) against a ``FakeGraphState``."""
+
+    def __init__(self, state: FakeGraphState, base_url: str):
+        self.state = state
+        self.base_url = base_url.rstrip("/")
+
+    def handle(self, method: str, url: str, body: Optional[Dict] = None,
+               headers: Dict[str, str] = None) -> Tuple[int, Dict[str, str], object]:
+        """Return ``(status, headers, body)``; ``body`` is a dict for JSON or bytes for ``$value``."""
+        state = self.state
+        with state.lock:
+            if state._throttled():
+                return 429, {"Retry-After": str(state.retry_after)}, {
+                    "error": {"code": "TooManyRequests", "message": "Application is over its MailboxConcurrency limit."}}
+            try:
+                status, body = self._route(method, url, body or {}, headers or {})
+            except GraphError as e:
+                return e.status, {}, e.body
+            if isinstance(body, bytes):
+                state.stats["attachment_bytes"] += len(body)
+            return status, {}, body
+
+    def _route(self, method: str, url: str, body: Dict, headers: Dict[str, str]):
+        parts = urlsplit(url)
+        path = parts.path.rstrip("/")
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        segments = [s for s in path.split("/") if s]
+        if segments and segments[0].lower() in ("v1.0", "beta"):
+            segments = segments[1:]
+
+        if segments[:1] == ["subscriptions"]:
+            return self._subscriptions(method, segments[1:], body)
+        if len(segments) < 3 or segments[0].lower() != "users":
+            raise GraphError(400, "BadRequest", f"Unsupported resource: {path}")
+        mailbox = self.state._mailbox(segments[1])
+        resource, rest = segments[2], segments[3:]
+
+        if resource == "mailFolders":
+            return self._mail_folders(method, mailbox, rest, query, body, headers)
+        if resource == "messages":
+            return self._messages(method, mailbox, rest, query, body)
+        raise GraphError(400, "BadRequest", f"Unsupported resource: {path}")
+
+    def _mail_folders(self, method, mailbox, rest, query, body, headers):
+        state = self.state
+        if not rest:
+            top_level = [f for f in state.folders[mailbox].values() if not f["parentFolderId"]]
+            return 200, {"value": [_select(f, query.get("$select")) for f in top_level]}
+        folder = state._resolve_folder(mailbox, re.sub(r"^\('?|'?\)$", "", rest[0]))
+        if len(rest) == 1:
+            return 200, _select(folder, query.get("$select"))
+        if rest[1] == "childFolders":
+            return self._child_folders(method, mailbox, folder, query, body)
+        if rest[1] == "messages" and len(rest) == 3 and rest[2] == "delta":
+            return self._delta(mailbox, folder, query, headers)
+        if rest[1] == "messages" and len(rest) == 2:
+            messages = [m for m in state.messages[mailbox].values() if m["parentFolderId"] == folder["id"]]
+            messages.sort(key=lambda m: m["receivedDateTime"], reverse=True)
+            return self._page(messages, query, f"/users/{mailbox}/mailFolders/{folder['id']}/messages")
+        raise GraphError(400, "BadRequest", f"Unsupported folder resource: {'/'.join(rest)}")
+
+    def _child_folders(self, method, mailbox, folder, query, body):
+        state = self.state
+        children = [f for f in state.folders[mailbox].values() if f["parentFolderId"] == folder["id"]]
+        if method == "POST":
+            name = body.get("displayName")
+            if not name:
+                raise GraphError(400, "ErrorInvalidRequest", "displayName is required")
+            if any(f["displayName"].lower() == name.lower() for f in children):
+                raise GraphError(409, "ErrorFolderExists", "A folder with the specified name already exists.")
+            folder_id = state._new_id("folder", mailbox, folder["id"], name)
+            child = {"id": folder_id, "displayName": name, "parentFolderId": folder["id"]}
+            state.folders[mailbox][folder_id] = child
+            return 201, dict(child)
+        if "$filter" in query:
+            children = [f for f in children if _filter_predicate(query["$filter"], ())(f)]
+        return 200, {"value": [_select(f, query.get("$select")) for f in children]}
+
+    def _page(self, items: List[Dict], query: Dict[str, str], path: str, page_size: int = None):
+        if "$filter" in query:
+            matches = _filter_predicate(query["$filter"], self.state.unsupported_filters)
+            items = [m for m in items if matches(m)]
+        skip = int(query.get("$skip", 0))
+        top = int(query.get("$top", page_size or DEFAULT_PAGE_SIZE))
+        page = items[skip:skip + top]
+        result = {"value": [_select(m, query.get("$select")) for m in page]}
+        if skip + top < len(items):
+            next_query = {**query, "$skip": str(skip + top), "$top": str(top)}
+            result["@odata.nextLink"] = f"{self.base_url}{path}?{urlencode(next_query, quote_via=quote, safe='$,/()')}"
+        return 200, result
+
+    def _delta(self, mailbox, folder, query, headers):
+        """Delta round: changes after the ``$deltatoken`` watermark, paged by a sequence cursor.
+
+        Like Graph's skip tokens the cursor is stable, so messages moved out
+        of the folder mid-round do not shift later pages; they come back as
+        ``@removed`` entries instead.
+        """
+        state = self.state
+        cursor = int(query.get("$skiptoken") or query.get("$deltatoken") or 0)
+        prefer = re.search(r"odata\.maxpagesize=(\d+)", headers.get("Prefer", "") or headers.get("prefer", ""))
+        page_size = int(prefer.group(1)) if prefer else DEFAULT_PAGE_SIZE
+
+        changes = [(m["_seq"], _select(m, query.get("$select"))) for m in state.messages[mailbox].values()
+                   if m["parentFolderId"] == folder["id"] and m["_seq"] > cursor]
+        changes += [(seq, {"id": message_id, "@removed": {"reason": "deleted"}})
+                    for seq, folder_id, message_id in state.removed[mailbox]
+                    if folder_id == folder["id"] and seq > cursor]
+        changes.sort(key=lambda change: change[0])
+        page = changes[:page_size]
+        base = f"{self.base_url}/users/{mailbox}/mailFolders/{folder['id']}/messages/delta"
+        select = f"$select={query['$select']}&" if "$select" in query else ""
+        result = {"value": [item for _, item in page]}
+        if len(changes) > page_size:
+            result["@odata.nextLink"] = f"{base}?{select}$skiptoken={page[-1][0]}"
+        else:
+            result["@odata.deltaLink"] = f"{base}?{select}$deltatoken={state.seq}"
+        return 200, result
+
+    def _messages(self, method, mailbox, rest, query, body):
+        state = self.state
+        if not rest:
+            # Mailbox-wide listing, used for conversation lookups
+            messages = sorted(state.messages[mailbox].values(), key=lambda m: m["receivedDateTime"])
+            return self._page(messages, query, f"/users/{mailbox}/messages")
+        message = state._message(mailbox, rest[0])
+        if len(rest) == 1:
+            return 200, _select(message, query.get("$select"))
+        if rest[1] == "move" and method == "POST":
+            destination = state._resolve_folder(mailbox, body.get("destinationId") or "")
+            if destination["id"] != message["parentFolderId"]:
+                state.removed[mailbox].append((state._next_seq(), message["parentFolderId"], message["id"]))
+                message["parentFolderId"] = destination["id"]
+                message["_seq"] = state._next_seq()
+            state.stats["moves"] += 1
+            return 201, _select(message, None)
+        if rest[1] == "attachments":
+            attachments = message["_attachments"]
+            if len(rest) == 2:
+                return 200, {"value": [_select(a, query.get("$select")) for a in attachments]}
+            attachment = next((a for a in attachments if a["id"] == unquote(rest[2])), None)
+            if not attachment:
+                raise GraphError(404, "ErrorItemNotFound", "The attachment was not found.")
+            if len(rest) == 4 and rest[3] == "$value":
+                return 200, self._attachment_bytes(message["id"], attachment)
+            return 200, _select(attachment, query.get("$select"))
+        raise GraphError(400, "BadRequest", f"Unsupported message resource: {'/'.join(rest)}")
+
+    @staticmethod
+    def _attachment_bytes(message_id: str, attachment: Dict) -> bytes:
+        seed = hashlib.sha256(f"{message_id}/{attachment['id']}".encode()).digest()
+        header = b"%PDF-1.4\n% fake graph attachment\n"
+        body_size = max(0, attachment["size"] - len(header))
+        return header + (seed * (body_size // len(seed) + 1))[:body_size]
+
+    def _subscriptions(self, method, rest, body):
+        subscriptions = self.state.subscriptions
+        if method == "POST" and not rest:
+            sub = {"id": str(uuid.uuid4()), **{k: body.get(k) for k in
+                   ("changeType", "notificationUrl", "resource", "expirationDateTime", "clientState")}}
+            subscriptions[sub["id"]] = sub
+            return 201, dict(sub)
+        sub = subscriptions.get(rest[0]) if rest else None
+        if not sub:
+            raise GraphError(404, "ResourceNotFound", "The object was not found.")
+        if method == "PATCH":
+            sub["expirationDateTime"] = body.get("expirationDateTime", sub["expirationDateTime"])
+            return 200, dict(sub)
+        if method == "DELETE":
+            del subscriptions[sub["id"]]
+            return 204, {}
+        return 200, dict(sub)
+
+    def handle_batch(self, body: Dict) -> Tuple[int, Dict]:
+        requests = body.get("requests") or []
+        if len(requests) > MAX_BATCH_SIZE:
+            return 400, {"error": {"code": "BadRequest", "message": "Too many requests in the batch."}}
+        with self.state.lock:
+            self.state.stats["batch_requests"] += 1
+        responses = []
+        for request in requests:
+            status, headers, result = self.handle(request.get("method", "GET"), request.get("url", ""),
+                                                  request.get("body"), request.get("headers"))
+            if isinstance(result, bytes):
+                result = base64.b64encode(result).decode("ascii")
+            responses.append({"id": request.get("id"), "status": status, "headers": headers, "body": result})
+        return 200, {"responses": responses}
+
+
+def make_handler(state: FakeGraphState):
+    class FakeGraphHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like Graph
+
+        def log_message(self, *args):
+            pass
+
+        def _dispatch(self, method: str):
+            if state.latency:
+                time.sleep(state.latency)
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            if state.token and self.headers.get("Authorization") != f"Bearer {state.token}":
+                return self._send(401, {}, {"error": {"code": "InvalidAuthenticationToken",
+                                                      "message": "Access token is empty or invalid."}})
+            try:
+                body = json.loads(raw) if raw else {}
+            except ValueError:
+                return self._send(400, {}, {"error": {"code": "BadRequest", "message": "Invalid JSON body."}})
+
+            router = FakeGraphRouter(state, f"http://{self.headers.get('Host')}/v1.0")
+            if urlsplit(self.path).path.rstrip("/").endswith("/$batch") and method == "POST":
+                status, result = router.handle_batch(body)
+                return self._send(status, {}, result)
+            status, headers, result = router.handle(method, self.path, body, dict(self.headers))
+            self._send(status, headers, result)
+
+        def _send(self, status: int, headers: Dict[str, str], result):
+            if isinstance(result, bytes):
+                data, content_type = result, "application/octet-stream"
+            elif status == 204:
+                data, content_type = b"", "application/json"
+            else:
+                data, content_type = json.dumps(result).encode("utf-8"), "application/json"
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+            with state.lock:
+                state.stats["http_requests"] += 1
+                state.stats["bytes_sent"] += len(data)
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def do_PATCH(self):
+            self._dispatch("PATCH")
+
+        def do_DELETE(self):
+            self._dispatch("DELETE")
+
+    return FakeGraphHandler
+
+
+class FakeGraphServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, state: FakeGraphState, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), make_handler(state))
+        self.state = state
+
+    @property
+    def graph_root(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1.0"
+
+
+def serve_in_background(state: FakeGraphState, host: str = "127.0.0.1", port: int = 0) -> FakeGraphServer:
+    """Start a fake Graph server on a daemon thread; ``server.graph_root`` is its base URL."""
+    server = FakeGraphServer(state, host, port)
+    threading.Thread(target=server.serve_forever, name="fake-graph", daemon=True).start()
+    return server
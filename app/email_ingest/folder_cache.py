@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Folder ID Cache
+Maps mailbox folder paths (e.g. ``Inbox/Intake``) to Graph folder IDs with a
+TTL, persisted in the ingestion state database and shared by every Graph client.
+"""
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+from app.settings import settings
+from app.storage.state_db import connect_state_db
+
+
+class FolderCache:
+    def __init__(self, ttl_seconds: int = None, db_path: str = None):
+        self.ttl_seconds = settings.FOLDER_CACHE_TTL if ttl_seconds is None else ttl_seconds
+        self.conn = connect_state_db(db_path)
+        self.lock = threading.Lock()
+        self._memory: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS folder_ids (
+                mailbox TEXT NOT NULL,
+                path TEXT NOT NULL,
+                folder_id TEXT NOT NULL,
+                cached_at REAL NOT NULL,
+                PRIMARY KEY (mailbox, path)
+            )
+        """)
+        self.conn.commit()
+
+    @staticmethod
+    def _key(mailbox: str, path: Union[str, List[str]]) -> Tuple[str, str]:
+        if not isinstance(path, str):
+            path = "/".join(path)
+        return mailbox.lower(), path.strip("/")
+
+    def get(self, mailbox: str, path: Union[str, List[str]]) -> Optional[str]:
+        """Return the cached folder ID for a path, or None if unknown or expired."""
+        key = self._key(mailbox, path)
+        now = time.time()
+        with self.lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                row = self.conn.execute(
+                    "SELECT folder_id, cached_at FROM folder_ids WHERE mailbox = ? AND path = ?", key
+                ).fetchone()
+                if row:
+                    entry = self._memory[key] = (row[0], row[1])
+            if entry is None:
+                return None
+            if now - entry[1] > self.ttl_seconds:
+                self._memory.pop(key, None)
+                return None
+            return entry[0]
+
+    def put(self, mailbox: str, path: Union[str, List[str]], folder_id: str) -> None:
+        key = self._key(mailbox, path)
+        now = time.time()
+        with self.lock:
+            self._memory[key] = (folder_id, now)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO folder_ids (mailbox, path, folder_id, cached_at) VALUES (?, ?, ?, ?)",
+                (*key, folder_id, now)
+            )
+            self.conn.commit()
+
+    def invalidate(self, mailbox: str, path: Union[str, List[str]]) -> None:
+        """Forget a path and everything below it."""
+        mailbox, path = self._key(mailbox, path)
+        with self.lock:
+            for key in [k for k in self._memory if k[0] == mailbox and (k[1] == path or k[1].startswith(path + "/"))]:
+                del self._memory[key]
+            self.conn.execute(
+                "DELETE FROM folder_ids WHERE mailbox = ? AND (path = ? OR path LIKE ? ESCAPE '\\')",
+                (mailbox, path, path.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "/%")
+            )
+            self.conn.commit()
+
+    def invalidate_id(self, mailbox: str, folder_id: str) -> None:
+        """Forget every path that resolved to a folder Graph no longer knows."""
+        paths = []
+        with self.lock:
+            for row in self.conn.execute(
+                "SELECT path FROM folder_ids WHERE mailbox = ? AND folder_id = ?", (mailbox.lower(), folder_id)
+            ):
+                paths.append(row[0])
+        for path in paths:
+            self.invalidate(mailbox, path)
+
+
+_folder_cache: Optional[FolderCache] = None
+_folder_cache_lock = threading.Lock()
+
+def get_folder_cache() -> FolderCache:
+    """Return the process-wide folder cache shared by EmailProcessor and OutlookIntegration."""
+    global _folder_cache
+    with _folder_cache_lock:
+        if _folder_cache is None:
+            _folder_cache = FolderCache()
+        return _folder_cache
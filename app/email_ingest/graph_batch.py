@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+Microsoft Graph JSON batching
+Packs up to 20 Graph requests into a single POST to the $batch endpoint.
+"""
+import asyncio
+import json
+import requests
+from typing import Dict, List, Optional
+from app.email_ingest.graph_scheduler import (
+    IDEMPOTENT_METHODS, backoff_delay, mailbox_from_url, parse_retry_after, should_retry
+)
+from app.email_ingest.graph_transport import GraphTransport
+
+MAX_BATCH_SIZE = 20  # Graph's hard limit per $batch request
+
+class GraphBatch:
+    """Collects Graph requests and sends them through ``/$batch`` in chunks of 20.
+
+    Requests are added with absolute or version-relative URLs and answered
+    by id, so callers can match each response back to the item it was for.
+    """
+
+    def __init__(self, transport: GraphTransport, graph_root: str):
+        self.transport = transport
+        self.graph_root = graph_root.rstrip("/")
+        self.requests: List[Dict] = []
+
+    def __len__(self) -> int:
+        return len(self.requests)
+
+    def add(self, method: str, url: str, body: Optional[Dict] = None, request_id: str = None) -> str:
+        """Queue a request and return the id its response will be filed under."""
+        request_id = request_id or str(len(self.requests) + 1)
+        if url.startswith(self.graph_root):
+            url = url[len(self.graph_root):]
+        url = requests.utils.requote_uri(url)  # e.g. spaces inside $filter expressions
+        request = {"id": request_id, "method": method.upper(), "url": url}
+        if body is not None:
+            request["body"] = body
+            request["headers"] = {"Content-Type": "application/json"}
+        self.requests.append(request)
+        return request_id
+
+    def execute(self) -> Dict[str, Dict]:
+        """Send all queued requests and return ``{id: {"status", "headers", "body"}}``.
+
+        Sub-requests answered with 429/503 (or 504, if they are safe to
+        repeat) are resent after the longest Retry-After among them, up to
+        the scheduler's retry limit.
+        """
+        mailbox = mailbox_from_url(self.requests[0]["url"]) if self.requests else "default"
+        responses: Dict[str, Dict] = {}
+        queue = self.requests
+        attempt = 0
+        while queue:
+            throttled = []
+            for start in range(0, len(queue), MAX_BATCH_SIZE):
+                chunk = queue[start:start + MAX_BATCH_SIZE]
+                chunk_responses = self._parse_chunk(chunk, self._post_chunk(chunk, mailbox))
+                responses.update(chunk_responses)
+                throttled.extend(r for r in chunk if self._retryable(r, chunk_responses[r["id"]]))
+            queue = self._requeue_throttled(throttled, responses, mailbox, attempt)
+            attempt += 1
+        
+        self.requests = []
+        return responses
+
+    async def execute_async(self) -> Dict[str, Dict]:
+        """``execute`` for an async transport (see ``AsyncGraphTransport``); chunks are sent concurrently."""
+        mailbox = mailbox_from_url(self.requests[0]["url"]) if self.requests else "default"
+        responses: Dict[str, Dict] = {}
+        queue = self.requests
+        attempt = 0
+        while queue:
+            chunks = [queue[start:start + MAX_BATCH_SIZE] for start in range(0, len(queue), MAX_BATCH_SIZE)]
+            sent = await asyncio.gather(*(self._post_chunk(chunk, mailbox) for chunk in chunks))
+            throttled = []
+            for chunk, resp in zip(chunks, sent):
+                chunk_responses = self._parse_chunk(chunk, resp)
+                responses.update(chunk_responses)
+                throttled.extend(r for r in chunk if self._retryable(r, chunk_responses[r["id"]]))
+            queue = self._requeue_throttled(throttled, responses, mailbox, attempt)
+            attempt += 1
+        
+        self.requests = []
+        return responses
+
+    @staticmethod
+    def _retryable(request: Dict, response: Dict) -> bool:
+        return should_retry(response["status"], request["method"] in IDEMPOTENT_METHODS)
+
+    def _requeue_throttled(self, throttled: List[Dict], responses: Dict[str, Dict],
+                           mailbox: str, attempt: int) -> List[Dict]:
+        """Pause the mailbox for the longest Retry-After and return the requests to resend."""
+        scheduler = self.transport.scheduler
+        if not throttled or attempt >= scheduler.max_retries:
+            return []
+        delays = [parse_retry_after(_header(responses[r["id"]]["headers"], "Retry-After")) for r in throttled]
+        delay = max((d for d in delays if d is not None), default=None)
+        if delay is None:
+            delay = backoff_delay(attempt, scheduler.base_delay, scheduler.max_delay)
+        scheduler.throttle(mailbox, delay)
+        return throttled
+
+    def _post_chunk(self, chunk: List[Dict], mailbox: str):
+        """POST one chunk; returns the response, or an awaitable of it for an async transport.
+
+        The envelope is only resent after a 504 or dropped connection when
+        every request in it is safe to repeat.
+        """
+        return self.transport.post(
+            f"{self.graph_root}/$batch",
+            headers={"Content-Type": "application/json"},
+            data=json.dumps({"requests": chunk}),
+            mailbox=mailbox,
+            cost=len(chunk),
+            idempotent=all(r["method"] in IDEMPOTENT_METHODS for r in chunk)
+        )
+
+    @staticmethod
+    def _parse_chunk(chunk: List[Dict], resp) -> Dict[str, Dict]:
+        if resp.status_code != 200:
+            # The whole envelope failed: report the same error for every request in it
+            return {r["id"]: {"status": resp.status_code, "headers": {}, "body": {"error": resp.text}} for r in chunk}
+        
+        responses = {r["id"]: {"status": None, "headers": {}, "body": {"error": "missing from $batch response"}}
+                     for r in chunk}
+        for item in resp.json().get("responses", []):
+            responses[item["id"]] = {
+                "status": item.get("status"),
+                "headers": item.get("headers", {}),
+                "body": item.get("body") or {}
+            }
+        return responses
+
+
+def _header(headers: Dict[str, str], name: str) -> Optional[str]:
+    """Case-insensitive lookup in a $batch sub-response's header dict."""
+    for key, value in headers.items():
+        if key.lower() == name.lower():
+            return value
+    return None
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+"""
+Graph Request Scheduler
+Paces Microsoft Graph calls per mailbox and retries throttled requests.
+
+Exchange Online throttles each app per mailbox (roughly 10,000 requests per
+10 minutes and 4 concurrent requests), so every mailbox gets its own token
+bucket and concurrency slots. 429/503/504 answers are retried after the
+server's Retry-After, or after a jittered exponential backoff when it sends none.
+A 504 or a dropped connection may come after the request was carried out, so
+those are only retried for requests that are safe to repeat (e.g. not a move).
+"""
+import asyncio
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Type
+
+RETRY_STATUSES = (429, 503, 504)
+# Answers after which the request may still have been carried out
+UNCERTAIN_STATUSES = (504,)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+def should_retry(status: int, idempotent: bool = True) -> bool:
+    """Whether an answer with this status is retried; uncertain ones only for idempotent requests."""
+    return status in RETRY_STATUSES and (idempotent or status not in UNCERTAIN_STATUSES)
+
+def mailbox_from_url(url: str) -> str:
+    """Return the mailbox a Graph URL addresses, used as the throttling key."""
+    match = re.search(r"/users/([^/?]+)", url)
+    return match.group(1).lower() if match else "default"
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``pause`` blocks the bucket until a deadline."""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, cost: float = 1.0) -> float:
+        """Take ``cost`` tokens and return 0 if they are available now, else return how long to wait."""
+        cost = min(cost, self.capacity)
+        with self.lock:
+            now = self.clock()
+            self._refill(now)
+            if now >= self.paused_until and self.tokens >= cost:
+                self.tokens -= cost
+                return 0.0
+            return max(self.paused_until - now, (cost - self.tokens) / self.rate)
+
+    def acquire(self, cost: float = 1.0) -> None:
+        """Block until ``cost`` tokens are available, then take them."""
+        while True:
+            wait = self.reserve(cost)
+            if not wait:
+                return
+            self.sleep(wait)
+
+    async def acquire_async(self, cost: float = 1.0) -> None:
+        """Like ``acquire``, but waits on the event loop instead of blocking the thread."""
+        while True:
+            wait = self.reserve(cost)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller of this bucket for ``seconds`` (e.g. after a 429)."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+
+
+class GraphScheduler:
+    """Runs Graph requests through per-mailbox rate limits with throttling-aware retries."""
+
+    def __init__(self, rate_per_second: float = None, burst: float = None, max_concurrency: int = None,
+                 max_retries: int = None, base_delay: float = 1.0, max_delay: float = 60.0,
+                 retry_exceptions: Tuple[Type[BaseException], ...] = (),
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        from app.settings import settings
+        self.rate_per_second = rate_per_second or settings.GRAPH_RATE_PER_SECOND
+        self.burst = burst or settings.GRAPH_BURST
+        self.max_concurrency = max_concurrency or settings.GRAPH_MAX_CONCURRENCY
+        self.max_retries = settings.GRAPH_MAX_RETRIES if max_retries is None else max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_exceptions = retry_exceptions
+        self.clock = clock
+        self.sleep = sleep
+        
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._async_slots: Dict[Tuple[int, str], asyncio.Semaphore] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._counters = {"requests": 0, "throttled": 0, "retries": 0, "failures": 0}
+        self._lock = threading.Lock()
+
+    def _limits(self, mailbox: str) -> Tuple[TokenBucket, threading.BoundedSemaphore]:
+        with self._lock:
+            if mailbox not in self._buckets:
+                self._buckets[mailbox] = TokenBucket(self.rate_per_second, self.burst, self.clock, self.sleep)
+                self._slots[mailbox] = threading.BoundedSemaphore(self.max_concurrency)
+                self._in_flight[mailbox] = 0
+            return self._buckets[mailbox], self._slots[mailbox]
+
+    def _async_limits(self, mailbox: str) -> Tuple[TokenBucket, asyncio.Semaphore]:
+        bucket, _ = self._limits(mailbox)
+        # Semaphores belong to one event loop, so each loop gets its own slots
+        key = (id(asyncio.get_running_loop()), mailbox)
+        with self._lock:
+            if key not in self._async_slots:
+                self._async_slots[key] = asyncio.Semaphore(self.max_concurrency)
+            return bucket, self._async_slots[key]
+
+    def _count(self, key: str, mailbox: str = None, in_flight_delta: int = 0) -> None:
+        with self._lock:
+            if key:
+                self._counters[key] += 1
+            if mailbox and in_flight_delta:
+                self._in_flight[mailbox] += in_flight_delta
+
+    @property
+    def in_flight(self) -> int:
+        """Number of Graph requests currently on the wire, across all mailboxes."""
+        with self._lock:
+            return sum(self._in_flight.values())
+
+    def stats(self) -> Dict:
+        """Counters plus in-flight requests per mailbox, for run summaries."""
+        with self._lock:
+            return {
+                **self._counters,
+                "in_flight": sum(self._in_flight.values()),
+                "in_flight_by_mailbox": {k: v for k, v in self._in_flight.items() if v}
+            }
+
+    def throttle(self, mailbox: str, seconds: float) -> None:
+        """Hold back all requests to a mailbox, e.g. when a $batch sub-request was throttled."""
+        bucket, _ = self._limits(mailbox)
+        bucket.pause(seconds)
+        self._count("throttled")
+
+    def send(self, mailbox: str, send: Callable[[], object], cost: float = 1.0, idempotent: bool = True):
+        """Call ``send()`` under the mailbox's limits, retrying throttled answers.
+
+        ``send`` must return an object with ``status_code`` and ``headers``
+        (a ``requests.Response``). The last response is returned once it
+        succeeds or retries run out; exceptions listed in ``retry_exceptions``
+        are retried the same way and re-raised after the final attempt.
+        For requests that are not ``idempotent``, 504s and those exceptions
+        are returned or raised straight away.
+        """
+        bucket, slots = self._limits(mailbox)
+        attempt = 0
+        while True:
+            bucket.acquire(cost)
+            with slots:
+                self._count("requests", mailbox, +1)
+                try:
+                    resp = send()
+                except self.retry_exceptions:
+                    if attempt >= self.max_retries or not idempotent:
+                        self._count("failures")
+                        raise
+                    resp = None
+                finally:
+                    self._count(None, mailbox, -1)
+            
+            if resp is not None and not should_retry(resp.status_code, idempotent):
+                return resp
+            if attempt >= self.max_retries:
+                self._count("failures")
+                return resp
+            
+            delay = self._retry_delay(resp, attempt)
+            if resp is not None and hasattr(resp, "close"):
+                resp.close()
+            # Throttling applies to the whole mailbox, so hold back every caller for it
+            bucket.pause(delay)
+            attempt += 1
+
+    async def send_async(self, mailbox: str, send: Callable[[], Awaitable], cost: float = 1.0,
+                         retry_exceptions: Tuple[Type[BaseException], ...] = None, idempotent: bool = True):
+        """Async counterpart of ``send`` for a coroutine ``send`` (e.g. an ``httpx.AsyncClient`` call).
+
+        Shares the mailbox's token bucket and counters with threaded callers;
+        concurrency slots are asyncio semaphores, so waiting never blocks the loop.
+        ``retry_exceptions`` overrides the scheduler's own for this client.
+        """
+        if retry_exceptions is None:
+            retry_exceptions = self.retry_exceptions
+        bucket, slots = self._async_limits(mailbox)
+        attempt = 0
+        while True:
+            await bucket.acquire_async(cost)
+            async with slots:
+                self._count("requests", mailbox, +1)
+                try:
+                    resp = await send()
+                except retry_exceptions:
+                    if attempt >= self.max_retries or not idempotent:
+                        self._count("failures")
+                        raise
+                    resp = None
+                finally:
+                    self._count(None, mailbox, -1)
+            
+            if resp is not None and not should_retry(resp.status_code, idempotent):
+                return resp
+            if attempt >= self.max_retries:
+                self._count("failures")
+                return resp
+            
+            delay = self._retry_delay(resp, attempt)
+            if resp is not None and hasattr(resp, "aclose"):
+                await resp.aclose()
+            bucket.pause(delay)
+            attempt += 1
+
+    def _retry_delay(self, resp, attempt: int) -> float:
+        """Count a retry and return the back-off: the server's Retry-After, else jittered exponential."""
+        delay = None
+        if resp is not None:
+            self._count("throttled")
+            delay = parse_retry_after(resp.headers.get("Retry-After"))
+        if delay is None:
+            delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+        self._count("retries")
+        return delay
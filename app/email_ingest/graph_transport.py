@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Shared Microsoft Graph Transport
+One pooled keep-alive HTTP session and one cached app token for every Graph client.
+"""
+import threading
+import time
+import requests
+from typing import Dict, Optional
+from requests.adapters import HTTPAdapter
+from msal import ConfidentialClientApplication
+from app.settings import settings
+from app.email_ingest.graph_scheduler import IDEMPOTENT_METHODS, GraphScheduler, mailbox_from_url
+
+GRAPH_SCOPE = ["https://graph.microsoft.com/.default"]
+TOKEN_REFRESH_MARGIN = 300  # seconds before expiry at which the token is renewed
+DEFAULT_TIMEOUT = 60        # seconds, applied when a caller does not pass one
+
+class GraphTransport:
+    """Authenticated, connection-pooled access to Microsoft Graph.
+
+    Requests reuse TLS connections through a single ``requests.Session`` and
+    share one MSAL client whose token is refreshed shortly before it expires
+    instead of being fetched for every call. Every request is paced and
+    retried by the transport's ``GraphScheduler``.
+    """
+
+    def __init__(self, pool_size: int = None):
+        pool_size = pool_size or settings.GRAPH_POOL_SIZE
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        
+        self._app: Optional[ConfidentialClientApplication] = None
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+        
+        self.scheduler = GraphScheduler(retry_exceptions=(requests.ConnectionError, requests.Timeout))
+
+    def _client_app(self) -> ConfidentialClientApplication:
+        if self._app is None:
+            self._app = ConfidentialClientApplication(
+                client_id=settings.GRAPH_CLIENT_ID,
+                client_credential=settings.GRAPH_CLIENT_SECRET,
+                authority=f"https://login.microsoftonline.com/{settings.GRAPH_TENANT_ID}"
+            )
+        return self._app
+
+    def cached_token(self) -> Optional[str]:
+        """The current token if it is not close to expiry, else None; never contacts MSAL."""
+        if settings.GRAPH_STATIC_TOKEN:
+            return settings.GRAPH_STATIC_TOKEN
+        token, expires_at = self._token, self._token_expires_at
+        if token and time.time() < expires_at - TOKEN_REFRESH_MARGIN:
+            return token
+        return None
+    
+    def get_token(self, force_refresh: bool = False) -> str:
+        """Return a valid access token, renewing it when close to expiry."""
+        if settings.GRAPH_STATIC_TOKEN:
+            return settings.GRAPH_STATIC_TOKEN
+        with self._token_lock:
+            token = None if force_refresh else self.cached_token()
+            if token:
+                return token
+            
+            token = self._client_app().acquire_token_for_client(scopes=GRAPH_SCOPE)
+            if "access_token" not in token:
+                raise RuntimeError(f"❌ Couldn't obtain token: {token.get('error_description')}")
+            
+            self._token = token["access_token"]
+            self._token_expires_at = time.time() + int(token.get("expires_in", 3600))
+            return self._token
+
+    def auth_headers(self) -> Dict[str, str]:
+        """Headers carrying the current bearer token."""
+        return {
+            "Authorization": f"Bearer {self.get_token()}",
+            "Accept": "application/json"
+        }
+
+    def request(self, method: str, url: str, headers: Dict[str, str] = None, mailbox: str = None,
+                cost: float = 1.0, idempotent: bool = None, **kwargs) -> requests.Response:
+        """Send an authenticated request through the scheduler.
+
+        ``mailbox`` overrides the throttling key otherwise taken from the URL;
+        ``cost`` is the number of Graph requests this call counts as (a $batch
+        counts each sub-request). ``idempotent`` (default: by HTTP method)
+        allows retries after a 504 or a dropped connection. A 401 triggers
+        one retry with a fresh token.
+        """
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        mailbox = (mailbox or mailbox_from_url(url)).lower()
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        
+        def send():
+            return self.session.request(method, url, headers={**self.auth_headers(), **(headers or {})}, **kwargs)
+        
+        resp = self.scheduler.send(mailbox, send, cost, idempotent)
+        if resp.status_code == 401:
+            resp.close()
+            self.get_token(force_refresh=True)
+            resp = self.scheduler.send(mailbox, send, cost, idempotent)
+        return resp
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+
+_transport: Optional[GraphTransport] = None
+_transport_lock = threading.Lock()
+
+def get_transport() -> GraphTransport:
+    """Return the process-wide transport shared by all Graph clients."""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = GraphTransport()
+        return _transport
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""
+Ingestion Ledger
+Durable per-message progress (fetched -> saved -> moved) and the attachments
+already on disk, so an interrupted run resumes instead of starting over.
+Each message also records the folder it was listed from, so messages left
+unfinished can be picked up by ID even when Graph does not list them again.
+"""
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from app.storage.state_db import connect_state_db
+
+FETCHED = "fetched"  # directory allocated, attachments downloading
+SAVED = "saved"      # metadata, summary and attachments written
+MOVED = "moved"      # moved to the archive folder in the mailbox
+STATES = (FETCHED, SAVED, MOVED)
+UNFINISHED = (FETCHED, SAVED)
+
+
+class IngestLedger:
+    def __init__(self, db_path: str = None):
+        self.conn = connect_state_db(db_path)
+        self.lock = threading.Lock()
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS ingest_ledger (
+                mailbox TEXT NOT NULL,
+                message_id TEXT NOT NULL,
+                state TEXT NOT NULL,
+                email_dir TEXT,
+                updated_at TEXT,
+                folder_id TEXT,
+                PRIMARY KEY (mailbox, message_id)
+            );
+            CREATE TABLE IF NOT EXISTS ingest_attachments (
+                mailbox TEXT NOT NULL,
+                message_id TEXT NOT NULL,
+                attachment_id TEXT NOT NULL,
+                path TEXT NOT NULL,
+                PRIMARY KEY (mailbox, message_id, attachment_id)
+            );
+        """)
+        columns = {r[1] for r in self.conn.execute("PRAGMA table_info(ingest_ledger)")}
+        if "folder_id" not in columns:
+            # Ledgers written before folders were tracked
+            self.conn.execute("ALTER TABLE ingest_ledger ADD COLUMN folder_id TEXT")
+        self.conn.commit()
+
+    def get(self, mailbox: str, message_id: str) -> Optional[Dict]:
+        """Return ``{"state", "email_dir"}`` for a message, or None if it was never seen."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT state, email_dir FROM ingest_ledger WHERE mailbox = ? AND message_id = ?",
+                (mailbox.lower(), message_id)
+            ).fetchone()
+        return {"state": row[0], "email_dir": row[1]} if row else None
+
+    def get_many(self, mailbox: str, message_ids: List[str]) -> Dict[str, Dict]:
+        """Ledger entries for several messages in one query; unseen IDs are left out."""
+        if not message_ids:
+            return {}
+        placeholders = ",".join("?" * len(message_ids))
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT message_id, state, email_dir FROM ingest_ledger "
+                f"WHERE mailbox = ? AND message_id IN ({placeholders})",
+                (mailbox.lower(), *message_ids)
+            ).fetchall()
+        return {r[0]: {"state": r[1], "email_dir": r[2]} for r in rows}
+
+    def mark(self, mailbox: str, message_ids: List[str], state: str, email_dir: Path = None,
+             folder_id: str = None) -> None:
+        """Advance messages to ``state``; ``email_dir`` and ``folder_id`` are kept from earlier marks when omitted."""
+        if state not in STATES:
+            raise ValueError(f"Unknown ledger state: {state}")
+        now = datetime.now().isoformat()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO ingest_ledger (mailbox, message_id, state, email_dir, updated_at, folder_id) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (mailbox, message_id) DO UPDATE SET state = excluded.state, "
+                "email_dir = COALESCE(excluded.email_dir, ingest_ledger.email_dir), updated_at = excluded.updated_at, "
+                "folder_id = COALESCE(excluded.folder_id, ingest_ledger.folder_id)",
+                [(mailbox.lower(), message_id, state, str(email_dir) if email_dir else None, now, folder_id)
+                 for message_id in message_ids]
+            )
+            self.conn.commit()
+
+    def set_folder(self, mailbox: str, message_ids: List[str], folder_id: Optional[str]) -> None:
+        """Record where known messages are now (None once deleted); unknown IDs are ignored."""
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE ingest_ledger SET folder_id = ? WHERE mailbox = ? AND message_id = ?",
+                [(folder_id, mailbox.lower(), message_id) for message_id in message_ids]
+            )
+            self.conn.commit()
+
+    def unfinished(self, mailbox: str, folder_id: str) -> List[str]:
+        """IDs of messages from a folder that were fetched or saved but never moved, oldest first."""
+        placeholders = ",".join("?" * len(UNFINISHED))
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT message_id FROM ingest_ledger WHERE mailbox = ? AND folder_id = ? "
+                f"AND state IN ({placeholders}) ORDER BY updated_at",
+                (mailbox.lower(), folder_id, *UNFINISHED)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def record_attachment(self, mailbox: str, message_id: str, attachment_id: str, path: Path) -> None:
+        """Remember that an attachment is fully on disk at ``path``."""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ingest_attachments (mailbox, message_id, attachment_id, path) VALUES (?, ?, ?, ?)",
+                (mailbox.lower(), message_id, attachment_id, str(path))
+            )
+            self.conn.commit()
+
+    def attachments(self, mailbox: str, message_id: str) -> Dict[str, Path]:
+        """Attachment ID -> path for the attachments of a message that finished downloading."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT attachment_id, path FROM ingest_attachments WHERE mailbox = ? AND message_id = ?",
+                (mailbox.lower(), message_id)
+            ).fetchall()
+        return {r[0]: Path(r[1]) for r in rows}
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT state, COUNT(*) FROM ingest_ledger GROUP BY state"
+            ).fetchall()
+        return dict(rows)
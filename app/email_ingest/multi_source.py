@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+Multi-Source Email Ingestion
+Runs EmailProcessor over several (mailbox, folder) sources concurrently and
+merges their results into one run summary.
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from app.settings import settings
+from app.storage.state_db import connect_state_db
+from app.email_ingest.email_processor import EmailProcessor
+from app.email_ingest.graph_transport import get_transport
+
+Source = Tuple[str, List[str]]
+
+COUNTERS = ("total_messages", "processed_messages", "failed_messages", "skipped_messages", "total_attachments")
+
+def parse_sources(spec: str) -> List[Source]:
+    """Parse ``"box1@x.com:Inbox/Intake;box2@x.com:Referrals"`` into (mailbox, path segments).
+
+    A source without a folder uses ``settings.MAILBOX_FOLDER``.
+    """
+    sources = []
+    for item in (spec or "").replace(",", ";").split(";"):
+        item = item.strip()
+        if not item:
+            continue
+        mailbox, _, folder = item.partition(":")
+        folder = folder.strip() or settings.MAILBOX_FOLDER
+        sources.append((mailbox.strip(), [seg for seg in folder.split("/") if seg]))
+    return sources
+
+
+class SourceCheckpointStore:
+    """Last run outcome per source, kept next to the delta links in the state database."""
+
+    def __init__(self, db_path: str = None):
+        self.conn = connect_state_db(db_path)
+        self.lock = threading.Lock()
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS source_checkpoints (
+                mailbox TEXT NOT NULL,
+                folder TEXT NOT NULL,
+                status TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                results TEXT,
+                PRIMARY KEY (mailbox, folder)
+            )
+        """)
+        self.conn.commit()
+
+    def save(self, mailbox: str, folder: str, status: str, started_at: str, results: Dict) -> None:
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO source_checkpoints (mailbox, folder, status, started_at, finished_at, results) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (mailbox.lower(), folder, status, started_at, datetime.now().isoformat(), json.dumps(results, default=str))
+            )
+            self.conn.commit()
+
+    def get(self, mailbox: str, folder: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status, started_at, finished_at, results FROM source_checkpoints WHERE mailbox = ? AND folder = ?",
+                (mailbox.lower(), folder)
+            ).fetchone()
+        if not row:
+            return None
+        return {"status": row[0], "started_at": row[1], "finished_at": row[2], "results": json.loads(row[3] or "{}")}
+
+
+class MultiSourceIngestor:
+    """Ingest several mailbox folders at once.
+
+    Each source runs on its own thread with its own ``EmailProcessor`` and an
+    equal share of the attachment download workers. Graph pacing is per
+    mailbox (see ``GraphScheduler``), so a throttled or slow mailbox only
+    slows its own source. Sources beyond ``max_parallel`` wait their turn
+    in the order given.
+    """
+
+    def __init__(self, sources: List[Source], max_parallel: int = None, download_workers: int = None):
+        if not sources:
+            raise ValueError("At least one (mailbox, folder) source is required")
+        self.sources = sources
+        self.max_parallel = max(1, min(len(sources), max_parallel or len(sources)))
+        total_workers = download_workers or settings.DOWNLOAD_WORKERS * self.max_parallel
+        self.workers_per_source = max(1, total_workers // self.max_parallel)
+        self.checkpoints = SourceCheckpointStore()
+
+    def _run_source(self, mailbox: str, src_path: List[str], process_kwargs: Dict) -> Dict:
+        folder = "/".join(src_path)
+        started_at = datetime.now().isoformat()
+        start = time.monotonic()
+        try:
+            processor = EmailProcessor(download_workers=self.workers_per_source)
+            results = processor.process_emails(mailbox=mailbox, src_path=src_path, **process_kwargs)
+            results.pop("graph_requests", None)  # shared transport: reported once for the whole run
+            status = "completed"
+        except Exception as e:
+            print(f"❌ Source {mailbox}/{folder} failed: {e}")
+            results = {"error": str(e)}
+            status = "failed"
+        self.checkpoints.save(mailbox, folder, status, started_at, results)
+        return {
+            "mailbox": mailbox,
+            "folder": folder,
+            "status": status,
+            "duration_seconds": round(time.monotonic() - start, 2),
+            "results": results
+        }
+
+    def run(self, **process_kwargs) -> Dict:
+        """Process every source and return the merged summary.
+
+        Keyword arguments are passed to ``EmailProcessor.process_emails``
+        for each source (``max_emails`` applies per source).
+        """
+        print(f"📬 Ingesting {len(self.sources)} sources, {self.max_parallel} at a time, "
+              f"{self.workers_per_source} download workers each")
+        summary = {counter: 0 for counter in COUNTERS}
+        summary.update({"sources": [], "saved_locations": [], "failed_sources": 0})
+        
+        with ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix="ingest-source") as pool:
+            futures = [pool.submit(self._run_source, mailbox, path, process_kwargs) for mailbox, path in self.sources]
+            for future in as_completed(futures):
+                source = future.result()
+                summary["sources"].append(source)
+                if source["status"] != "completed":
+                    summary["failed_sources"] += 1
+                    continue
+                for counter in COUNTERS:
+                    summary[counter] += source["results"].get(counter, 0)
+                summary["saved_locations"].extend(source["results"].get("saved_locations", []))
+        
+        # Report sources in the order they were given, not completion order
+        order = {(m.lower(), "/".join(p)): i for i, (m, p) in enumerate(self.sources)}
+        summary["sources"].sort(key=lambda s: order.get((s["mailbox"].lower(), s["folder"]), 0))
+        summary["graph_requests"] = get_transport().scheduler.stats()
+        
+        print(f"\n📊 Multi-source summary:")
+        for source in summary["sources"]:
+            results = source["results"]
+            if source["status"] == "completed":
+                print(f"- {source['mailbox']}/{source['folder']}: {results.get('processed_messages', 0)} processed, "
+                      f"{results.get('failed_messages', 0)} failed, {source['duration_seconds']}s")
+            else:
+                print(f"- {source['mailbox']}/{source['folder']}: ❌ {results.get('error')}")
+        print(f"- Total processed: {summary['processed_messages']} emails, {summary['total_attachments']} attachments")
+        
+        return summary
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+"""
+Graph Change Notifications
+Subscriptions for new messages in intake folders, a persistent work queue of
+notified message IDs, and the worker that drains it through EmailProcessor.
+"""
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from app.settings import settings
+from app.storage.state_db import connect_state_db
+
+MAX_ATTEMPTS = 5
+
+
+class NotificationQueue:
+    """Message IDs waiting to be fetched, kept in the ingestion state database.
+
+    A message is queued once per mailbox; repeated notifications for it are
+    ignored. Rows move ``pending`` -> ``processing`` -> ``done``, or back to
+    ``pending`` on failure until ``max_attempts`` is reached (``failed``).
+    """
+
+    def __init__(self, db_path: str = None, max_attempts: int = MAX_ATTEMPTS):
+        self.conn = connect_state_db(db_path)
+        self.lock = threading.Lock()
+        self.max_attempts = max_attempts
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS notification_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                mailbox TEXT NOT NULL,
+                folder TEXT NOT NULL DEFAULT '',
+                message_id TEXT NOT NULL,
+                change_type TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                received_at TEXT,
+                updated_at TEXT,
+                UNIQUE (mailbox, message_id)
+            )
+        """)
+        self.conn.commit()
+
+    def enqueue(self, mailbox: str, message_id: str, folder: str = "", change_type: str = "created") -> bool:
+        """Queue a message for ingestion. Returns False if it was already queued."""
+        now = datetime.now().isoformat()
+        with self.lock:
+            cur = self.conn.execute(
+                "INSERT OR IGNORE INTO notification_queue (mailbox, folder, message_id, change_type, received_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (mailbox.lower(), folder, message_id, change_type, now, now)
+            )
+            self.conn.commit()
+        return cur.rowcount > 0
+
+    def claim(self, limit: int = 100) -> List[Dict]:
+        """Mark up to ``limit`` pending rows as processing and return them, oldest first."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, mailbox, folder, message_id, attempts FROM notification_queue "
+                "WHERE status = 'pending' ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE notification_queue SET status = 'processing', updated_at = ? WHERE id = ?",
+                [(datetime.now().isoformat(), row[0]) for row in rows]
+            )
+            self.conn.commit()
+        return [{"id": r[0], "mailbox": r[1], "folder": r[2], "message_id": r[3], "attempts": r[4]} for r in rows]
+
+    def complete(self, row_ids: List[int]) -> None:
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE notification_queue SET status = 'done', last_error = NULL, updated_at = ? WHERE id = ?",
+                [(datetime.now().isoformat(), row_id) for row_id in row_ids]
+            )
+            self.conn.commit()
+
+    def fail(self, row_ids: List[int], error: str) -> None:
+        """Record a failed attempt; rows are retried until they run out of attempts."""
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE notification_queue SET attempts = attempts + 1, last_error = ?, updated_at = ?, "
+                "status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END WHERE id = ?",
+                [(error, datetime.now().isoformat(), self.max_attempts, row_id) for row_id in row_ids]
+            )
+            self.conn.commit()
+
+    def requeue_stale(self) -> int:
+        """Put rows left in ``processing`` by a crashed worker back in the queue."""
+        with self.lock:
+            cur = self.conn.execute(
+                "UPDATE notification_queue SET status = 'pending' WHERE status = 'processing'"
+            )
+            self.conn.commit()
+        return cur.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT status, COUNT(*) FROM notification_queue GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+
+class GraphSubscriptions:
+    """Create and renew Graph change-notification subscriptions on intake folders.
+
+    Subscription IDs are remembered with the mailbox and folder they watch,
+    so the webhook receiver can tell which source a notification belongs to.
+    """
+
+    def __init__(self, transport=None, graph_root: str = None, db_path: str = None):
+        self.transport = transport
+        self.graph_root = graph_root or settings.GRAPH_ROOT
+        self.conn = connect_state_db(db_path)
+        self.lock = threading.Lock()
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS graph_subscriptions (
+                subscription_id TEXT PRIMARY KEY,
+                mailbox TEXT NOT NULL,
+                folder TEXT NOT NULL,
+                resource TEXT NOT NULL,
+                expires_at TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def _transport(self):
+        if self.transport is None:
+            from app.email_ingest.graph_transport import get_transport
+            self.transport = get_transport()
+        return self.transport
+
+    @staticmethod
+    def _expiry(minutes: int) -> str:
+        expires = datetime.now(timezone.utc) + timedelta(minutes=minutes)
+        return expires.strftime("%Y-%m-%dT%H:%M:%S.0000000Z")
+
+    def create(self, mailbox: str, folder: str, folder_id: str, notification_url: str,
+               client_state: str = None, minutes: int = None) -> Dict:
+        """Subscribe to messages created in a folder. Graph validates ``notification_url`` before replying."""
+        minutes = minutes or settings.GRAPH_SUBSCRIPTION_MINUTES
+        resource = f"users/{mailbox}/mailFolders('{folder_id}')/messages"
+        body = {
+            "changeType": "created",
+            "notificationUrl": notification_url,
+            "resource": resource,
+            "expirationDateTime": self._expiry(minutes),
+            "clientState": client_state if client_state is not None else settings.GRAPH_WEBHOOK_CLIENT_STATE
+        }
+        resp = self._transport().post(f"{self.graph_root}/subscriptions", json=body, mailbox=mailbox)
+        if resp.status_code != 201:
+            raise RuntimeError(f"Subscription failed: {resp.text}")
+        sub = resp.json()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO graph_subscriptions (subscription_id, mailbox, folder, resource, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (sub["id"], mailbox.lower(), folder, resource, sub["expirationDateTime"])
+            )
+            self.conn.commit()
+        return sub
+
+    def renew(self, subscription_id: str, minutes: int = None) -> bool:
+        """Extend a subscription. Returns False (and forgets it) if Graph no longer knows it."""
+        expires_at = self._expiry(minutes or settings.GRAPH_SUBSCRIPTION_MINUTES)
+        resp = self._transport().request("PATCH", f"{self.graph_root}/subscriptions/{subscription_id}",
+                                         json={"expirationDateTime": expires_at})
+        if resp.status_code == 404:
+            self.forget(subscription_id)
+            return False
+        if resp.status_code != 200:
+            raise RuntimeError(f"Subscription renewal failed: {resp.text}")
+        with self.lock:
+            self.conn.execute(
+                "UPDATE graph_subscriptions SET expires_at = ? WHERE subscription_id = ?",
+                (expires_at, subscription_id)
+            )
+            self.conn.commit()
+        return True
+
+    def renew_expiring(self, within_minutes: int = 60) -> int:
+        """Renew every known subscription that expires within ``within_minutes``."""
+        cutoff = self._expiry(within_minutes)
+        with self.lock:
+            ids = [r[0] for r in self.conn.execute(
+                "SELECT subscription_id FROM graph_subscriptions WHERE expires_at < ?", (cutoff,)
+            ).fetchall()]
+        return sum(1 for sub_id in ids if self.renew(sub_id))
+
+    def renew_in_background(self, interval: float = 300.0, within_minutes: int = 60) -> threading.Event:
+        """Run ``renew_expiring`` every ``interval`` seconds on a daemon thread.
+
+        The timer does not depend on the notification worker, so a steady
+        stream of messages can't delay renewal. Set the returned event to stop it.
+        """
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    renewed = self.renew_expiring(within_minutes)
+                    if renewed:
+                        print(f"🔔 Renewed {renewed} subscription(s)")
+                except Exception as e:
+                    print(f"❌ Subscription renewal failed: {e}")
+
+        threading.Thread(target=loop, name="graph-subscription-renewal", daemon=True).start()
+        return stop
+
+    def delete(self, subscription_id: str) -> None:
+        resp = self._transport().request("DELETE", f"{self.graph_root}/subscriptions/{subscription_id}")
+        if resp.status_code not in (204, 404):
+            raise RuntimeError(f"Subscription delete failed: {resp.text}")
+        self.forget(subscription_id)
+
+    def forget(self, subscription_id: str) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM graph_subscriptions WHERE subscription_id = ?", (subscription_id,))
+            self.conn.commit()
+
+    def lookup(self, subscription_id: str) -> Optional[Tuple[str, str]]:
+        """Return ``(mailbox, folder)`` for a known subscription."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT mailbox, folder FROM graph_subscriptions WHERE subscription_id = ?", (subscription_id,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def ids_for(self, mailbox: str) -> List[str]:
+        """Known subscription IDs for a mailbox, most recently expiring first."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT subscription_id FROM graph_subscriptions WHERE mailbox = ? ORDER BY expires_at DESC",
+                (mailbox.lower(),)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+
+class NotificationWorker:
+    """Drain the notification queue through ``EmailProcessor.process_message_ids``."""
+
+    def __init__(self, processor, queue: NotificationQueue = None, batch_size: int = 100):
+        self.processor = processor
+        self.queue = queue or NotificationQueue()
+        self.batch_size = batch_size
+
+    def run_once(self, **process_kwargs) -> Dict[str, int]:
+        """Process one batch of queued messages. Keyword arguments go to ``process_message_ids``."""
+        rows = self.queue.claim(self.batch_size)
+        totals = {"claimed": len(rows), "processed_messages": 0, "failed_messages": 0, "skipped_messages": 0}
+
+        groups = defaultdict(list)
+        for row in rows:
+            groups[(row["mailbox"], row["folder"])].append(row)
+
+        for (mailbox, folder), group in groups.items():
+            src_path = [seg for seg in folder.split("/") if seg] or None
+            try:
+                # Also picks up messages a crashed or failed batch left half done
+                results = self.processor.process_message_ids(
+                    mailbox, [row["message_id"] for row in group], src_path=src_path, resume_unfinished=True,
+                    **process_kwargs
+                )
+            except Exception as e:
+                print(f"❌ Notification batch for {mailbox} failed: {e}")
+                self.queue.fail([row["id"] for row in group], str(e))
+                totals["failed_messages"] += len(group)
+                continue
+            failed = set(results.get("failed_ids", []))
+            self.queue.complete([row["id"] for row in group if row["message_id"] not in failed])
+            if failed:
+                self.queue.fail([row["id"] for row in group if row["message_id"] in failed], "processing failed")
+            for key in ("processed_messages", "failed_messages", "skipped_messages"):
+                totals[key] += results.get(key, 0)
+        return totals
+
+    def run_forever(self, wake: threading.Event = None, poll_interval: float = 30.0, **process_kwargs):
+        """Process the queue whenever ``wake`` is set, or every ``poll_interval`` seconds."""
+        wake = wake or threading.Event()
+        requeued = self.queue.requeue_stale()
+        if requeued:
+            print(f"🔁 Re-queued {requeued} notifications left over from a previous run")
+        while True:
+            totals = self.run_once(**process_kwargs)
+            if totals["claimed"]:
+                print(f"📨 Notifications: {totals['processed_messages']} saved, "
+                      f"{totals['skipped_messages']} skipped, {totals['failed_messages']} failed")
+            if totals["claimed"] >= self.batch_size:
+                continue  # more may be waiting
+            wake.wait(poll_interval)
+            wake.clear()
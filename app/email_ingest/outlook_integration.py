@@ -3,41 +3,19 @@
 Outlook Integration for Email Thread Linking
 Provides robust conversation search and folder-aware URL generation.
 """
-import requests
 import logging
 from typing import Dict, Optional, Tuple
 from app.settings import settings
-from msal import ConfidentialClientApplication
+from app.email_ingest.folder_cache import get_folder_cache
+from app.email_ingest.graph_transport import get_transport
 
 logger = logging.getLogger(__name__)
 
 class OutlookIntegration:
     def __init__(self):
-        self.graph_root = "https://graph.microsoft.com/v1.0"
-        self.token = None
-        self.headers = self._get_auth_headers()
-
-    def _get_auth_headers(self) -> Dict[str, str]:
-        """Get authentication headers for Microsoft Graph API."""
-        try:
-            app = ConfidentialClientApplication(
-                client_id=settings.GRAPH_CLIENT_ID,
-                client_credential=settings.GRAPH_CLIENT_SECRET,
-                authority=f"https://login.microsoftonline.com/{settings.GRAPH_TENANT_ID}"
-            )
-            
-            token = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
-            if "access_token" not in token:
-                raise RuntimeError(f"Could not obtain token: {token.get('error_description')}")
-                
-            self.token = token["access_token"]
-            return {
-                "Authorization": f"Bearer {self.token}",
-                "Accept": "application/json"
-            }
-        except Exception as e:
-            logger.error(f"Failed to get auth headers: {e}")
-            raise
+        self.graph_root = settings.GRAPH_ROOT
+        self.transport = get_transport()
+        self.folder_cache = get_folder_cache()
 
     def find_conversation_location(self, conversation_id: str, user_email: str = None) -> Tuple[bool, str, Dict]:
         """
@@ -79,18 +57,25 @@ class OutlookIntegration:
             return False, "", {"error": str(e), "status": 500}
 
     def _get_known_folder_id(self, user_email: str, folder_name: str) -> str:
-        """Get the folder ID for a known folder name."""
+        """Get the folder ID for a known folder name (cached, see ``FolderCache``)."""
+        cached = self.folder_cache.get(user_email, folder_name)
+        if cached:
+            return cached
+        
         try:
             # Try to get the folder as a well-known folder first
             url = f"{self.graph_root}/users/{user_email}/mailFolders/{folder_name}"
-            resp = requests.get(url, headers=self.headers)
+            resp = self.transport.get(url)
             
             if resp.status_code == 200:
-                folder = resp.json()
-                return folder.get("id")
+                folder_id = resp.json().get("id")
+            else:
+                # If it's not a well-known folder, try to find it as a subfolder
+                folder_id = self._find_subfolder_by_name(user_email, folder_name)
             
-            # If it's not a well-known folder, try to find it as a subfolder
-            return self._find_subfolder_by_name(user_email, folder_name)
+            if folder_id:
+                self.folder_cache.put(user_email, folder_name, folder_id)
+            return folder_id
             
         except Exception as e:
             logger.error(f"Error getting folder ID for {folder_name}: {e}")
@@ -101,7 +86,7 @@ class OutlookIntegration:
         try:
             # Get all mail folders
             url = f"{self.graph_root}/users/{user_email}/mailFolders"
-            resp = requests.get(url, headers=self.headers)
+            resp = self.transport.get(url)
             
             if resp.status_code != 200:
                 return None
@@ -123,7 +108,7 @@ class OutlookIntegration:
         """Validate that a specific message still exists."""
         try:
             url = f"{self.graph_root}/users/{user_email}/messages/{message_id}"
-            resp = requests.get(url, headers=self.headers)
+            resp = self.transport.get(url)
             
             if resp.status_code == 404:
                 return False, "Message not found"
@@ -154,8 +139,11 @@ class OutlookIntegration:
                    f"?$filter=conversationId eq '{conversation_id}'"
                    f"&$top=10")
             
-            resp = requests.get(url, headers=self.headers)
+            resp = self.transport.get(url)
             
+            if resp.status_code == 404:
+                # The cached folder no longer exists; resolve it again next time
+                self.folder_cache.invalidate_id(user_email, folder_id)
             if resp.status_code != 200:
                 return {"error": f"API error: {resp.status_code}"}
             
@@ -10,6 +10,8 @@ from pathlib import Path
 from typing import List, Dict, Optional
 from datetime import datetime
 from app.settings import settings
+from app.email_ingest.blob_store import get_blob_store
+from app.storage.email_layout import EmailLayout
 
 class S3EmailUploader:
     def __init__(self):
@@ -20,7 +22,8 @@ class S3EmailUploader:
             region_name=settings.AWS_REGION
         )
         self.bucket = settings.S3_BUCKET
-        self.data_dir = Path("data/emails")
+        self.data_dir = Path(settings.EMAIL_DATA_DIR)
+        self.blob_store = get_blob_store()
         
     def upload_file(self, local_path: Path, s3_key: str) -> bool:
         """Upload a single file to S3."""
@@ -36,6 +39,33 @@ class S3EmailUploader:
             print(f"❌ Failed to upload {local_path}: {e}")
             return False
     
+    def upload_or_copy_file(self, local_path: Path, s3_key: str) -> bool:
+        """Upload a file, or copy it server-side when identical content is already in the bucket.
+
+        Attachments known to the blob store are matched by SHA-256, so a
+        duplicate referral form is copied within S3 instead of re-sent.
+        """
+        sha256 = self.blob_store.sha_for(local_path)
+        existing_key = self.blob_store.uploaded_key(sha256) if sha256 else None
+        if existing_key and existing_key != s3_key:
+            try:
+                self.s3_client.copy_object(
+                    Bucket=self.bucket,
+                    Key=s3_key,
+                    CopySource={'Bucket': self.bucket, 'Key': existing_key},
+                    ContentType=self._get_content_type(local_path),
+                    MetadataDirective='REPLACE'
+                )
+                return True
+            except Exception as e:
+                print(f"⚠️  Server-side copy from {existing_key} failed, uploading instead: {e}")
+        
+        if not self.upload_file(local_path, s3_key):
+            return False
+        if sha256:
+            self.blob_store.mark_uploaded(sha256, s3_key)
+        return True
+    
     def _get_content_type(self, file_path: Path) -> str:
         """Get appropriate content type for file."""
         suffix = file_path.suffix.lower()
@@ -85,7 +115,7 @@ class S3EmailUploader:
                 relative_path = file_path.relative_to(email_dir)
                 s3_key = f"{s3_prefix}/{relative_path}"
                 
-                if self.upload_file(file_path, s3_key):
+                if self.upload_or_copy_file(file_path, s3_key):
                     results["files_uploaded"] += 1
                     results["uploaded_files"].append(str(relative_path))
                     print(f"   ✅ {relative_path}")
@@ -127,7 +157,7 @@ class S3EmailUploader:
             print(f"❌ Data directory not found: {self.data_dir}")
             return {"error": "Data directory not found"}
         
-        email_dirs = [d for d in self.data_dir.iterdir() if d.is_dir()]
+        email_dirs = EmailLayout(self.data_dir).list_dirs()
         if not email_dirs:
             print(f"❌ No email directories found in {self.data_dir}")
             return {"error": "No email directories found"}
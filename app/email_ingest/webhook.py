@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+Graph Webhook Receiver
+Minimal WSGI app that answers Graph subscription validation and queues the
+message IDs of change notifications for the notification worker.
+"""
+import hmac
+import json
+import re
+import threading
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIServer, make_server
+from socketserver import ThreadingMixIn
+from app.settings import settings
+from app.email_ingest.notifications import GraphSubscriptions, NotificationQueue
+
+# "Users/{user}/Messages/{message-id}" as sent in notification resources
+RESOURCE_RE = re.compile(r"users/([^/]+)/messages/([^/?]+)", re.IGNORECASE)
+
+
+def _respond(start_response, status: str, body: bytes = b"", content_type: str = "text/plain") -> List[bytes]:
+    start_response(status, [("Content-Type", content_type), ("Content-Length", str(len(body)))])
+    return [body]
+
+
+def make_webhook_app(queue: NotificationQueue = None,
+                     subscriptions: GraphSubscriptions = None,
+                     client_state: str = None,
+                     on_enqueue: Optional[Callable[[], None]] = None):
+    """Build the WSGI receiver.
+
+    Notifications are only accepted for subscriptions this deployment
+    created and with a matching ``clientState``; everything else is dropped,
+    and an empty client state is refused with ValueError. The app only
+    queues message IDs and returns 202 straight away; fetching happens in
+    ``NotificationWorker`` so Graph's response deadline is always met.
+    """
+    queue = queue or NotificationQueue()
+    subscriptions = subscriptions or GraphSubscriptions()
+    secret = settings.GRAPH_WEBHOOK_CLIENT_STATE if client_state is None else client_state
+    if not secret:
+        raise ValueError("GRAPH_WEBHOOK_CLIENT_STATE must be set to authenticate Graph notifications")
+    secret_bytes = secret.encode("utf-8")
+
+    def handle_notifications(items: List[Dict]) -> int:
+        queued = 0
+        for item in items:
+            subscription_id = str(item.get("subscriptionId") or "")
+            if not hmac.compare_digest(str(item.get("clientState") or "").encode("utf-8"), secret_bytes):
+                print(f"⚠️  Dropping notification with bad clientState for subscription {subscription_id}")
+                continue
+            source = subscriptions.lookup(subscription_id)
+            if not source:
+                print(f"⚠️  Dropping notification for unknown subscription {subscription_id}")
+                continue
+            mailbox, folder = source
+            match = RESOURCE_RE.search(item.get("resource") or "")
+            message_id = (item.get("resourceData") or {}).get("id") or (match.group(2) if match else None)
+            if not message_id:
+                continue
+            if queue.enqueue(mailbox, message_id, folder, item.get("changeType") or "created"):
+                queued += 1
+        return queued
+
+    def app(environ, start_response):
+        method = environ.get("REQUEST_METHOD", "GET")
+        params = parse_qs(environ.get("QUERY_STRING", ""))
+
+        # Subscription validation: echo the token back as plain text
+        if "validationToken" in params:
+            return _respond(start_response, "200 OK", params["validationToken"][0].encode("utf-8"))
+
+        if method == "GET" and environ.get("PATH_INFO", "/") in ("/health", "/healthz"):
+            return _respond(start_response, "200 OK", json.dumps(queue.stats()).encode(), "application/json")
+
+        if method != "POST":
+            return _respond(start_response, "405 Method Not Allowed")
+
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+            payload = json.loads(environ["wsgi.input"].read(length) or b"{}")
+            items = payload.get("value", [])
+        except (ValueError, AttributeError):
+            return _respond(start_response, "400 Bad Request")
+
+        queued = handle_notifications(items)
+        if queued:
+            print(f"📥 Queued {queued} new message(s) from {len(items)} notification(s)")
+            if on_enqueue:
+                on_enqueue()
+        return _respond(start_response, "202 Accepted")
+
+    return app
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+def serve_in_background(app, host: str = "0.0.0.0", port: int = None) -> WSGIServer:
+    """Run the receiver on a daemon thread and return the server (``server.shutdown()`` stops it)."""
+    server = make_server(host, port if port is not None else settings.WEBHOOK_PORT, app,
+                         server_class=ThreadingWSGIServer)
+    threading.Thread(target=server.serve_forever, name="graph-webhook", daemon=True).start()
+    return server
@@ -0,0 +1,135 @@
+"""
+LLM Extraction Cache
+Parsed ``extract_consolidated`` results keyed by a hash of everything that
+determines them (prompt, model, email text and attachment bytes), so
+re-running extraction or receiving the same referral twice costs nothing.
+Least recently used entries are evicted once the cache grows past its size
+limit.
+"""
+import hashlib
+import json
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+from app.settings import settings
+from app.storage.state_db import connect_state_db
+
+CACHE_FORMAT = "1"  # bump when the key recipe or stored shape changes
+
+
+def cache_key(prompt: str, model: str, email_body: str, file_bytes_list: List[bytes],
+              file_extensions: List[str], options: str = "") -> str:
+    """SHA-256 over the extraction inputs; ``options`` covers request settings such as text-first mode."""
+    digest = hashlib.sha256()
+    for part in (CACHE_FORMAT, hashlib.sha256(prompt.encode("utf-8")).hexdigest(), model, options):
+        digest.update(part.encode("utf-8") + b"\0")
+    body = email_body.encode("utf-8")
+    digest.update(len(body).to_bytes(8, "big") + body)
+    for data, extension in zip(file_bytes_list, file_extensions):
+        digest.update(extension.lower().encode("utf-8") + b"\0")
+        digest.update(len(data).to_bytes(8, "big") + hashlib.sha256(data).digest())
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    def __init__(self, db_path: str = None, max_bytes: int = None):
+        self.conn = connect_state_db(db_path or settings.EXTRACTION_CACHE_DB_PATH)
+        self.lock = threading.Lock()
+        self.max_bytes = settings.EXTRACTION_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS extraction_cache (
+                cache_key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                result TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                last_used_at TEXT NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS extraction_cache_lru ON extraction_cache (last_used_at);
+            CREATE TABLE IF NOT EXISTS extraction_cache_stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+        self.conn.commit()
+
+    def _bump(self, name: str, amount: int = 1) -> None:
+        self.conn.execute(
+            "INSERT INTO extraction_cache_stats (name, value) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+            (name, amount)
+        )
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the cached result for ``key`` (and count a hit), or None (and count a miss)."""
+        with self.lock:
+            row = self.conn.execute("SELECT result FROM extraction_cache WHERE cache_key = ?", (key,)).fetchone()
+            if row:
+                self.conn.execute(
+                    "UPDATE extraction_cache SET last_used_at = ?, hits = hits + 1 WHERE cache_key = ?",
+                    (datetime.now().isoformat(), key)
+                )
+            self._bump("hits" if row else "misses")
+            self.conn.commit()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, model: str, result: Dict) -> None:
+        """Store a parsed result, then evict least recently used entries beyond the size limit."""
+        payload = json.dumps(result, ensure_ascii=False)
+        now = datetime.now().isoformat()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO extraction_cache (cache_key, model, result, size, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, payload, len(payload.encode("utf-8")), now, now)
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self) -> None:
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM extraction_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self.conn.execute(
+            "SELECT cache_key, size FROM extraction_cache ORDER BY last_used_at, rowid"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM extraction_cache WHERE cache_key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._bump("evictions", evicted)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM extraction_cache")
+            self.conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Entries, bytes, and lifetime hits/misses/evictions."""
+        with self.lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extraction_cache"
+            ).fetchone()
+            counters = dict(self.conn.execute("SELECT name, value FROM extraction_cache_stats").fetchall())
+        return {
+            "entries": entries,
+            "bytes": size,
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+        }
+
+
+_cache: Optional[ExtractionCache] = None
+_cache_lock = threading.Lock()
+
+def get_extraction_cache() -> ExtractionCache:
+    """Return the process-wide extraction cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExtractionCache()
+        return _cache
@@ -0,0 +1,119 @@
+"""
+Fake OpenAI Batch API
+In-process stand-in for the ``files`` and ``batches`` resources of the
+OpenAI SDK, for exercising the batch extraction mode without network access
+or cost. Jobs complete after a configurable number of polls; each request is
+answered by a ``respond(body)`` callable returning the message content.
+"""
+import json
+import threading
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterable
+
+
+def default_response(body: Dict) -> str:
+    return '{"referral": false}'
+
+
+class _Files:
+    def __init__(self, fake: "FakeOpenAIBatch"):
+        self.fake = fake
+
+    def create(self, file, purpose: str):
+        data = file.read()
+        file_id = self.fake.store(data)
+        self.fake.stats["uploads"] += 1
+        return SimpleNamespace(id=file_id, bytes=len(data), purpose=purpose)
+
+    def content(self, file_id: str):
+        return SimpleNamespace(text=self.fake.stored[file_id].decode("utf-8"))
+
+
+class _Batches:
+    def __init__(self, fake: "FakeOpenAIBatch"):
+        self.fake = fake
+
+    def create(self, input_file_id: str, endpoint: str, completion_window: str, metadata: Dict = None):
+        lines = self.fake.stored[input_file_id].decode("utf-8").splitlines()
+        with self.fake.lock:
+            batch_id = f"batch_{len(self.fake.jobs) + 1:04d}"
+            batch = SimpleNamespace(
+                id=batch_id, status="validating", endpoint=endpoint, input_file_id=input_file_id,
+                completion_window=completion_window, metadata=metadata,
+                output_file_id=None, error_file_id=None,
+                request_counts=SimpleNamespace(total=len(lines), completed=0, failed=0),
+            )
+            self.fake.jobs[batch_id] = batch
+            self.fake.polls[batch_id] = 0
+        self.fake.stats["batches"] += 1
+        return batch
+
+    def retrieve(self, batch_id: str):
+        batch = self.fake.jobs[batch_id]
+        self.fake.stats["polls"] += 1
+        with self.fake.lock:
+            self.fake.polls[batch_id] += 1
+            if batch.status in ("validating", "in_progress"):
+                if self.fake.polls[batch_id] >= self.fake.polls_to_complete:
+                    self.fake.run(batch)
+                else:
+                    batch.status = "in_progress"
+        return batch
+
+
+class FakeOpenAIBatch:
+    """Duck-typed OpenAI client exposing ``files`` and ``batches``.
+
+    ``fail_ids`` are answered with a 500 in the error file; ``expire`` ends
+    every job as ``expired`` without output, like a missed completion window.
+    """
+
+    def __init__(self, respond: Callable[[Dict], str] = default_response, polls_to_complete: int = 2,
+                 fail_ids: Iterable[str] = (), expire: bool = False):
+        self.respond = respond
+        self.polls_to_complete = polls_to_complete
+        self.fail_ids = set(fail_ids)
+        self.expire = expire
+        self.stored: Dict[str, bytes] = {}
+        self.jobs: Dict[str, SimpleNamespace] = {}
+        self.polls: Dict[str, int] = {}
+        self.stats = {"uploads": 0, "batches": 0, "polls": 0, "requests": 0}
+        self.lock = threading.RLock()
+        self.files = _Files(self)
+        self.batches = _Batches(self)
+
+    def store(self, data: bytes) -> str:
+        with self.lock:
+            file_id = f"file-{len(self.stored) + 1:04d}"
+            self.stored[file_id] = data
+        return file_id
+
+    def run(self, batch) -> None:
+        """Answer every request of ``batch`` and attach its output and error files."""
+        if self.expire:
+            batch.status = "expired"
+            return
+        outputs, errors = [], []
+        for line in self.stored[batch.input_file_id].decode("utf-8").splitlines():
+            request = json.loads(line)
+            custom_id = request["custom_id"]
+            self.stats["requests"] += 1
+            if custom_id in self.fail_ids:
+                errors.append({"id": f"batch_req_{custom_id}", "custom_id": custom_id, "response": {
+                    "status_code": 500, "body": {"error": {"message": "The server had an error", "type": "server_error"}}
+                }, "error": None})
+                continue
+            content = self.respond(request["body"])
+            outputs.append({"id": f"batch_req_{custom_id}", "custom_id": custom_id, "response": {
+                "status_code": 200,
+                "body": {"object": "chat.completion", "model": request["body"].get("model"),
+                         "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                      "finish_reason": "stop"}]},
+            }, "error": None})
+        if outputs:
+            batch.output_file_id = self.store("".join(json.dumps(o) + "\n" for o in outputs).encode("utf-8"))
+        if errors:
+            batch.error_file_id = self.store("".join(json.dumps(e) + "\n" for e in errors).encode("utf-8"))
+        batch.request_counts.completed = len(outputs)
+        batch.request_counts.failed = len(errors)
+        batch.status = "completed"
@@ -0,0 +1,96 @@
+"""
+LLM Rate Limiter
+Keeps concurrent extraction workers inside the OpenAI account's
+requests-per-minute and tokens-per-minute limits. Each call reserves one
+request plus an estimate of its tokens (prompt text, images and the
+completion budget) before it is sent; a 429 pauses every worker.
+
+Images are costed like page selection does (``page_select.image_tokens``,
+the base model's tile rate) and scaled by the model's image multiplier.
+"""
+import base64
+import binascii
+import io
+import threading
+from typing import Dict, List, Optional
+from PIL import Image
+from app.email_ingest.graph_scheduler import TokenBucket
+from app.processing.page_select import API_MAX_SIDE, HIGH_SHORT_SIDE, image_tokens
+from app.settings import settings
+
+CHARS_PER_TOKEN = 4
+# Image tokens billed per base-rate token; gpt-4o-mini charges 2833 + 5667 per tile instead of 85 + 170
+IMAGE_TOKEN_MULTIPLIERS = {"gpt-4o-mini": 33.33}
+# Used when an image's size can't be read: the largest high-detail image the API keeps
+FALLBACK_IMAGE_SIZE = (HIGH_SHORT_SIDE, API_MAX_SIDE)
+# Base64 characters decoded to find the size (6 KB, enough for the JPEG/PNG headers of rendered pages)
+HEADER_B64_CHARS = 8192
+
+
+def _decoded_size(data_b64: str):
+    try:
+        with Image.open(io.BytesIO(base64.b64decode(data_b64))) as image:
+            return image.size
+    except (binascii.Error, OSError, SyntaxError, ValueError):
+        return None
+
+
+def image_size(url: str):
+    """(width, height) of a base64 data URL image; None if unreadable.
+
+    Only the start of the data is decoded; the whole image is decoded only
+    when its header lies further in (e.g. behind large EXIF blocks).
+    """
+    start = url.find(",") + 1
+    if not url.startswith("data:") or not start:
+        return None
+    size = _decoded_size(url[start:start + HEADER_B64_CHARS])
+    if size is None and len(url) - start > HEADER_B64_CHARS:
+        size = _decoded_size(url[start:])
+    return size
+
+
+def estimate_tokens(messages: List[Dict], max_tokens: int = 0, model: str = None) -> int:
+    """Rough token count for a chat request, including the completion budget."""
+    chars = image_total = 0
+    for message in messages:
+        content = message["content"]
+        parts = [{"type": "text", "text": content}] if isinstance(content, str) else content
+        for part in parts:
+            if part["type"] == "text":
+                chars += len(part["text"])
+            else:
+                size = image_size(part["image_url"]["url"]) or FALLBACK_IMAGE_SIZE
+                image_total += image_tokens(*size)
+    multiplier = IMAGE_TOKEN_MULTIPLIERS.get(model, 1.0)
+    return chars // CHARS_PER_TOKEN + round(image_total * multiplier) + max_tokens
+
+
+class LLMRateLimiter:
+    def __init__(self, rpm: int = None, tpm: int = None):
+        rpm = rpm or settings.OPENAI_RPM
+        tpm = tpm or settings.OPENAI_TPM
+        self.requests = TokenBucket(rpm / 60.0, rpm)
+        self.tokens = TokenBucket(tpm / 60.0, tpm)
+
+    def acquire(self, tokens: int) -> None:
+        """Block until one request and ``tokens`` tokens fit in the per-minute limits."""
+        self.requests.acquire(1)
+        self.tokens.acquire(tokens)
+
+    def throttle(self, seconds: float) -> None:
+        """Hold back all callers, e.g. after the API answered 429."""
+        self.requests.pause(seconds)
+        self.tokens.pause(seconds)
+
+
+_limiter: Optional[LLMRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+def get_llm_limiter() -> LLMRateLimiter:
+    """Return the process-wide LLM rate limiter."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = LLMRateLimiter()
+        return _limiter
@@ -1,9 +1,9 @@
 import json
 import base64
 import sys
+import threading
 from pathlib import Path
-import openai
-import fitz  # PyMuPDF
+from typing import Iterable
 
 # Fix Windows console encoding
 if sys.platform.startswith('win'):
@@ -16,22 +16,49 @@ if sys.platform.startswith('win'):
         sys.stderr.reconfigure(encoding='utf-8')
 
 from app.settings import settings
+from app.email_ingest.graph_scheduler import parse_retry_after
+from app.processing.extraction_cache import cache_key, get_extraction_cache
+from app.processing.llm_limiter import estimate_tokens, get_llm_limiter
+from app.processing.openai_batch import BatchFileWriter, read_batch_output, submit_batch_file, wait_for_batch
+from app.processing.page_select import plan_pages, score_pdf
+from app.processing.pdf_render import JPEG_QUALITY, MAX_DIM_PX, RENDER_DPI, render_many, render_pdf_pages
+from app.processing.pdf_text import MAX_TEXT_CHARS, split_text_layer
+from app.processing.structured_output import (IncrementalObjectParser, build_response_schema, response_format,
+                                              stream_completion_text)
 
-openai.api_key = settings.OPENAI_API_KEY
+MODEL = "gpt-4o-mini"
+MAX_TOKENS = 2048  # Increased for consolidated processing
+EMAIL_BODY_LIMIT = 4000  # characters of the email body sent with the attachments
 
-def generate_dynamic_prompt() -> str:
-    """Generate the prompt dynamically from the sample structure."""
-    # Load the sample structure
-    sample_path = Path(__file__).with_name("sample.json")
+SAMPLE_PATH = Path(__file__).with_name("sample.json")
+
+_openai = None
+_prompt_registry: dict = {}  # sample path -> ((mtime_ns, size), sample fields, prompt, response schema)
+_prompt_lock = threading.Lock()
+
+def get_openai():
+    """Import and configure the OpenAI SDK on first use; importing it takes most of a second."""
+    global _openai
+    if _openai is None:
+        import openai
+        openai.api_key = settings.OPENAI_API_KEY
+        _openai = openai
+    return _openai
+
+def _load_sample(sample_path: Path) -> dict:
     if not sample_path.exists():
         raise FileNotFoundError(f"Sample file not found: {sample_path}")
-    
     with open(sample_path, "r", encoding="utf-8") as f:
-        sample_data = json.load(f)
+        return json.load(f)
+
+def generate_dynamic_prompt(sample_data: dict = None) -> str:
+    """Generate the prompt dynamically from the sample structure."""
+    # Load the sample structure
+    if sample_data is None:
+        sample_data = _load_sample(SAMPLE_PATH)
     
     # Extract field names from the sample
     field_names = list(sample_data.keys())
-    print(f"🔧 DEBUG: Using {len(field_names)} fields from sample: {field_names}")
     
     # Generate the dynamic prompt with consolidation instructions
     base_prompt = """You are an intake agent for a Workers' Compensation TPA. You will be provided with an email and multiple attachments (images/PDFs). 
@@ -48,8 +75,35 @@ If it is not a referral request, reply with {"referral": false}. If it is, reply
     
     return full_prompt
 
-# Generate the prompt dynamically
-PROMPT = generate_dynamic_prompt()
+def _registry_entry(sample_path: Path) -> tuple:
+    stat = sample_path.stat() if sample_path.exists() else None
+    signature = (stat.st_mtime_ns, stat.st_size) if stat else None
+    with _prompt_lock:
+        entry = _prompt_registry.get(sample_path)
+        if entry is None or entry[0] != signature:
+            sample_data = _load_sample(sample_path)
+            entry = (signature, list(sample_data.keys()), generate_dynamic_prompt(sample_data),
+                     build_response_schema(sample_data))
+            _prompt_registry[sample_path] = entry
+        return entry
+
+def get_sample_fields(sample_path: Path = SAMPLE_PATH) -> list[str]:
+    """Field names from ``sample.json``, re-read only when the file changes."""
+    return _registry_entry(sample_path)[1]
+
+def get_prompt(sample_path: Path = SAMPLE_PATH) -> str:
+    """The system prompt, built on first use and rebuilt when ``sample.json`` changes."""
+    return _registry_entry(sample_path)[2]
+
+def get_response_schema(sample_path: Path = SAMPLE_PATH) -> dict:
+    """Strict JSON schema of the answer, generated from ``sample.json`` alongside the prompt."""
+    return _registry_entry(sample_path)[3]
+
+def __getattr__(name):
+    # ``PROMPT`` used to be built at import time; keep it available, built lazily
+    if name == "PROMPT":
+        return get_prompt()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def parse_json_from_response(text: str) -> dict:
     """Parse a JSON string that may be wrapped in triple backtick fences."""
@@ -60,103 +114,200 @@ def parse_json_from_response(text: str) -> dict:
             cleaned = cleaned[4:].lstrip()
     return json.loads(cleaned)
 
-def pdf_to_b64_images(pdf_bytes: bytes, max_dim_px: int = 2200, jpeg_q: int = 80) -> list[str]:
-    """Render each PDF page to base64-encoded JPEG."""
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    pages = []
-    for pg in doc:
-        pix = pg.get_pixmap(dpi=200)
-        if pix.width > max_dim_px:  # downscale huge scans
-            scale = max_dim_px / pix.width
-            pix = pg.get_pixmap(matrix=fitz.Matrix(scale, scale))
-        pages.append(base64.b64encode(
-            pix.tobytes("jpg", jpg_quality=jpeg_q)).decode())
-    doc.close()
-    return pages
-
-def extract_consolidated(file_bytes_list: list[bytes], email_body: str, file_extensions: list[str]):
-    """Extract structured data from multiple file attachments using OpenAI GPT-4o-mini.
-    
-    This function processes all attachments together to generate a single consolidated output.
-    
-    Args:
-        file_bytes_list: List of raw bytes for each file
-        email_body: Text content of the email
-        file_extensions: List of file extensions to determine content types
+def pdf_to_b64_images(pdf_bytes: bytes, max_dim_px: int = MAX_DIM_PX, jpeg_q: int = JPEG_QUALITY,
+                      pages: list[int] = None) -> list[str]:
+    """Render PDF pages (all, or the given indices) to base64-encoded JPEG."""
+    return render_pdf_pages(pdf_bytes, pages, max_dim_px=max_dim_px, jpeg_q=jpeg_q)
+
+def build_attachment_content(file_bytes_list: list[bytes], file_extensions: list[str],
+                             text_first: bool = None) -> list[dict]:
+    """Turn attachments into chat content parts, in attachment order.
+
+    With ``text_first`` (default ``PDF_TEXT_FIRST``), PDFs with a usable text
+    layer are sent as text, plus renders of any pages whose text layer fails
+    the check (scans behind a digital cover letter). Other PDFs are rendered;
+    in both cases only the pages ``plan_pages`` selects within
+    ``PDF_IMAGE_TOKEN_BUDGET``. Images are sent as they are.
     """
-    print(f"🔧 DEBUG: Starting consolidated extraction for {len(file_bytes_list)} files")
-    print(f"🔧 DEBUG: Email body length: {len(email_body)} characters")
-    print(f"🔧 DEBUG: OpenAI API Key set: {'✅' if settings.OPENAI_API_KEY else '❌'}")
+    text_first = settings.PDF_TEXT_FIRST if text_first is None else text_first
+    pdf_indices = [i for i, ext in enumerate(file_extensions) if ext.lower() == '.pdf']
+    
+    texts, scanned = {}, {}
+    if text_first:
+        for i in pdf_indices:
+            try:
+                text, scanned_pages = split_text_layer(file_bytes_list[i])
+            except Exception as e:
+                print(f"🔧 DEBUG: Text layer check failed for file {i+1}: {e}")
+                text, scanned_pages = None, []
+            if text:
+                texts[i] = text
+                if scanned_pages:
+                    scanned[i] = scanned_pages
+        print(f"🔧 DEBUG: {len(texts)}/{len(pdf_indices)} PDF(s) have a usable text layer")
     
-    # Convert all files to base64 images
-    base64_images = []
+    # Pick the informative pages of the remaining PDFs (and the scanned pages
+    # of text PDFs) within the image budget, then render them up front, in
+    # parallel across PDFs
+    to_render = [i for i in pdf_indices if i not in texts or i in scanned]
+    rendered, plans = {}, {}
+    if to_render:
+        try:
+            page_plans = plan_pages([score_pdf(file_bytes_list[i], pages=scanned.get(i)) for i in to_render],
+                                    has_text=[i in texts for i in to_render])
+            # Text PDFs whose scanned pages are all blank get an empty plan and need no render
+            plans = {i: plan for i, plan in zip(to_render, page_plans) if plan}
+            to_render = list(plans)
+            print(f"🔧 DEBUG: Rendering {sum(len(plan) for plan in plans.values())} page(s) of {len(to_render)} PDF(s)...")
+            rendered = dict(zip(to_render, render_many([file_bytes_list[i] for i in to_render],
+                                                       max_dims=[plans[i] for i in to_render])))
+        except Exception as e:
+            print(f"🔧 DEBUG: PDF conversion failed: {e}")
+            raise ValueError(f"Failed to convert PDF to image: {e}")
     
+    parts = []
     for i, (file_bytes, extension) in enumerate(zip(file_bytes_list, file_extensions)):
         print(f"🔧 DEBUG: Processing file {i+1}/{len(file_bytes_list)}: {extension}")
         
-        if extension.lower() == '.pdf':
-            print(f"🔧 DEBUG: Converting PDF to images...")
-            try:
-                # Get all pages as base64 images
-                page_images = pdf_to_b64_images(file_bytes)
-                print(f"🔧 DEBUG: PDF converted to {len(page_images)} page(s)")
-                
-                # For now, just use the first page of each PDF
-                # You could extend this to process multiple pages if needed
-                base64_images.append(page_images[0])
-                print(f"🔧 DEBUG: Added PDF page, base64 length: {len(page_images[0])}")
-                
-            except Exception as e:
-                print(f"🔧 DEBUG: PDF conversion failed: {e}")
-                raise ValueError(f"Failed to convert PDF to image: {e}")
+        if i in texts:
+            parts.append({"type": "text", "text": f"Attachment {i+1} (PDF text):\n{texts[i]}"})
+            print(f"🔧 DEBUG: Added PDF text layer, length: {len(texts[i])}")
+            if rendered.get(i):
+                pages = list(plans[i])
+                parts.append({"type": "text", "text": f"Attachment {i+1} (scanned PDF pages {', '.join(str(p + 1) for p in pages)}):"})
+                for image in rendered[i]:
+                    parts.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image}", "detail": "high"}})
+                    print(f"🔧 DEBUG: Added scanned PDF page, base64 length: {len(image)}")
+        
+        elif extension.lower() == '.pdf':
+            # Only the selected pages were rendered, each at its planned size
+            page_images = rendered.get(i)
+            if not page_images:
+                raise ValueError("Failed to convert PDF to image: document has no pages")
+            pages = list(plans[i])
+            if pages != [0]:
+                parts.append({"type": "text", "text": f"Attachment {i+1} (PDF pages {', '.join(str(p + 1) for p in pages)}):"})
+            for image in page_images:
+                parts.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image}", "detail": "high"}})
+                print(f"🔧 DEBUG: Added PDF page, base64 length: {len(image)}")
                 
         elif extension.lower() in ['.png', '.jpg', '.jpeg']:
             print(f"🔧 DEBUG: Processing image file directly")
             # Images can be processed directly
             base64_data = base64.b64encode(file_bytes).decode()
-            base64_images.append(base64_data)
+            parts.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_data}"}})
             print(f"🔧 DEBUG: Image base64 length: {len(base64_data)}")
         else:
             print(f"🔧 DEBUG: Unsupported file type: {extension}")
             raise ValueError(f"Unsupported file type: {extension}")
+    return parts
+
+def extraction_cache_key(file_bytes_list: list[bytes], email_body: str, file_extensions: list[str],
+                         text_first: bool = None) -> str:
+    """Extraction cache key; everything that changes what is sent to the model is part of it."""
+    text_first = settings.PDF_TEXT_FIRST if text_first is None else text_first
+    options = (f"text_first={text_first};text_chars={MAX_TEXT_CHARS};dpi={RENDER_DPI};jpeg_q={JPEG_QUALITY};"
+               f"pages=scored;scanned_pages=nonblank;image_budget={settings.PDF_IMAGE_TOKEN_BUDGET};structured={settings.EXTRACTION_STRUCTURED}")
+    return cache_key(get_prompt(), MODEL, email_body[:EMAIL_BODY_LIMIT], file_bytes_list, file_extensions, options)
+
+def build_extraction_request(file_bytes_list: list[bytes], email_body: str, file_extensions: list[str],
+                             text_first: bool = None) -> dict:
+    """Chat completions request body (model, token budget, messages) for one email.
     
-    # Prepare content for OpenAI API call
+    With ``EXTRACTION_STRUCTURED`` the answer is constrained to the schema
+    generated from ``sample.json``.
+    """
     content = [
-        {"type": "text", "text": email_body[:4000]}
+        {"type": "text", "text": email_body[:EMAIL_BODY_LIMIT]}
     ]
+    content.extend(build_attachment_content(file_bytes_list, file_extensions, text_first))
+    
+    images = sum(1 for part in content if part["type"] == "image_url")
+    print(f"🔧 DEBUG: Prepared content with {len(content)} items ({len(content) - images} text + {images} images)")
+    request = {
+        "model": MODEL,
+        "max_tokens": MAX_TOKENS,
+        "messages": [
+            { "role": "system", "content": get_prompt() },
+            { "role": "user", "content": content }
+        ],
+    }
+    if settings.EXTRACTION_STRUCTURED:
+        request["response_format"] = response_format(get_response_schema())
+    return request
+
+def stream_extraction(client, request: dict) -> dict:
+    """Run a structured-output request as a stream and parse the answer as it arrives.
+    
+    Returns ``{"referral": False}`` as soon as that is the first member,
+    closing the stream instead of waiting for the remaining null fields.
+    """
+    parser = IncrementalObjectParser()
+    stream = client.chat.completions.create(**request, stream=True)
+    try:
+        for text in stream_completion_text(stream):
+            for key, value in parser.feed(text):
+                if key == "referral" and value is False:
+                    print(f"⚡ Not a referral; stopped the response after {len(parser.buffer)} characters")
+                    return {"referral": False}
+    finally:
+        stream.close()
+    print(f"🔧 DEBUG: Streamed response length: {len(parser.buffer)}")
+    return parser.result()
+
+def extract_consolidated(file_bytes_list: list[bytes], email_body: str, file_extensions: list[str],
+                         text_first: bool = None, use_cache: bool = None):
+    """Extract structured data from multiple file attachments using OpenAI GPT-4o-mini.
+    
+    This function processes all attachments together to generate a single consolidated output.
+    
+    Args:
+        file_bytes_list: List of raw bytes for each file
+        email_body: Text content of the email
+        file_extensions: List of file extensions to determine content types
+        text_first: Send PDF text layers instead of page images when usable (default: PDF_TEXT_FIRST)
+        use_cache: Reuse results for identical input from the extraction cache (default: EXTRACTION_CACHE)
+    """
+    print(f"🔧 DEBUG: Starting consolidated extraction for {len(file_bytes_list)} files")
+    print(f"🔧 DEBUG: Email body length: {len(email_body)} characters")
+    print(f"🔧 DEBUG: OpenAI API Key set: {'✅' if settings.OPENAI_API_KEY else '❌'}")
+    openai = get_openai()
     
-    # Add all images to the content
-    for i, base64_data in enumerate(base64_images):
-        content.append({
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:image/jpeg;base64,{base64_data}"
-            }
-        })
+    use_cache = settings.EXTRACTION_CACHE if use_cache is None else use_cache
+    key = None
+    if use_cache:
+        key = extraction_cache_key(file_bytes_list, email_body, file_extensions, text_first)
+        cached = get_extraction_cache().get(key)
+        if cached is not None:
+            print(f"⚡ Extraction cache hit ({key[:12]})")
+            return cached
     
-    print(f"🔧 DEBUG: Prepared content with {len(content)} items (1 text + {len(base64_images)} images)")
+    # Prepare content for OpenAI API call
+    request = build_extraction_request(file_bytes_list, email_body, file_extensions, text_first)
     
-    # Use the vision API for all file types (now all are images)
     print(f"🔧 DEBUG: Preparing OpenAI API call...")
-    print(f"🔧 DEBUG: Using model: gpt-4o-mini")
-    print(f"🔧 DEBUG: Max tokens: 2048")  # Increased for consolidated processing
+    print(f"🔧 DEBUG: Using model: {MODEL}")
+    print(f"🔧 DEBUG: Max tokens: {MAX_TOKENS}")
     
+    # Wait for room under the account's requests/tokens per minute (shared by all workers)
+    get_llm_limiter().acquire(estimate_tokens(request["messages"], MAX_TOKENS, MODEL))
+    
+    response = None
     try:
         print(f"🔧 DEBUG: Making OpenAI API call...")
-        response = openai.chat.completions.create(
-            model="gpt-4o-mini",
-            max_tokens=2048,  # Increased for consolidated processing
-            messages=[
-                { "role": "system", "content": PROMPT },
-                { "role": "user", "content": content }
-            ]
-        )
-        
-        print(f"🔧 DEBUG: OpenAI API call completed")
-        print(f"🔧 DEBUG: Response object type: {type(response)}")
-        print(f"🔧 DEBUG: Number of choices: {len(response.choices)}")
-        
-        if response.choices:
+        if settings.EXTRACTION_STRUCTURED:
+            parsed_data = stream_extraction(openai, request)
+        else:
+            response = openai.chat.completions.create(**request)
+            
+            print(f"🔧 DEBUG: OpenAI API call completed")
+            print(f"🔧 DEBUG: Response object type: {type(response)}")
+            print(f"🔧 DEBUG: Number of choices: {len(response.choices)}")
+            
+            if not response.choices:
+                print(f"🔧 DEBUG: ERROR - No choices in response")
+                raise ValueError("No choices in OpenAI response")
+            
             content = response.choices[0].message.content
             print(f"🔧 DEBUG: Response content length: {len(content) if content else 0}")
             print(f"🔧 DEBUG: Response content preview: {content[:200] if content else 'EMPTY'}...")
@@ -169,21 +320,58 @@ def extract_consolidated(file_bytes_list: list[bytes], email_body: str, file_ext
             print(f"🔧 DEBUG: Attempting to parse JSON...")
             parsed_data = parse_json_from_response(content)
             print(f"🔧 DEBUG: JSON parsing successful")
-            print(f"🔧 DEBUG: Parsed data keys: {list(parsed_data.keys()) if isinstance(parsed_data, dict) else 'Not a dict'}")
-            return parsed_data
-        else:
-            print(f"🔧 DEBUG: ERROR - No choices in response")
-            raise ValueError("No choices in OpenAI response")
+        
+        print(f"🔧 DEBUG: Parsed data keys: {list(parsed_data.keys()) if isinstance(parsed_data, dict) else 'Not a dict'}")
+        if key:
+            get_extraction_cache().put(key, MODEL, parsed_data)
+        return parsed_data
             
     except json.JSONDecodeError as e:
         print(f"🔧 DEBUG: JSON Decode Error: {e}")
-        print(f"🔧 DEBUG: Raw response content: {response.choices[0].message.content if response.choices and response.choices[0].message.content else 'EMPTY'}")
+        if response is not None:
+            print(f"🔧 DEBUG: Raw response content: {response.choices[0].message.content if response.choices and response.choices[0].message.content else 'EMPTY'}")
         raise ValueError(f"Failed to parse JSON response: {e}")
     except Exception as e:
+        if isinstance(e, getattr(openai, "RateLimitError", ())):
+            # The client already retried; hold back the other workers as well
+            response_headers = getattr(getattr(e, "response", None), "headers", {})
+            get_llm_limiter().throttle(parse_retry_after(response_headers.get("retry-after")) or 20)
         print(f"🔧 DEBUG: OpenAI API Error: {e}")
         print(f"🔧 DEBUG: Error type: {type(e)}")
         raise ValueError(f"OpenAI API error: {e}")
 
+def submit_extraction_batch(requests: Iterable[tuple[str, dict]], batch_dir: Path, client=None) -> list[str]:
+    """Write (custom_id, request body) pairs to JSONL files in ``batch_dir`` and submit them as batch jobs.
+    
+    ``requests`` is consumed lazily, so rendered pages are streamed to disk
+    rather than held in memory. Returns the batch ids.
+    """
+    client = client or get_openai()
+    writer = BatchFileWriter(batch_dir)
+    try:
+        for custom_id, request in requests:
+            writer.add(custom_id, request)
+    finally:
+        paths = writer.close()
+    return [submit_batch_file(client, path, {"job": "referral-extraction"}) for path in paths]
+
+def collect_extraction_batch(batch_ids: list[str], client=None, poll_interval: float = None,
+                             timeout: float = None) -> tuple[dict, dict]:
+    """Wait for extraction batch jobs and return (parsed results, error messages), both by custom_id."""
+    client = client or get_openai()
+    poll_interval = settings.OPENAI_BATCH_POLL_SECONDS if poll_interval is None else poll_interval
+    results, errors = {}, {}
+    for batch_id in batch_ids:
+        batch = wait_for_batch(client, batch_id, poll_interval, timeout)
+        contents, failed = read_batch_output(client, batch)
+        errors.update(failed)
+        for custom_id, content in contents.items():
+            try:
+                results[custom_id] = parse_json_from_response(content)
+            except json.JSONDecodeError as e:
+                errors[custom_id] = f"Failed to parse JSON response: {e}"
+    return results, errors
+
 def extract(file_bytes: bytes, email_body: str, file_extension: str = ".pdf"):
     """Legacy function for single file extraction - now calls consolidated version."""
     return extract_consolidated([file_bytes], email_body, [file_extension])
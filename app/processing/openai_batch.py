@@ -0,0 +1,123 @@
+"""
+OpenAI Batch API
+Writes chat completion requests to JSONL input files, submits them as batch
+jobs, polls them and reads back the answers by ``custom_id``. Batch jobs are
+billed at half price and do not count against the per-minute rate limits,
+in exchange for results within the completion window instead of seconds.
+
+``client`` is anything with the ``files`` and ``batches`` resources of the
+OpenAI SDK: the ``openai`` module itself, an ``openai.OpenAI`` instance, or
+the local stand-in in ``fake_openai_batch``.
+"""
+import json
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+# Input file limits are 50,000 requests and 200 MB; stay a little under the size cap
+MAX_BATCH_REQUESTS = 50000
+MAX_BATCH_BYTES = 190 * 1024 * 1024
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchFileWriter:
+    """Streams requests into ``requests-NNN.jsonl`` files, starting a new file at the batch limits."""
+
+    def __init__(self, directory: Path, max_requests: int = None, max_bytes: int = None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_requests = max_requests or MAX_BATCH_REQUESTS
+        self.max_bytes = max_bytes or MAX_BATCH_BYTES
+        self.paths: List[Path] = []
+        self.file = None
+        self.count = self.size = 0
+
+    def add(self, custom_id: str, body: Dict) -> None:
+        line = json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body},
+                          ensure_ascii=False).encode("utf-8") + b"\n"
+        if self.file is None or self.count >= self.max_requests or self.size + len(line) > self.max_bytes:
+            self._next_file()
+        self.file.write(line)
+        self.count += 1
+        self.size += len(line)
+
+    def _next_file(self) -> None:
+        if self.file:
+            self.file.close()
+        path = self.directory / f"requests-{len(self.paths) + 1:03d}.jsonl"
+        self.paths.append(path)
+        self.file = open(path, "wb")
+        self.count = self.size = 0
+
+    def close(self) -> List[Path]:
+        if self.file:
+            self.file.close()
+            self.file = None
+        return self.paths
+
+
+def submit_batch_file(client, path: Path, metadata: Dict[str, str] = None) -> str:
+    """Upload one JSONL input file and start a batch job for it; returns the batch id."""
+    with open(path, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=COMPLETION_WINDOW,
+        metadata=metadata or None,
+    )
+    print(f"📤 Submitted batch {batch.id} ({path.name})")
+    return batch.id
+
+
+def wait_for_batch(client, batch_id: str, poll_interval: float = 60, timeout: float = None,
+                   sleep: Callable[[float], None] = time.sleep):
+    """Poll a batch job until it reaches a terminal status and return it.
+
+    Raises TimeoutError if ``timeout`` seconds pass first; the job keeps
+    running on the server and can be collected later.
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    last_status = None
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if batch.status != last_status:
+            done = f" ({counts.completed + counts.failed}/{counts.total})" if counts else ""
+            print(f"⏳ Batch {batch_id}: {batch.status}{done}")
+            last_status = batch.status
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError(f"Batch {batch_id} still {batch.status} after {timeout}s")
+        sleep(poll_interval)
+
+
+def _read_jsonl(client, file_id: str) -> List[Dict]:
+    if not file_id:
+        return []
+    text = client.files.content(file_id).text
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def read_batch_output(client, batch) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """Return (message content by custom_id, error message by custom_id) for a finished batch."""
+    contents, errors = {}, {}
+    for record in _read_jsonl(client, batch.output_file_id) + _read_jsonl(client, batch.error_file_id):
+        custom_id = record["custom_id"]
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            error = record.get("error") or response.get("body", {}).get("error") or {}
+            errors[custom_id] = error.get("message") or f"HTTP {response.get('status_code')}"
+            continue
+        choices = response["body"].get("choices") or []
+        content = choices[0]["message"].get("content") if choices else None
+        if content:
+            contents[custom_id] = content
+        else:
+            errors[custom_id] = "empty response"
+    if batch.status != "completed":
+        print(f"⚠️  Batch {batch.id} ended {batch.status}; unanswered requests are reported as errors")
+    return contents, errors
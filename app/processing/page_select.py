@@ -0,0 +1,134 @@
+"""
+PDF Page Selection
+Chooses which pages of scanned PDFs to send to the vision model, and how
+large, within an image token budget for the whole email.
+
+Pages are scored on a small grayscale thumbnail (share of inked pixels) plus
+any text they carry. Blank pages are dropped, every PDF gets its best page,
+and the remaining budget goes to the next best pages across all PDFs. Dense
+pages are rendered large enough for small print; sparse ones at a smaller
+size that costs half the tokens.
+
+Sizes follow OpenAI's high-detail image pricing: the image is fitted into
+2048x2048, its short side scaled down to 768 px, and it is billed 170 tokens
+per 512 px tile plus 85. Pixels beyond that are discarded by the API, so
+they only make the upload bigger.
+"""
+import math
+from typing import Dict, List, Sequence, Tuple
+from app.settings import settings
+
+THUMB_DPI = 24           # resolution of the scoring thumbnail
+INK_LEVEL = 200          # gray values below this count as ink
+MIN_INK = 0.004          # pages with less ink and no text are blank
+DENSE_INK = 0.06         # ink share above which a page is rendered at the large size
+DENSE_CHARS = 1200       # ...or this many characters of text
+MAX_SCAN_PAGES = 8       # pages scored per PDF
+MAX_PAGES_PER_PDF = 3
+HIGH_SHORT_SIDE = 768    # the largest short side the API keeps
+LOW_SHORT_SIDE = 512
+API_MAX_SIDE = 2048
+
+
+def image_tokens(width: float, height: float) -> int:
+    """Tokens billed for a high-detail image of this size (base model rate)."""
+    scale = min(1.0, API_MAX_SIDE / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, HIGH_SHORT_SIDE / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def size_for(width_pt: float, height_pt: float, short_side: int) -> Tuple[int, int]:
+    """(longest-side cap in px, tokens) for rendering a page with the given short side."""
+    short, long = sorted((width_pt, height_pt))
+    max_dim = min(API_MAX_SIDE, round(short_side * long / short))
+    return max_dim, image_tokens(short_side * width_pt / short, short_side * height_pt / short)
+
+
+def score_page(page) -> Dict[str, float]:
+    """Ink share, text length and combined information score of a page."""
+    import fitz  # PyMuPDF
+    zoom = THUMB_DPI / 72
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY)
+    samples = pix.samples
+    light = len(samples.translate(None, bytes(range(INK_LEVEL))))
+    ink = (len(samples) - light) / len(samples) if samples else 0.0
+    chars = len("".join(page.get_text("text").split()))
+    return {"ink": ink, "chars": chars, "score": ink + min(1.0, chars / (2 * DENSE_CHARS)) * DENSE_INK}
+
+
+def score_pdf(pdf_bytes: bytes, max_pages: int = MAX_SCAN_PAGES, pages: Sequence[int] = None) -> List[Dict]:
+    """Score the first ``max_pages`` pages (of ``pages`` if given); each entry also carries the page index and size in points.
+
+    Pages past the cap are never candidates; a warning names how many were left out.
+    """
+    import fitz  # PyMuPDF
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        scores = []
+        indices = list(range(doc.page_count) if pages is None else [p for p in pages if p < doc.page_count])
+        if len(indices) > max_pages:
+            print(f"⚠️  PDF has {len(indices)} candidate pages; only the first {max_pages} are scored, "
+                  f"pages {indices[max_pages] + 1}-{indices[-1] + 1} can't be selected")
+        for index in indices[:max_pages]:
+            page = doc[index]
+            scores.append({"page": index, "width": page.rect.width, "height": page.rect.height,
+                           **score_page(page)})
+        return scores
+    finally:
+        doc.close()
+
+
+def _is_blank(entry: Dict) -> bool:
+    return entry["ink"] < MIN_INK and entry["chars"] == 0
+
+
+def _is_dense(entry: Dict) -> bool:
+    return entry["ink"] >= DENSE_INK or entry["chars"] >= DENSE_CHARS
+
+
+def plan_pages(page_scores: Sequence[List[Dict]], budget: int = None,
+               has_text: Sequence[bool] = None) -> List[Dict[int, int]]:
+    """Pick pages and sizes for each PDF; returns ``{page index: longest-side px}`` per PDF.
+
+    The budget is ``PDF_IMAGE_TOKEN_BUDGET`` but never less than one large
+    page per PDF, so an email with several scans is not squeezed below what
+    sending each first page used to cost. A PDF whose pages all look blank
+    still sends its first page, unless ``has_text`` marks it as already sent
+    as text; its plan is then empty.
+    """
+    budget = settings.PDF_IMAGE_TOKEN_BUDGET if budget is None else budget
+    has_text = has_text or [False] * len(page_scores)
+    plans: List[Dict[int, int]] = [{} for _ in page_scores]
+    candidates = []
+    for pdf_index, scores in enumerate(page_scores):
+        ranked = sorted((s for s in scores if not _is_blank(s)), key=lambda s: -s["score"])
+        if not ranked and scores and not has_text[pdf_index]:
+            ranked = [scores[0]]
+        candidates.append(ranked)
+        if ranked:
+            high_tokens = size_for(ranked[0]["width"], ranked[0]["height"], HIGH_SHORT_SIDE)[1]
+            budget = max(budget, high_tokens * len(page_scores))
+
+    def add(pdf_index: int, entry: Dict, required: bool = False) -> None:
+        nonlocal budget
+        sizes = [HIGH_SHORT_SIDE, LOW_SHORT_SIDE] if _is_dense(entry) else [LOW_SHORT_SIDE]
+        for short_side in sizes:
+            max_dim, tokens = size_for(entry["width"], entry["height"], short_side)
+            if tokens <= budget or (required and short_side == sizes[-1]):
+                plans[pdf_index][entry["page"]] = max_dim
+                budget -= tokens
+                return
+
+    # Every PDF's best page first, then the rest by score across all PDFs
+    for pdf_index, ranked in enumerate(candidates):
+        if ranked:
+            add(pdf_index, ranked[0], required=True)
+    rest = sorted(((entry["score"], pdf_index, entry) for pdf_index, ranked in enumerate(candidates)
+                   for entry in ranked[1:]), key=lambda item: (-item[0], item[1]))
+    for _, pdf_index, entry in rest:
+        if len(plans[pdf_index]) < MAX_PAGES_PER_PDF:
+            add(pdf_index, entry)
+    # Send pages in reading order
+    return [dict(sorted(plan.items())) for plan in plans]
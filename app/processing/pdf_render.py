@@ -0,0 +1,159 @@
+"""
+PDF Page Rendering
+Rasterizes PDF pages to base64 JPEGs for the vision model. Each page is
+rendered once, straight at its target resolution, and only the pages asked
+for are rendered. Several PDFs are spread over a process pool so rendering
+uses every core instead of one. Rendered pages are kept in the on-disk
+``render_cache`` and not rasterized again for the same PDF and parameters.
+"""
+import base64
+import hashlib
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from app.processing.render_cache import get_render_cache, page_key
+from app.settings import settings
+
+RENDER_DPI = 200
+MAX_DIM_PX = 2200
+JPEG_QUALITY = 80
+POINTS_PER_INCH = 72
+
+
+def render_zoom(width_pt: float, height_pt: float, dpi: int = RENDER_DPI, max_dim_px: int = MAX_DIM_PX) -> float:
+    """Zoom factor (pixels per point) for rendering a page at ``dpi``, capped so neither side exceeds ``max_dim_px``."""
+    zoom = dpi / POINTS_PER_INCH
+    longest = max(width_pt, height_pt)
+    if longest * zoom > max_dim_px:
+        zoom = max_dim_px / longest
+    return zoom
+
+
+def _render_jpegs(pdf_bytes: bytes, pages: Optional[Sequence[int]], dpi: int, max_dim_px: int, jpeg_q: int,
+                  max_dims: Optional[Dict[int, int]], cache=None) -> Iterator[Tuple[int, bytes]]:
+    """Yield (page index, JPEG bytes), from ``cache`` when it has the page.
+
+    The PDF is only opened once a page actually has to be rendered.
+    """
+    if max_dims is not None:
+        pages = list(max_dims)
+    pdf_sha256 = hashlib.sha256(pdf_bytes).hexdigest() if cache else None
+    doc = None
+    try:
+        if pages is None:
+            import fitz  # PyMuPDF; imported on first use, it is slow to load
+            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+            pages = range(doc.page_count)
+        for index in pages:
+            page_max = max_dims.get(index, max_dim_px) if max_dims else max_dim_px
+            key = page_key(pdf_sha256, index, dpi, page_max, jpeg_q) if cache else None
+            data = cache.get(key) if cache else None
+            if data is None:
+                if doc is None:
+                    import fitz  # PyMuPDF
+                    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+                if not 0 <= index < doc.page_count:
+                    continue
+                page = doc[index]
+                zoom = render_zoom(page.rect.width, page.rect.height, dpi, page_max)
+                pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+                data = pix.tobytes("jpg", jpg_quality=jpeg_q)
+                if cache:
+                    cache.put(key, data)
+            yield index, data
+    finally:
+        if doc is not None:
+            doc.close()
+
+
+def iter_pdf_pages(pdf_bytes: bytes, pages: Optional[Sequence[int]] = None, dpi: int = RENDER_DPI,
+                   max_dim_px: int = MAX_DIM_PX, jpeg_q: int = JPEG_QUALITY,
+                   max_dims: Optional[Dict[int, int]] = None, use_cache: bool = None) -> Iterator[str]:
+    """Yield base64-encoded JPEGs of the given page indices (all pages when None), one page at a time.
+
+    ``max_dims`` maps page index to its own longest-side cap and, when given,
+    replaces ``pages``. Indices past the end of the document are ignored.
+    Pages come from the rendered page cache when ``use_cache`` (default
+    ``RENDER_CACHE``) and are added to it after rendering.
+    """
+    use_cache = settings.RENDER_CACHE if use_cache is None else use_cache
+    cache = get_render_cache() if use_cache else None
+    for _, data in _render_jpegs(pdf_bytes, pages, dpi, max_dim_px, jpeg_q, max_dims, cache):
+        yield base64.b64encode(data).decode()
+
+
+def render_pdf_pages(pdf_bytes: bytes, pages: Optional[Sequence[int]] = None, dpi: int = RENDER_DPI,
+                     max_dim_px: int = MAX_DIM_PX, jpeg_q: int = JPEG_QUALITY,
+                     max_dims: Optional[Dict[int, int]] = None, use_cache: bool = None) -> List[str]:
+    """Render the given page indices to base64-encoded JPEGs; see ``iter_pdf_pages``."""
+    return list(iter_pdf_pages(pdf_bytes, pages, dpi, max_dim_px, jpeg_q, max_dims, use_cache))
+
+
+def _render_uncached(pdf_bytes: bytes, pages: Optional[Sequence[int]], dpi: int, max_dim_px: int, jpeg_q: int,
+                     max_dims: Optional[Dict[int, int]]) -> List[Tuple[int, bytes]]:
+    # Runs in the pool; the parent owns the cache so workers never touch its index
+    return list(_render_jpegs(pdf_bytes, pages, dpi, max_dim_px, jpeg_q, max_dims))
+
+
+def _cached_pages(cache, pdf_bytes: bytes, pages: Optional[Sequence[int]], dpi: int, max_dim_px: int,
+                  jpeg_q: int, max_dims: Optional[Dict[int, int]]) -> Optional[List[str]]:
+    """All requested pages from the cache, or None if any is missing (or the pages are not known up front)."""
+    if max_dims is not None:
+        pages = list(max_dims)
+    if pages is None:
+        return None
+    pdf_sha256 = hashlib.sha256(pdf_bytes).hexdigest()
+    images = []
+    for index in pages:
+        page_max = max_dims.get(index, max_dim_px) if max_dims else max_dim_px
+        data = cache.get(page_key(pdf_sha256, index, dpi, page_max, jpeg_q))
+        if data is None:
+            return None
+        images.append(base64.b64encode(data).decode())
+    return images
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Return the process-wide rendering pool (``PDF_RENDER_WORKERS`` processes)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: callers may run extraction threads, which fork does not copy safely
+            _pool = ProcessPoolExecutor(max_workers=settings.PDF_RENDER_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def render_many(pdfs: List[bytes], pages: Optional[Sequence[int]] = None, dpi: int = RENDER_DPI,
+                max_dim_px: int = MAX_DIM_PX, jpeg_q: int = JPEG_QUALITY,
+                max_dims: Optional[List[Dict[int, int]]] = None) -> List[List[str]]:
+    """Render several PDFs, in parallel when there is more than one; results keep input order.
+
+    ``max_dims`` gives each PDF its own page plan (see ``render_pdf_pages``).
+    A single PDF (or ``PDF_RENDER_WORKERS=1``) is rendered in-process, where
+    pool start-up and pickling would cost more than they save.
+    """
+    plans = max_dims or [None] * len(pdfs)
+    if len(pdfs) <= 1 or settings.PDF_RENDER_WORKERS <= 1:
+        return [render_pdf_pages(pdf, pages, dpi, max_dim_px, jpeg_q, plan) for pdf, plan in zip(pdfs, plans)]
+    
+    # Serve fully cached PDFs here and send only the others to the pool
+    cache = get_render_cache() if settings.RENDER_CACHE else None
+    results = [_cached_pages(cache, pdf, pages, dpi, max_dim_px, jpeg_q, plan) if cache else None
+               for pdf, plan in zip(pdfs, plans)]
+    pool = get_render_pool()
+    futures = {i: pool.submit(_render_uncached, pdfs[i], pages, dpi, max_dim_px, jpeg_q, plans[i])
+               for i, images in enumerate(results) if images is None}
+    for i, future in futures.items():
+        rendered = future.result()
+        if cache:
+            pdf_sha256 = hashlib.sha256(pdfs[i]).hexdigest()
+            for index, data in rendered:
+                page_max = plans[i].get(index, max_dim_px) if plans[i] else max_dim_px
+                cache.put(page_key(pdf_sha256, index, dpi, page_max, jpeg_q), data)
+        results[i] = [base64.b64encode(data).decode() for _, data in rendered]
+    return results
@@ -0,0 +1,89 @@
+"""
+PDF Text Layer
+Pulls the embedded text out of electronically generated PDFs and decides
+whether it is good enough to send to the model instead of a rendered page.
+Scans (no text, OCR garbage, or a page that is mostly one big image) fail
+the check and are rendered as before.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+MIN_CHARS = 200            # visible characters a page needs before its text layer counts
+MIN_WORD_RATIO = 0.6       # share of tokens that look like words, numbers or dates
+MAX_GARBAGE_RATIO = 0.02   # replacement, control and private-use characters
+MAX_IMAGE_COVERAGE = 0.5   # pages mostly covered by images are treated as scans
+MAX_TEXT_CHARS = 12000     # text sent per attachment
+
+WORD_RE = re.compile(r"^[\w.,:;'\"()/#&%$@+-]+$")
+
+
+def text_quality(text: str) -> Dict[str, float]:
+    """Measurements used to judge a page's text layer."""
+    visible = [c for c in text if not c.isspace()]
+    garbage = sum(1 for c in visible if c == "�" or ord(c) < 32 or 0xE000 <= ord(c) <= 0xF8FF)
+    tokens = text.split()
+    wordlike = sum(1 for t in tokens if WORD_RE.match(t) and any(ch.isalnum() for ch in t))
+    return {
+        "chars": len(visible),
+        "word_ratio": wordlike / len(tokens) if tokens else 0.0,
+        "garbage_ratio": garbage / len(visible) if visible else 1.0,
+    }
+
+
+def _image_coverage(page) -> float:
+    import fitz  # PyMuPDF
+    area = abs(page.rect) or 1.0
+    covered = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    return min(1.0, covered / area)
+
+
+def page_text(page) -> str:
+    """Text of a page, with filled-in form field values appended."""
+    text = page.get_text("text", sort=True)
+    fields = [f"{w.field_name}: {w.field_value}" for w in page.widgets() if w.field_value not in (None, "", "Off")]
+    return text + ("\n" + "\n".join(fields) if fields else "")
+
+
+def page_has_usable_text(page, text: str = None) -> bool:
+    quality = text_quality(page_text(page) if text is None else text)
+    return (quality["chars"] >= MIN_CHARS
+            and quality["word_ratio"] >= MIN_WORD_RATIO
+            and quality["garbage_ratio"] <= MAX_GARBAGE_RATIO
+            and _image_coverage(page) < MAX_IMAGE_COVERAGE)
+
+
+def split_text_layer(pdf_bytes: bytes, max_chars: int = MAX_TEXT_CHARS) -> Tuple[Optional[str], List[int]]:
+    """Split a PDF into its trustworthy text and the pages that still need rendering.
+
+    Returns ``(None, [])`` if the first page has no usable text layer; the
+    whole PDF is then treated as a scan. Otherwise returns the text of the
+    pages that pass the check, up to ``max_chars``, and the indices of the
+    pages that fail it, e.g. the scans behind a digital cover letter.
+    """
+    import fitz  # PyMuPDF; imported on first use, it is slow to load
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        parts, scanned = [], []
+        size = 0
+        for index, page in enumerate(doc):
+            text = page_text(page)
+            if not page_has_usable_text(page, text):
+                if index == 0:
+                    return None, []
+                scanned.append(index)
+                continue
+            if size < max_chars:
+                parts.append(f"--- Page {index + 1} ---\n{text.strip()}")
+                size += len(parts[-1])
+        return ("\n\n".join(parts)[:max_chars] if parts else None), scanned
+    finally:
+        doc.close()
+
+
+def usable_text_layer(pdf_bytes: bytes, max_chars: int = MAX_TEXT_CHARS) -> Optional[str]:
+    """Return the PDF's text if its first page has a usable text layer, else None.
+
+    Only pages that pass the check are included; see ``split_text_layer``
+    for the pages left out.
+    """
+    return split_text_layer(pdf_bytes, max_chars)[0]
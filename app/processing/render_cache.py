@@ -0,0 +1,110 @@
+"""
+Rendered Page Cache
+JPEGs of rendered PDF pages kept on disk under RENDER_CACHE_DIR, keyed by
+the PDF's SHA-256 and the render parameters, so extracting the same
+attachment again (after a prompt change, a retry, or with --no-cache) does
+not rasterize it again. The index lives in the ingestion state database and
+tracks each page's size and last use; least recently used pages are deleted
+once the cache grows past RENDER_CACHE_MAX_MB. Pages are read back one at a
+time, when they are needed.
+"""
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+from app.settings import settings
+from app.storage.state_db import connect_state_db
+
+
+def page_key(pdf_sha256: str, page: int, dpi: int, max_dim_px: int, jpeg_q: int) -> str:
+    return f"{pdf_sha256}-p{page}-d{dpi}-m{max_dim_px}-q{jpeg_q}"
+
+
+class RenderCache:
+    def __init__(self, root: Path = None, db_path: str = None, max_bytes: int = None):
+        self.root = Path(root or settings.RENDER_CACHE_DIR)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.conn = connect_state_db(db_path)
+        self.lock = threading.Lock()
+        self.max_bytes = settings.RENDER_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.hits = self.misses = self.evictions = 0
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS render_cache (
+                cache_key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_used_at TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS render_cache_lru ON render_cache (last_used_at)")
+        self.conn.commit()
+
+    def path_for(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.jpg"
+
+    def get(self, key: str) -> Optional[bytes]:
+        """JPEG bytes of a cached page, or None. Entries whose file has gone are dropped."""
+        try:
+            data = self.path_for(key).read_bytes()
+        except FileNotFoundError:
+            data = None
+        with self.lock:
+            if data is None:
+                self.misses += 1
+                self.conn.execute("DELETE FROM render_cache WHERE cache_key = ?", (key,))
+            else:
+                self.hits += 1
+                self.conn.execute("UPDATE render_cache SET last_used_at = ? WHERE cache_key = ?",
+                                  (datetime.now().isoformat(), key))
+            self.conn.commit()
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store a rendered page, then evict least recently used pages beyond the size limit."""
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        part_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.part")
+        part_path.write_bytes(data)
+        os.replace(part_path, path)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO render_cache (cache_key, size, last_used_at) VALUES (?, ?, ?)",
+                (key, len(data), datetime.now().isoformat())
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self) -> None:
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM render_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute(
+            "SELECT cache_key, size FROM render_cache ORDER BY last_used_at, rowid"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self.path_for(key).unlink(missing_ok=True)
+            self.conn.execute("DELETE FROM render_cache WHERE cache_key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Pages and bytes stored, and this process's hits/misses/evictions."""
+        with self.lock:
+            pages, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM render_cache"
+            ).fetchone()
+        return {"pages": pages, "bytes": size, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions}
+
+
+_cache: Optional[RenderCache] = None
+_cache_lock = threading.Lock()
+
+def get_render_cache() -> RenderCache:
+    """Return the process-wide rendered page cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = RenderCache()
+        return _cache
@@ -0,0 +1,113 @@
+"""
+Structured Output
+JSON schema for the extraction answer, generated from ``sample.json``, and
+a streaming reader for structured-output completions.
+
+With a strict schema the model can only produce valid JSON with exactly the
+sample's keys, in the sample's order, so there are no code fences to strip
+and no malformed answers to retry. Because ``referral`` comes first, a
+streamed ``"referral": false`` settles the answer before the remaining
+(all-null) fields are generated, and the stream is closed right there.
+"""
+import json
+from typing import Dict, Iterator, List, Tuple
+
+SCHEMA_NAME = "referral_extraction"
+
+
+def _field_schema(value) -> Dict:
+    if isinstance(value, bool):
+        return {"type": ["boolean", "null"]}
+    if isinstance(value, (int, float)):
+        return {"type": ["number", "null"]}
+    if isinstance(value, list):
+        item = _field_schema(value[0]) if value else {"type": ["string", "null"]}
+        item_type = [t for t in item["type"] if t != "null"][0]
+        return {"type": ["array", "null"], "items": {"type": item_type}}
+    return {"type": ["string", "null"]}
+
+
+def build_response_schema(sample_data: Dict) -> Dict:
+    """Strict JSON schema with the sample's keys (in order); ``referral`` is a required boolean."""
+    properties = {key: _field_schema(value) for key, value in sample_data.items()}
+    if "referral" in properties:
+        properties["referral"] = {"type": "boolean"}
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+def response_format(schema: Dict) -> Dict:
+    """``response_format`` argument for a strict structured-output request."""
+    return {"type": "json_schema", "json_schema": {"name": SCHEMA_NAME, "strict": True, "schema": schema}}
+
+
+class IncrementalObjectParser:
+    """Parses a JSON object as it streams in, yielding each top-level member once it is complete."""
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.member_start = None
+        self.members: Dict = {}
+
+    def feed(self, text: str) -> List[Tuple[str, object]]:
+        """Add streamed text; returns the (key, value) pairs completed by it."""
+        self.buffer += text
+        completed = []
+        for i in range(self.pos, len(self.buffer)):
+            char = self.buffer[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+                if self.depth == 1:
+                    self.member_start = i + 1
+            elif char in "}]":
+                if self.depth == 1:
+                    completed.extend(self._close_member(i))
+                self.depth -= 1
+            elif char == "," and self.depth == 1:
+                completed.extend(self._close_member(i))
+                self.member_start = i + 1
+        self.pos = len(self.buffer)
+        return completed
+
+    def _close_member(self, end: int) -> List[Tuple[str, object]]:
+        member = self.buffer[self.member_start:end].strip()
+        if not member:
+            return []
+        (key, value), = json.loads("{" + member + "}").items()
+        self.members[key] = value
+        return [(key, value)]
+
+    def result(self) -> Dict:
+        """The whole object; raises ``json.JSONDecodeError`` if the stream ended early."""
+        return json.loads(self.buffer)
+
+
+def stream_completion_text(stream) -> Iterator[str]:
+    """Text deltas of a streamed chat completion; raises ValueError if the model refuses."""
+    refusal = ""
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        refusal += getattr(delta, "refusal", None) or ""
+        if delta.content:
+            yield delta.content
+    if refusal:
+        raise ValueError(f"Model refused the request: {refusal}")
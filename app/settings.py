@@ -12,6 +12,30 @@ class Settings:
     GRAPH_CLIENT_SECRET    = os.getenv("GRAPH_CLIENT_SECRET") or os.getenv("AZURE_CLIENT_SECRET")
     SHARED_MAILBOX         = os.getenv("SHARED_MAILBOX") or os.getenv("OUTLOOK_USER_ID")
     MAILBOX_FOLDER         = os.getenv("MAILBOX_FOLDER") or os.getenv("OUTLOOK_FOLDER_NAME", "Inbox")
+    DOWNLOAD_WORKERS       = int(os.getenv("DOWNLOAD_WORKERS", "4"))
+    # Sources for multi-source runs (full folder paths): "box1@x.com:Inbox/Intake;box2@x.com:Referrals"
+    INTAKE_SOURCES         = os.getenv("INTAKE_SOURCES", "")
+    # Sender domains treated as internal (never original inbound referrals)
+    INTERNAL_EMAIL_DOMAINS = [d.strip().lower() for d in
+                              os.getenv("INTERNAL_EMAIL_DOMAINS", "clarity-dx.com,yourcompany.com").split(",") if d.strip()]
+    # Push reply/internal-sender filtering into the Graph query and fetch bodies in a second pass
+    SERVER_SIDE_FILTER     = os.getenv("SERVER_SIDE_FILTER", "false").lower() in ("1", "true", "yes")
+    # Graph endpoint; point at a local fake server (scripts/run_fake_graph.py) for offline runs
+    GRAPH_ROOT             = os.getenv("GRAPH_ROOT", "https://graph.microsoft.com/v1.0").rstrip("/")
+    # Fixed bearer token used instead of MSAL (only for fake/test Graph endpoints)
+    GRAPH_STATIC_TOKEN     = os.getenv("GRAPH_STATIC_TOKEN")
+    GRAPH_POOL_SIZE        = int(os.getenv("GRAPH_POOL_SIZE", "20"))
+    # Per-mailbox request pacing (Exchange Online allows ~16 req/s and 4 concurrent per mailbox)
+    GRAPH_RATE_PER_SECOND  = float(os.getenv("GRAPH_RATE_PER_SECOND", "15"))
+    GRAPH_BURST            = float(os.getenv("GRAPH_BURST", "20"))
+    GRAPH_MAX_CONCURRENCY  = int(os.getenv("GRAPH_MAX_CONCURRENCY", "4"))
+    GRAPH_MAX_RETRIES      = int(os.getenv("GRAPH_MAX_RETRIES", "6"))
+    # Change notifications: public HTTPS URL Graph posts to, and the shared secret it echoes back
+    GRAPH_WEBHOOK_URL          = os.getenv("GRAPH_WEBHOOK_URL")
+    GRAPH_WEBHOOK_CLIENT_STATE = os.getenv("GRAPH_WEBHOOK_CLIENT_STATE", "")
+    WEBHOOK_PORT               = int(os.getenv("WEBHOOK_PORT", "8765"))
+    # Subscription lifetime; Graph allows up to 10080 minutes (7 days) for Outlook messages
+    GRAPH_SUBSCRIPTION_MINUTES = int(os.getenv("GRAPH_SUBSCRIPTION_MINUTES", "10000"))
 
     AWS_ACCESS_KEY_ID      = os.getenv("AWS_ACCESS_KEY_ID")
     AWS_SECRET_ACCESS_KEY  = os.getenv("AWS_SECRET_ACCESS_KEY")
@@ -19,7 +43,32 @@ class Settings:
     S3_BUCKET              = os.getenv("S3_BUCKET")
 
     OPENAI_API_KEY         = os.getenv("OPENAI_API_KEY")
+    # Account limits for the extraction model, shared by all extraction workers
+    OPENAI_RPM             = int(os.getenv("OPENAI_RPM", "500"))
+    OPENAI_TPM             = int(os.getenv("OPENAI_TPM", "200000"))
+    OPENAI_BATCH_POLL_SECONDS = float(os.getenv("OPENAI_BATCH_POLL_SECONDS", "60"))
+    OPENAI_BATCH_DIR          = os.getenv("OPENAI_BATCH_DIR", "./data/llm_batches")
+    # Processes rasterizing PDF pages for extraction
+    PDF_RENDER_WORKERS     = int(os.getenv("PDF_RENDER_WORKERS", str(os.cpu_count() or 1)))
+    # Rendered page JPEGs keyed by PDF hash and render parameters
+    RENDER_CACHE           = os.getenv("RENDER_CACHE", "true").lower() in ("1", "true", "yes")
+    RENDER_CACHE_DIR       = os.getenv("RENDER_CACHE_DIR", "./data/render_cache")
+    RENDER_CACHE_MAX_MB    = int(os.getenv("RENDER_CACHE_MAX_MB", "512"))
+    # Send the text layer of digital PDFs instead of a rendered page (scans are still rendered)
+    PDF_TEXT_FIRST         = os.getenv("PDF_TEXT_FIRST", "true").lower() in ("1", "true", "yes")
+    # Image tokens per email for scanned PDF pages (at least one large page per PDF)
+    PDF_IMAGE_TOKEN_BUDGET = int(os.getenv("PDF_IMAGE_TOKEN_BUDGET", "1200"))
+    # Constrain answers to a JSON schema generated from sample.json and stream them
+    EXTRACTION_STRUCTURED  = os.getenv("EXTRACTION_STRUCTURED", "true").lower() in ("1", "true", "yes")
+    # Parsed extraction results keyed by a hash of prompt, model, email text and attachments
+    EXTRACTION_CACHE       = os.getenv("EXTRACTION_CACHE", "true").lower() in ("1", "true", "yes")
+    EXTRACTION_CACHE_DB_PATH = os.getenv("EXTRACTION_CACHE_DB_PATH", "./data/extraction_cache.db")
+    EXTRACTION_CACHE_MAX_MB  = int(os.getenv("EXTRACTION_CACHE_MAX_MB", "256"))
 
     SQLITE_DB_PATH         = os.getenv("SQLITE_DB_PATH", "./data/intake.db")
+    EMAIL_DATA_DIR         = os.getenv("EMAIL_DATA_DIR", "data/emails")
+    INGEST_STATE_DB_PATH   = os.getenv("INGEST_STATE_DB_PATH", "./data/ingest_state.db")
+    BLOB_STORE_DIR         = os.getenv("BLOB_STORE_DIR", "./data/blobs")
+    FOLDER_CACHE_TTL       = int(os.getenv("FOLDER_CACHE_TTL", "86400"))  # seconds
 
 settings = Settings()
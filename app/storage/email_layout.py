@@ -0,0 +1,155 @@
+"""
+Email Directory Layout
+Each saved email lives at ``<root>/<aa>/<bb>/<key>/`` where ``key`` is a hash
+of its Graph message ID: a message's directory is found without scanning,
+no directory grows past a few hundred entries, and re-fetching a message
+lands in the same place. A manifest table (``<root>/manifest.db``) lists
+every email directory so scripts never have to walk the tree.
+
+Timestamp-named directories from the old flat layout (``<root>/<timestamp>_...``)
+are still listed and found, so existing data keeps working.
+"""
+import hashlib
+import json
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from app.settings import settings
+from app.storage.state_db import connect_state_db
+
+KEY_LENGTH = 32  # hex characters of the SHA-256 of the message ID
+MANIFEST_NAME = "manifest.db"
+
+
+def email_key(message_id: str) -> str:
+    """Directory name (and email_id) for a Graph message ID."""
+    return hashlib.sha256(message_id.encode("utf-8")).hexdigest()[:KEY_LENGTH]
+
+
+def legacy_timestamp(email_dir: Path) -> Optional[datetime]:
+    """Save time encoded in an old ``YYYYMMDD_HHMMSS_...`` directory name."""
+    try:
+        date_part, time_part = email_dir.name.split("_")[:2]
+        return datetime.strptime(f"{date_part}_{time_part}", "%Y%m%d_%H%M%S")
+    except ValueError:
+        return None
+
+
+class EmailLayout:
+    def __init__(self, root: Path = None):
+        self.root = Path(root or settings.EMAIL_DATA_DIR)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.conn = connect_state_db(str(self.root / MANIFEST_NAME))
+        self.lock = threading.Lock()
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS email_manifest (
+                email_id TEXT PRIMARY KEY,
+                message_id TEXT NOT NULL,
+                rel_path TEXT NOT NULL,
+                subject TEXT,
+                received_at TEXT,
+                saved_at TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'active',
+                archived_path TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS email_manifest_message ON email_manifest (message_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS email_manifest_saved ON email_manifest (status, saved_at)")
+        self.conn.commit()
+
+    def path_for(self, message_id: str) -> Path:
+        """Where a message's directory lives in the sharded layout (it may not exist yet)."""
+        key = email_key(message_id)
+        return self.root / key[:2] / key[2:4] / key
+
+    def find(self, message_id: str) -> Optional[Path]:
+        """Return the active directory for a message, checking the manifest for old-layout directories."""
+        path = self.path_for(message_id)
+        if path.exists():
+            return path
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT rel_path FROM email_manifest WHERE message_id = ? AND status = 'active'", (message_id,)
+            ).fetchone()
+        return self.root / row[0] if row else None
+
+    def register(self, email_dir: Path, email_data: Dict, saved_at: datetime = None) -> None:
+        """Add or refresh a directory's manifest entry once its files are written."""
+        email_dir = Path(email_dir)
+        saved_at = saved_at or datetime.now()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO email_manifest (email_id, message_id, rel_path, subject, received_at, saved_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (email_id) DO UPDATE SET rel_path = excluded.rel_path, subject = excluded.subject, "
+                "received_at = excluded.received_at, status = 'active', archived_path = NULL",
+                (email_dir.name, email_data.get("id", email_dir.name), str(email_dir.relative_to(self.root)),
+                 email_data.get("subject"), email_data.get("receivedDateTime"), saved_at.isoformat())
+            )
+            self.conn.commit()
+
+    def _legacy_dirs(self) -> List[Path]:
+        """Old flat-layout email directories directly under the root."""
+        return [p for p in self.root.iterdir()
+                if p.is_dir() and len(p.name) > 2 and (p / "email_metadata.json").exists()]
+
+    def list_dirs(self, limit: int = None) -> List[Path]:
+        """All active email directories, oldest first, without walking the shard tree."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT saved_at, rel_path FROM email_manifest WHERE status = 'active' ORDER BY saved_at"
+            ).fetchall()
+        entries = [(saved_at, self.root / rel_path) for saved_at, rel_path in rows]
+        registered = {path for _, path in entries}
+        for path in self._legacy_dirs():
+            if path not in registered:
+                saved = legacy_timestamp(path)
+                entries.append((saved.isoformat() if saved else "", path))
+        entries.sort(key=lambda entry: (entry[0], entry[1].name))
+        directories = [path for _, path in entries]
+        return directories[:limit] if limit else directories
+
+    def saved_at(self, email_dir: Path) -> Optional[datetime]:
+        """When a directory was saved, from the manifest or an old-style directory name."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT saved_at FROM email_manifest WHERE email_id = ?", (Path(email_dir).name,)
+            ).fetchone()
+        return datetime.fromisoformat(row[0]) if row else legacy_timestamp(Path(email_dir))
+
+    def archive(self, email_dir: Path, archive_root: Path) -> Path:
+        """Move a directory under ``archive_root`` (keeping its shard path) and drop it from listings."""
+        email_dir = Path(email_dir)
+        try:
+            rel_path = email_dir.relative_to(self.root)
+        except ValueError:
+            rel_path = Path(email_dir.name)
+        target = Path(archive_root) / rel_path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(email_dir), str(target))
+        with self.lock:
+            self.conn.execute(
+                "UPDATE email_manifest SET status = 'archived', archived_path = ? WHERE email_id = ?",
+                (str(target), email_dir.name)
+            )
+            self.conn.commit()
+        return target
+
+    def rebuild(self) -> int:
+        """Register every email directory on disk, e.g. after the manifest was lost.
+
+        Old flat-layout directories are registered too, so ``find`` works for them.
+        """
+        count = 0
+        for email_dir in list(self.root.glob("??/??/*/")) + self._legacy_dirs():
+            try:
+                with open(email_dir / "email_metadata.json", encoding="utf-8") as f:
+                    email_data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            saved = legacy_timestamp(email_dir) or datetime.fromtimestamp(email_dir.stat().st_mtime)
+            self.register(email_dir, email_data, saved)
+            count += 1
+        return count
@@ -0,0 +1,17 @@
+"""Local SQLite database for ingestion state (sync cursors, caches, ledgers).
+
+Kept separate from the referrals database so pipeline bookkeeping never
+touches the tables the CRM reads.
+"""
+import sqlite3
+from pathlib import Path
+from app.settings import settings
+
+
+def connect_state_db(db_path: str = None) -> sqlite3.Connection:
+    """Open the ingestion state database, creating its parent directory if needed."""
+    path = Path(db_path or settings.INGEST_STATE_DB_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
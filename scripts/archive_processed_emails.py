@@ -5,7 +5,6 @@ Moves email directories that have been processed (have extracted.json) to
 an archive directory for cleanup and organization.
 """
 import argparse
-import shutil
 import sys
 from pathlib import Path
 
@@ -22,6 +21,9 @@ if sys.platform.startswith('win'):
 # Add repository root to Python path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from app.email_ingest.blob_store import get_blob_store
+from app.storage.email_layout import EmailLayout
+
 
 def archive_processed_emails(archive_dir: Path, dry_run: bool = False) -> int:
     """Archive email directories that have been processed.
@@ -43,7 +45,8 @@ def archive_processed_emails(archive_dir: Path, dry_run: bool = False) -> int:
         archive_dir.mkdir(parents=True, exist_ok=True)
     
     # Find all email directories
-    email_dirs = [p for p in base_dir.iterdir() if p.is_dir()]
+    layout = EmailLayout(base_dir)
+    email_dirs = layout.list_dirs()
     
     archived_count = 0
     for email_dir in email_dirs:
@@ -51,14 +54,14 @@ def archive_processed_emails(archive_dir: Path, dry_run: bool = False) -> int:
         
         # Check if this directory has been processed
         if extracted_file.exists():
-            archive_path = archive_dir / email_dir.name
-            
             if dry_run:
                 print(f"📋 Would archive: {email_dir.name}")
             else:
                 try:
-                    # Move the entire directory
-                    shutil.move(str(email_dir), str(archive_path))
+                    # Move the entire directory, keeping its shard path
+                    archived = layout.archive(email_dir, archive_dir)
+                    # The archived files keep their data; the live store stops counting them
+                    get_blob_store().release_dir(archived)
                     print(f"📦 Archived: {email_dir.name}")
                     archived_count += 1
                 except Exception as exc:
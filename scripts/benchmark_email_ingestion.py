@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+Email Ingestion Benchmark
+Runs the ingestion pipeline against the local fake Graph server in a scratch
+data directory and reports throughput, so regressions show up without a
+tenant. Exits non-zero when --min-rate is not met (for CI).
+"""
+import sys
+import argparse
+import asyncio
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+# Fix Windows console encoding
+if sys.platform.startswith('win'):
+    import os
+    os.environ['PYTHONIOENCODING'] = 'utf-8'
+    if hasattr(sys.stdout, 'reconfigure'):
+        sys.stdout.reconfigure(encoding='utf-8')
+    if hasattr(sys.stderr, 'reconfigure'):
+        sys.stderr.reconfigure(encoding='utf-8')
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.email_ingest.fake_graph import FakeGraphState, serve_in_background
+from app.settings import settings
+
+MAILBOX = "intake@example.com"
+TOKEN = "fake-graph-token"
+
+def configure(graph_root: str, work_dir: Path, rate: float) -> None:
+    """Point Graph access and all ingestion state at the fake server and a scratch directory."""
+    settings.GRAPH_ROOT = graph_root
+    settings.GRAPH_STATIC_TOKEN = TOKEN
+    settings.EMAIL_DATA_DIR = str(work_dir / "emails")
+    settings.INGEST_STATE_DB_PATH = str(work_dir / "ingest_state.db")
+    settings.BLOB_STORE_DIR = str(work_dir / "blobs")
+    if rate:
+        settings.GRAPH_RATE_PER_SECOND = rate
+        settings.GRAPH_BURST = rate
+
+def run_ingestion(args) -> dict:
+    fetch_args = dict(mailbox=MAILBOX, src_path=["Inbox"], max_emails=None, delta_sync=args.delta,
+                      download_workers=args.download_workers, server_filter=args.server_filter)
+    if args.use_async:
+        from app.email_ingest.async_processor import AsyncEmailProcessor
+
+        async def fetch():
+            async with AsyncEmailProcessor() as processor:
+                return await processor.process_emails(**fetch_args)
+        return asyncio.run(fetch())
+
+    from app.email_ingest.email_processor import EmailProcessor
+    return EmailProcessor().process_emails(**fetch_args)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark email ingestion against a local fake Graph server")
+    parser.add_argument("--messages", type=int, default=200, help="Messages in the synthetic Inbox (default: 200)")
+    parser.add_argument("--attachments", type=int, default=2, help="Attachments per message (default: 2)")
+    parser.add_argument("--attachment-size", type=int, default=50_000, help="Bytes per attachment (default: 50000)")
+    parser.add_argument("--reply-ratio", type=float, default=0.3, help="Share of messages that are replies (default: 0.3)")
+    parser.add_argument("--latency", type=float, default=0.02,
+                       help="Seconds the fake server adds to every request (default: 0.02)")
+    parser.add_argument("--throttle-every", type=int, default=0,
+                       help="Answer every Nth request with 429 (default: never)")
+    parser.add_argument("--rate", type=float, default=None,
+                       help="Client-side Graph requests per second per mailbox (default: GRAPH_RATE_PER_SECOND)")
+    parser.add_argument("--download-workers", type=int, default=None,
+                       help="Concurrent attachment downloads (default: DOWNLOAD_WORKERS env or 4)")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Benchmark AsyncEmailProcessor")
+    parser.add_argument("--server-filter", action="store_true", default=None,
+                       help="Use server-side filtering with the two-phase fetch")
+    parser.add_argument("--delta", action="store_true", help="Use delta sync")
+    parser.add_argument("--min-rate", type=float, default=None,
+                       help="Fail (exit 1) if fewer messages per second are ingested")
+    parser.add_argument("--keep-data", action="store_true", help="Keep the scratch data directory")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON only")
+
+    args = parser.parse_args()
+
+    state = FakeGraphState(
+        mailboxes=[MAILBOX],
+        messages=args.messages,
+        attachments=args.attachments,
+        attachment_size=args.attachment_size,
+        reply_ratio=args.reply_ratio,
+        latency=args.latency,
+        throttle_every=args.throttle_every,
+        retry_after=0,
+        token=TOKEN
+    )
+    server = serve_in_background(state)
+    work_dir = Path(tempfile.mkdtemp(prefix="ingest-bench-"))
+    configure(server.graph_root, work_dir, args.rate)
+
+    started = time.perf_counter()
+    results = run_ingestion(args)
+    elapsed = time.perf_counter() - started
+    served = state.snapshot()
+    server.shutdown()
+
+    report = {
+        "messages_in_mailbox": args.messages,
+        "processed_messages": results["processed_messages"],
+        "failed_messages": results["failed_messages"],
+        "attachments": results["total_attachments"],
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(results["total_messages"] / elapsed, 2) if elapsed else 0.0,
+        "attachment_mb_per_second": round(served["attachment_bytes"] / 1e6 / elapsed, 2) if elapsed else 0.0,
+        "http_requests": served["http_requests"],
+        "graph_requests": served["requests"],  # $batch sub-requests counted individually
+        "graph_throttled": served["throttled"],
+        "folders": state.folder_counts(MAILBOX),
+        "mode": "async" if args.use_async else "threads",
+    }
+
+    if not args.keep_data:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"\n⏱️  Benchmark ({report['mode']}, {args.latency * 1000:.0f} ms latency)")
+        print(f"   Messages: {report['processed_messages']} ingested of {args.messages} "
+              f"({report['failed_messages']} failed)")
+        print(f"   Time: {report['seconds']}s")
+        print(f"   Throughput: {report['messages_per_second']} messages/s, "
+              f"{report['attachment_mb_per_second']} MB/s of attachments")
+        print(f"   Graph: {report['http_requests']} HTTP calls, {report['graph_requests']} requests "
+              f"({report['graph_throttled']} throttled)")
+        if args.keep_data:
+            print(f"   Data: {work_dir}")
+
+    if args.min_rate and report["messages_per_second"] < args.min_rate:
+        print(f"❌ Throughput {report['messages_per_second']} messages/s is below --min-rate {args.min_rate}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -25,6 +25,8 @@ if sys.platform.startswith('win'):
 # Add repository root to Python path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from app.storage.email_layout import EmailLayout
+
 
 def create_database(db_path: Path) -> sqlite3.Connection:
     """Create the database and tables if they don't exist."""
@@ -313,9 +315,7 @@ def main() -> None:
     conn = create_database(db_path)
     
     # Get all email directories
-    directories = [p for p in sorted(base_dir.iterdir()) if p.is_dir()]
-    if args.limit:
-        directories = directories[: args.limit]
+    directories = EmailLayout(base_dir).list_dirs(args.limit)
 
     print(f"🚀 Processing {len(directories)} email directories")
     
@@ -5,6 +5,7 @@ Run email ingestion with various options.
 """
 import sys
 import argparse
+import asyncio
 from pathlib import Path
 
 # Fix Windows console encoding
@@ -20,8 +21,11 @@ if sys.platform.startswith('win'):
 # Add the app directory to the Python path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from app.email_ingest.async_processor import AsyncEmailProcessor
 from app.email_ingest.email_processor import EmailProcessor
+from app.email_ingest.multi_source import MultiSourceIngestor, parse_sources
 from app.email_ingest.s3_uploader import S3EmailUploader
+from app.storage.email_layout import EmailLayout
 from app.settings import settings
 
 def parse_folder_path(folder_arg: str) -> list:
@@ -58,34 +62,100 @@ def main():
                        help="Include reply emails (default: only original inbound emails)")
     parser.add_argument("--debug-conversations", action="store_true",
                        help="Show conversation analysis for debugging")
+    parser.add_argument("--delta", action="store_true",
+                       help="Only fetch messages new or changed since the last delta run of this folder")
+    parser.add_argument("--server-filter", action="store_true", default=None,
+                       help="Filter replies/internal senders in the Graph query and fetch bodies only for kept emails")
+    parser.add_argument("--backfill-conversations", action="store_true",
+                       help="Seed the local conversation index from already-downloaded emails before fetching")
+    parser.add_argument("--rebuild-manifest", action="store_true",
+                       help="Re-register every email directory on disk in the data/emails manifest and exit")
+    parser.add_argument("--download-workers", type=int, default=None,
+                       help="Concurrent attachment downloads (default: DOWNLOAD_WORKERS env or 4)")
+    parser.add_argument("--source", action="append", default=[],
+                       help="Ingest 'mailbox:Folder/Path' alongside other sources; repeat for several (default: INTAKE_SOURCES env)")
+    parser.add_argument("--all-sources", action="store_true",
+                       help="Ingest every source listed in INTAKE_SOURCES concurrently")
+    parser.add_argument("--parallel-sources", type=int, default=None,
+                       help="How many sources to ingest at once in multi-source mode (default: all)")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                       help="Fetch with the asyncio processor (single mailbox/folder only)")
     
     args = parser.parse_args()
     
+    if args.rebuild_manifest:
+        count = EmailLayout().rebuild()
+        print(f"🗂️  Registered {count} email directories in the manifest")
+        return
+    
     # Parse the folder path
     src_path = parse_folder_path(args.folder)
+    sources = parse_sources(";".join(args.source))
+    if args.all_sources:
+        sources += parse_sources(settings.INTAKE_SOURCES)
     
     print("🚀 Email Ingestion Tool")
-    print(f"   Mailbox: {args.mailbox}")
-    print(f"   Folder: {'/'.join(src_path)}")
+    if sources:
+        print(f"   Sources: {', '.join(m + '/' + '/'.join(p) for m, p in sources)}")
+    else:
+        print(f"   Mailbox: {args.mailbox}")
+        print(f"   Folder: {'/'.join(src_path)}")
     print(f"   Action: {args.action}")
     print(f"   Filter: {'All emails' if args.include_replies else 'Original inbound only'}")
     if args.debug_conversations:
         print(f"   Debug: Conversation analysis enabled")
+    if args.delta:
+        print(f"   Sync: Delta (incremental)")
+    if args.use_async and not sources:
+        print(f"   Mode: asyncio")
     print()
     
-    if args.action in ["fetch", "both"]:
+    if args.action in ["fetch", "both"] and sources:
+        print("📧 Fetching emails from all sources...")
+        ingestor = MultiSourceIngestor(sources, max_parallel=args.parallel_sources,
+                                       download_workers=args.download_workers)
+        results = ingestor.run(
+            dest_folder=args.archive_folder,
+            move_processed=not args.no_move,
+            max_emails=args.max_emails,
+            original_only=not args.include_replies,
+            debug_conversations=args.debug_conversations,
+            delta_sync=args.delta,
+            server_filter=args.server_filter
+        )
+        
+        print(f"\n✅ Email fetching completed!")
+        print(f"   Processed: {results['processed_messages']} emails from {len(sources)} sources")
+        print(f"   Attachments: {results['total_attachments']} files")
+        if results["failed_sources"]:
+            print(f"   ⚠️ Failed sources: {results['failed_sources']}")
+    elif args.action in ["fetch", "both"]:
         print("📧 Fetching emails...")
-        processor = EmailProcessor()
+        processor = AsyncEmailProcessor() if args.use_async else EmailProcessor()
+        
+        if args.backfill_conversations:
+            count = processor.conversation_index.backfill_from_directory(args.mailbox, processor.data_dir)
+            print(f"🧵 Indexed conversations from {count} downloaded emails")
         
-        results = processor.process_emails(
+        fetch_args = dict(
             mailbox=args.mailbox,
             src_path=src_path,
             dest_folder=args.archive_folder,
             move_processed=not args.no_move,
             max_emails=args.max_emails,
             original_only=not args.include_replies,
-            debug_conversations=args.debug_conversations
+            debug_conversations=args.debug_conversations,
+            delta_sync=args.delta,
+            download_workers=args.download_workers,
+            server_filter=args.server_filter
         )
+        if args.use_async:
+            async def fetch():
+                async with processor:
+                    return await processor.process_emails(**fetch_args)
+            results = asyncio.run(fetch())
+        else:
+            results = processor.process_emails(**fetch_args)
         
         print(f"\n✅ Email fetching completed!")
         print(f"   Processed: {results['processed_messages']} emails")
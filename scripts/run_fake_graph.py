@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+Fake Graph Server
+Serves synthetic mailboxes over a local stand-in for the Microsoft Graph mail
+API, so ingestion can run without a tenant. Point the ingestion scripts at it
+with GRAPH_ROOT and GRAPH_STATIC_TOKEN (printed on start-up).
+"""
+import sys
+import argparse
+from pathlib import Path
+
+# Fix Windows console encoding
+if sys.platform.startswith('win'):
+    import os
+    os.environ['PYTHONIOENCODING'] = 'utf-8'
+    if hasattr(sys.stdout, 'reconfigure'):
+        sys.stdout.reconfigure(encoding='utf-8')
+    if hasattr(sys.stderr, 'reconfigure'):
+        sys.stderr.reconfigure(encoding='utf-8')
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.email_ingest.fake_graph import FakeGraphServer, FakeGraphState
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Microsoft Graph server with synthetic mailboxes")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8790, help="Port to listen on (default: 8790)")
+    parser.add_argument("--mailbox", action="append", default=[],
+                       help="Mailbox to serve; repeat for several (default: intake@example.com)")
+    parser.add_argument("--messages", type=int, default=100, help="Messages per mailbox Inbox (default: 100)")
+    parser.add_argument("--attachments", type=int, default=2, help="Attachments per message (default: 2)")
+    parser.add_argument("--attachment-size", type=int, default=50_000, help="Bytes per attachment (default: 50000)")
+    parser.add_argument("--reply-ratio", type=float, default=0.3, help="Share of messages that are replies (default: 0.3)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request (default: 0)")
+    parser.add_argument("--throttle-every", type=int, default=0,
+                       help="Answer every Nth request with 429 (default: never)")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds on 429 (default: 1)")
+    parser.add_argument("--token", default="fake-graph-token",
+                       help="Bearer token clients must send (default: fake-graph-token)")
+
+    args = parser.parse_args()
+
+    state = FakeGraphState(
+        mailboxes=args.mailbox or ["intake@example.com"],
+        messages=args.messages,
+        attachments=args.attachments,
+        attachment_size=args.attachment_size,
+        reply_ratio=args.reply_ratio,
+        latency=args.latency,
+        throttle_every=args.throttle_every,
+        retry_after=args.retry_after,
+        token=args.token
+    )
+    server = FakeGraphServer(state, args.host, args.port)
+    print(f"🧪 Fake Graph serving {', '.join(state.folders)} at {server.graph_root}")
+    print(f"   GRAPH_ROOT={server.graph_root}")
+    print(f"   GRAPH_STATIC_TOKEN={args.token}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n📊 Served: {state.snapshot()}")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
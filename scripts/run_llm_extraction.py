@@ -9,6 +9,7 @@ import json
 import sqlite3
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
 
@@ -25,7 +26,12 @@ if sys.platform.startswith('win'):
 # Add repository root to Python path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from app.processing.openai_agent import extract_consolidated
+from app.processing.extraction_cache import get_extraction_cache
+from app.processing.render_cache import get_render_cache
+from app.processing.openai_agent import (MODEL, build_extraction_request, collect_extraction_batch,
+                                         extract_consolidated, extraction_cache_key, submit_extraction_batch)
+from app.settings import settings
+from app.storage.email_layout import EmailLayout
 
 
 def get_database_connection(db_path: str) -> sqlite3.Connection:
@@ -85,10 +91,43 @@ def get_database_connection(db_path: str) -> sqlite3.Connection:
     return conn
 
 
+class DatabaseWriter:
+    """Owns the referrals connection on one thread; every read and write from the workers runs there."""
+
+    def __init__(self, db_path: str):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self.conn = self.executor.submit(get_database_connection, db_path).result()
+
+    def call(self, fn, *args):
+        """Run ``fn(conn, *args)`` on the writer thread and return its result."""
+        return self.executor.submit(fn, self.conn, *args).result()
+
+    def close(self) -> None:
+        self.executor.submit(self.conn.close).result()
+        self.executor.shutdown()
+
+
+def referral_exists(conn: sqlite3.Connection, email_id: str) -> bool:
+    return conn.execute("SELECT id FROM referrals WHERE email_id = ?", (email_id,)).fetchone() is not None
+
+
+def column_value(value):
+    """Value as stored in a referrals column; lists (e.g. requested procedures) are kept as JSON."""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+
 def update_referral_in_database(conn: sqlite3.Connection, email_id: str, consolidated_data: dict, 
                                processed_attachments: list, email_subject: str, email_from: str, 
-                               conversation_id: str = None) -> bool:
-    """Update referral record in database with extracted data."""
+                               conversation_id: str = None, commit: bool = True) -> bool:
+    """Update referral record in database with extracted data.
+
+    With ``commit=False`` the caller owns the transaction (bulk apply); a
+    failed statement is reported without rolling back earlier rows.
+    """
+    # The structured-output schema returns array fields as lists, which sqlite can't bind
+    consolidated_data = {key: column_value(value) for key, value in consolidated_data.items()}
     try:
         cursor = conn.cursor()
         
@@ -178,7 +217,7 @@ def update_referral_in_database(conn: sqlite3.Connection, email_id: str, consoli
                     referring_provider_address, referring_provider_email,
                     referring_provider_phone, employer_address,
                     employer_email, processed_attachments
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 email_id, conversation_id, email_subject, email_from,
                 consolidated_data.get('referral'),
@@ -218,30 +257,50 @@ def update_referral_in_database(conn: sqlite3.Connection, email_id: str, consoli
             ))
             print(f"✅ Created new referral for {email_id}")
         
-        conn.commit()
+        if commit:
+            conn.commit()
         return True
         
     except Exception as exc:
         print(f"❌ Database update failed for {email_id}: {exc}")
-        conn.rollback()
+        if commit:
+            conn.rollback()
         return False
 
 
-def process_directory(path: Path, resume: bool, db_conn: sqlite3.Connection) -> bool:
-    """Run extraction for a single email directory and write directly to database.
+def apply_referrals(conn: sqlite3.Connection, rows: list) -> int:
+    """Upsert many extraction results in one transaction; returns how many were written."""
+    written = sum(1 for row in rows if update_referral_in_database(conn, *row, commit=False))
+    conn.commit()
+    return written
 
-    Returns True if extraction completed, False otherwise.
-    """
-    print(f"🔧 DEBUG: Processing directory: {path.name}")
+
+def write_extracted_json(path: Path, inputs: dict, consolidated_data: dict) -> bool:
+    """Create extracted.json for ingest_to_db.py compatibility."""
+    extracted_data = {
+        "email_subject": inputs["email_subject"],
+        "email_from": inputs["email_from"],
+        "consolidated_data": consolidated_data,
+        "processed_attachments": inputs["attachments"],
+        "extraction_timestamp": datetime.now().isoformat()
+    }
     
-    # Check if already processed (optional - for resume functionality)
-    if resume:
-        cursor = db_conn.cursor()
-        cursor.execute("SELECT id FROM referrals WHERE email_id = ?", (path.name,))
-        if cursor.fetchone():
-            print(f"⏩ Skipping {path.name} (already in database)")
+    extracted_file = path / "extracted.json"
+    try:
+        with open(extracted_file, "w", encoding="utf-8") as f:
+            json.dump(extracted_data, f, indent=2, ensure_ascii=False)
+        print(f"📄 Created extracted.json for {path.name}")
+        return True
+    except Exception as exc:
+        print(f"❌ Failed to create extracted.json for {path.name}: {exc}")
         return False
 
+
+def load_email_inputs(path: Path) -> dict:
+    """Read an email directory's metadata and supported attachments.
+
+    Returns None (after saying why) when there is nothing to extract.
+    """
     summary_file = path / "summary.json"
     metadata_file = path / "email_metadata.json"
     attachments_dir = path / "attachments"
@@ -253,7 +312,7 @@ def process_directory(path: Path, resume: bool, db_conn: sqlite3.Connection) ->
 
     if not summary_file.exists() or not metadata_file.exists():
         print(f"⚠️  Missing summary or metadata in {path.name}, skipping")
-        return False
+        return None
 
     try:
         print(f"🔧 DEBUG: Loading JSON files...")
@@ -262,107 +321,217 @@ def process_directory(path: Path, resume: bool, db_conn: sqlite3.Connection) ->
         print(f"🔧 DEBUG: JSON files loaded successfully")
     except Exception as exc:
         print(f"❌ Failed to load JSON in {path.name}: {exc}")
-        return False
+        return None
 
     email_text = metadata.get("body", {}).get("content", "")
-    email_subject = metadata.get("subject", "")
-    email_from = metadata.get("from", {}).get("emailAddress", {}).get("address", "")
-    conversation_id = metadata.get("conversationId")
     print(f"🔧 DEBUG: Email text length: {len(email_text)} characters")
 
-    if attachments_dir.exists():
-        attachments = list(attachments_dir.iterdir())
-        print(f"🔧 DEBUG: Found {len(attachments)} attachments")
-        
-        # Collect all supported attachments
-        supported_attachments = []
-        file_bytes_list = []
-        file_extensions = []
+    if not attachments_dir.exists():
+        print(f"ℹ️  No attachments directory in {path.name}")
+        return None
+
+    attachments = list(attachments_dir.iterdir())
+    print(f"🔧 DEBUG: Found {len(attachments)} attachments")
+    
+    # Collect all supported attachments
+    supported_attachments = []
+    file_bytes_list = []
+    file_extensions = []
+    
+    for attachment in sorted(attachments):
+        print(f"🔧 DEBUG: Checking attachment: {attachment.name}")
+        print(f"🔧 DEBUG: Attachment suffix: {attachment.suffix}")
+        print(f"🔧 DEBUG: Supported file type: {attachment.suffix.lower() in {'.pdf', '.png', '.jpg', '.jpeg'}}")
         
-        for attachment in sorted(attachments):
-            print(f"🔧 DEBUG: Checking attachment: {attachment.name}")
-            print(f"🔧 DEBUG: Attachment suffix: {attachment.suffix}")
-            print(f"🔧 DEBUG: Supported file type: {attachment.suffix.lower() in {'.pdf', '.png', '.jpg', '.jpeg'}}")
-            
-            if attachment.suffix.lower() in {".pdf", ".png", ".jpg", ".jpeg"}:
-                supported_attachments.append(attachment.name)
-                print(f"🔍 Adding {attachment.name} to consolidated processing")
-                try:
-                    print(f"🔧 DEBUG: Reading file bytes...")
-                    file_bytes = attachment.read_bytes()
-                    print(f"🔧 DEBUG: File size: {len(file_bytes)} bytes")
-                    
-                    file_bytes_list.append(file_bytes)
-                    file_extensions.append(attachment.suffix)
-                    print(f"🔧 DEBUG: Added {attachment.name} to processing list")
-                except Exception as exc:
-                    print(f"❌ Failed to read {attachment.name}: {exc}")
-                    return False
-            else:
-                print(f"🔧 DEBUG: Skipping unsupported file: {attachment.name}")
-
-        if file_bytes_list:
-            print(f"🔧 DEBUG: Processing {len(file_bytes_list)} attachments together")
+        if attachment.suffix.lower() in {".pdf", ".png", ".jpg", ".jpeg"}:
+            supported_attachments.append(attachment.name)
+            print(f"🔍 Adding {attachment.name} to consolidated processing")
             try:
-                print(f"🔧 DEBUG: Calling consolidated extract function...")
-                consolidated_data = extract_consolidated(file_bytes_list, email_text, file_extensions)
-                print(f"🔧 DEBUG: Consolidated extraction completed successfully")
-                
-                # Write to database
-                db_success = update_referral_in_database(
-                    db_conn, path.name, consolidated_data, 
-                    supported_attachments, email_subject, email_from, conversation_id
-                )
-                
-                # Also create extracted.json file for ingest_to_db.py compatibility
-                extracted_data = {
-                    "email_subject": email_subject,
-                    "email_from": email_from,
-                    "consolidated_data": consolidated_data,
-                    "processed_attachments": supported_attachments,
-                    "extraction_timestamp": datetime.now().isoformat()
-                }
-                
-                extracted_file = path / "extracted.json"
-                try:
-                    with open(extracted_file, "w", encoding="utf-8") as f:
-                        json.dump(extracted_data, f, indent=2, ensure_ascii=False)
-                    print(f"📄 Created extracted.json for {path.name}")
-                    json_success = True
-                except Exception as exc:
-                    print(f"❌ Failed to create extracted.json for {path.name}: {exc}")
-                    json_success = False
-                
-                if db_success and json_success:
-                    print(f"✅ Successfully processed {path.name} (database + JSON)")
-                    return True
-                elif db_success:
-                    print(f"⚠️  Database updated but JSON creation failed for {path.name}")
-                    return True  # Still consider it successful since DB was updated
-                else:
-                    print(f"❌ Failed to update database for {path.name}")
-                    return False
+                print(f"🔧 DEBUG: Reading file bytes...")
+                file_bytes = attachment.read_bytes()
+                print(f"🔧 DEBUG: File size: {len(file_bytes)} bytes")
                 
+                file_bytes_list.append(file_bytes)
+                file_extensions.append(attachment.suffix)
+                print(f"🔧 DEBUG: Added {attachment.name} to processing list")
             except Exception as exc:
-                print(f"🔧 DEBUG: Exception during consolidated extraction: {type(exc).__name__}: {exc}")
-                print(f"❌ Consolidated extraction failed: {exc}")
-                return False
+                print(f"❌ Failed to read {attachment.name}: {exc}")
+                return None
         else:
-            print(f"ℹ️  No supported attachments in {path.name}")
-            return False
+            print(f"🔧 DEBUG: Skipping unsupported file: {attachment.name}")
+
+    if not file_bytes_list:
+        print(f"ℹ️  No supported attachments in {path.name}")
+        return None
+
+    return {
+        "email_text": email_text,
+        "email_subject": metadata.get("subject", ""),
+        "email_from": metadata.get("from", {}).get("emailAddress", {}).get("address", ""),
+        "conversation_id": metadata.get("conversationId"),
+        "attachments": supported_attachments,
+        "file_bytes_list": file_bytes_list,
+        "file_extensions": file_extensions,
+    }
+
+
+def referral_row(email_id: str, inputs: dict, consolidated_data: dict) -> tuple:
+    """Arguments for update_referral_in_database after the connection."""
+    return (email_id, consolidated_data, inputs["attachments"], inputs["email_subject"],
+            inputs["email_from"], inputs["conversation_id"])
+
+
+def process_directory(path: Path, resume: bool, db: DatabaseWriter) -> bool:
+    """Run extraction for a single email directory and write directly to database.
+
+    Safe to call from several threads at once; database access goes through ``db``.
+    Returns True if extraction completed, False otherwise.
+    """
+    print(f"🔧 DEBUG: Processing directory: {path.name}")
+    
+    # Check if already processed (optional - for resume functionality)
+    if resume and db.call(referral_exists, path.name):
+        print(f"⏩ Skipping {path.name} (already in database)")
+        return False
+
+    inputs = load_email_inputs(path)
+    if inputs is None:
+        return False
+
+    print(f"🔧 DEBUG: Processing {len(inputs['file_bytes_list'])} attachments together")
+    try:
+        print(f"🔧 DEBUG: Calling consolidated extract function...")
+        consolidated_data = extract_consolidated(inputs["file_bytes_list"], inputs["email_text"],
+                                                 inputs["file_extensions"])
+        print(f"🔧 DEBUG: Consolidated extraction completed successfully")
+    except Exception as exc:
+        print(f"🔧 DEBUG: Exception during consolidated extraction: {type(exc).__name__}: {exc}")
+        print(f"❌ Consolidated extraction failed: {exc}")
+        return False
+    
+    # Write to database
+    db_success = db.call(update_referral_in_database, *referral_row(path.name, inputs, consolidated_data))
+    json_success = write_extracted_json(path, inputs, consolidated_data)
+    
+    if db_success and json_success:
+        print(f"✅ Successfully processed {path.name} (database + JSON)")
+        return True
+    elif db_success:
+        print(f"⚠️  Database updated but JSON creation failed for {path.name}")
+        return True  # Still consider it successful since DB was updated
     else:
-        print(f"ℹ️  No attachments directory in {path.name}")
+        print(f"❌ Failed to update database for {path.name}")
         return False
 
 
+def submit_batch_run(directories: list, resume: bool, db: DatabaseWriter, batch_dir: Path,
+                     client=None) -> int:
+    """Queue every directory's extraction request as OpenAI batch jobs.
+
+    Cache hits are applied right away and never submitted. The manifest in
+    ``batch_dir`` records what each request belongs to so results can be
+    collected by a later run. Returns the number of cache hits applied.
+    """
+    items, cached = {}, []
+
+    def requests():
+        for path in directories:
+            if resume and db.call(referral_exists, path.name):
+                print(f"⏩ Skipping {path.name} (already in database)")
+                continue
+            inputs = load_email_inputs(path)
+            if inputs is None:
+                continue
+            args = (inputs["file_bytes_list"], inputs["email_text"], inputs["file_extensions"])
+            key = extraction_cache_key(*args) if settings.EXTRACTION_CACHE else None
+            hit = get_extraction_cache().get(key) if key else None
+            if hit is not None:
+                cached.append((path, inputs, hit))
+                continue
+            try:
+                request = build_extraction_request(*args)
+            except Exception as exc:
+                print(f"❌ Failed to prepare {path.name}: {exc}")
+                continue
+            items[path.name] = {
+                "path": str(path), "cache_key": key,
+                **{name: inputs[name] for name in ("email_subject", "email_from", "conversation_id", "attachments")},
+            }
+            yield path.name, request
+
+    batch_ids = submit_extraction_batch(requests(), batch_dir, client)
+    manifest = {"created_at": datetime.now().isoformat(), "batch_ids": batch_ids, "items": items}
+    (batch_dir / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    print(f"📦 Queued {len(items)} extraction(s) in {len(batch_ids)} batch job(s); manifest in {batch_dir}")
+
+    if cached:
+        print(f"⚡ Applying {len(cached)} cached extraction(s)")
+        db.call(apply_referrals, [referral_row(path.name, inputs, data) for path, inputs, data in cached])
+        for path, inputs, data in cached:
+            write_extracted_json(path, inputs, data)
+    return len(cached)
+
+
+def collect_batch_run(batch_dir: Path, db: DatabaseWriter, client=None, poll_interval: float = None,
+                      timeout: float = None) -> int:
+    """Wait for the batch jobs in ``batch_dir`` and apply their results in one transaction."""
+    manifest = json.loads((batch_dir / "manifest.json").read_text(encoding="utf-8"))
+    items = manifest["items"]
+    results, errors = collect_extraction_batch(manifest["batch_ids"], client, poll_interval, timeout)
+    for custom_id in items.keys() - results.keys() - errors.keys():
+        errors[custom_id] = "no result returned"
+    for custom_id, error in sorted(errors.items()):
+        print(f"❌ Batch extraction failed for {custom_id}: {error}")
+
+    rows = [referral_row(custom_id, items[custom_id], data) for custom_id, data in results.items() if custom_id in items]
+    written = db.call(apply_referrals, rows)
+    print(f"✅ Applied {written}/{len(rows)} batch result(s) to the database")
+
+    for custom_id, data in results.items():
+        item = items.get(custom_id)
+        if not item:
+            continue
+        if item["cache_key"]:
+            get_extraction_cache().put(item["cache_key"], MODEL, data)
+        write_extracted_json(Path(item["path"]), item, data)
+
+    manifest["collected_at"] = datetime.now().isoformat()
+    manifest["errors"] = errors
+    (batch_dir / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return written
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Run LLM extraction on attachments and write to database")
     parser.add_argument("--limit", type=int, default=None, help="Limit number of directories to process")
     parser.add_argument("--resume", action="store_true", help="Skip directories that already exist in database")
     parser.add_argument("--archive", action="store_true", help="Archive processed emails after extraction")
     parser.add_argument("--db-path", type=str, default="intake-crm.db", help="Database path")
+    parser.add_argument("--vision-only", action="store_true",
+                        help="Always send rendered PDF pages, even when a PDF has a usable text layer")
+    parser.add_argument("--no-structured", action="store_true",
+                        help="Ask for free-form JSON instead of schema-constrained, streamed answers")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Call the model even when an identical extraction is cached")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Directories extracted concurrently (paced by OPENAI_RPM/OPENAI_TPM)")
+    parser.add_argument("--batch", action="store_true",
+                        help="Submit the extractions as OpenAI batch jobs (half price, results within 24h)")
+    parser.add_argument("--no-wait", action="store_true",
+                        help="With --batch, submit and exit; collect later with --collect-batch")
+    parser.add_argument("--collect-batch", type=str, default=None, metavar="BATCH_DIR",
+                        help="Wait for a previously submitted batch and apply its results")
+    parser.add_argument("--batch-timeout", type=float, default=None,
+                        help="Give up waiting for batch jobs after this many seconds (they keep running)")
     args = parser.parse_args()
 
+    if args.vision_only:
+        settings.PDF_TEXT_FIRST = False
+    if args.no_cache:
+        settings.EXTRACTION_CACHE = False
+    if args.no_structured:
+        settings.EXTRACTION_STRUCTURED = False
+
     base_dir = Path("data/emails")
     if not base_dir.exists():
         print("No data/emails directory found")
@@ -371,31 +540,75 @@ def main() -> None:
     # Get database connection
     print(f"🔗 Connecting to database: {args.db_path}")
     try:
-        db_conn = get_database_connection(args.db_path)
+        db = DatabaseWriter(args.db_path)
         print(f"✅ Database connection established")
     except Exception as exc:
         print(f"❌ Failed to connect to database: {exc}")
         return
 
-    directories = [p for p in sorted(base_dir.iterdir()) if p.is_dir()]
-    if args.limit:
-        directories = directories[: args.limit]
+    if args.collect_batch:
+        try:
+            collect_batch_run(Path(args.collect_batch), db, timeout=args.batch_timeout)
+        except TimeoutError as exc:
+            print(f"⏳ {exc}; run --collect-batch {args.collect_batch} again later")
+            return
+        finally:
+            db.close()
+        archive_if_requested(args.archive)
+        return
+
+    directories = EmailLayout(base_dir).list_dirs(args.limit)
 
     print(f"🚀 Running extraction on {len(directories)} directories")
     success_count = 0
     
     try:
-        for directory in directories:
-            if process_directory(directory, args.resume, db_conn):
-                success_count += 1
+        if args.batch:
+            batch_dir = Path(settings.OPENAI_BATCH_DIR) / datetime.now().strftime("%Y%m%d-%H%M%S")
+            success_count = submit_batch_run(directories, args.resume, db, batch_dir)
+            if args.no_wait:
+                print(f"📨 Collect the results with: --collect-batch {batch_dir}")
+                return
+            try:
+                success_count += collect_batch_run(batch_dir, db, timeout=args.batch_timeout)
+            except TimeoutError as exc:
+                print(f"⏳ {exc}; run --collect-batch {batch_dir} later")
+                return
+        elif args.workers > 1:
+            print(f"🧵 Using {args.workers} extraction workers")
+            with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="extract") as pool:
+                futures = {pool.submit(process_directory, directory, args.resume, db): directory
+                           for directory in directories}
+                for future in as_completed(futures):
+                    try:
+                        if future.result():
+                            success_count += 1
+                    except Exception as exc:
+                        print(f"❌ Extraction worker failed on {futures[future].name}: {exc}")
+        else:
+            for directory in directories:
+                if process_directory(directory, args.resume, db):
+                    success_count += 1
         
         print(f"✅ Successfully processed {success_count}/{len(directories)} directories")
+        if settings.EXTRACTION_CACHE:
+            stats = get_extraction_cache().stats()
+            print(f"⚡ Extraction cache (all runs): {stats['hits']} hits, {stats['misses']} misses, "
+                  f"{stats['entries']} entries ({stats['bytes'] / 1024:.0f} KB), {stats['evictions']} evicted")
+        if settings.RENDER_CACHE:
+            stats = get_render_cache().stats()
+            print(f"🖼️  Render cache (this run): {stats['hits']} page hits, {stats['misses']} misses, "
+                  f"{stats['pages']} pages ({stats['bytes'] / 1024 / 1024:.1f} MB), {stats['evictions']} evicted")
         
     finally:
-        db_conn.close()
+        db.close()
         print(f"🔗 Database connection closed")
     
-    if args.archive:
+    archive_if_requested(args.archive)
+
+
+def archive_if_requested(archive: bool) -> None:
+    if archive:
         print("\n📦 Archiving processed emails...")
         try:
             subprocess.run([
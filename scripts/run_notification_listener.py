@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Graph Notification Listener
+Receives Graph change notifications for new intake emails and ingests them
+within seconds, instead of waiting for the next polling run.
+"""
+import sys
+import argparse
+import threading
+from pathlib import Path
+
+# Fix Windows console encoding
+if sys.platform.startswith('win'):
+    import os
+    os.environ['PYTHONIOENCODING'] = 'utf-8'
+    if hasattr(sys.stdout, 'reconfigure'):
+        sys.stdout.reconfigure(encoding='utf-8')
+    if hasattr(sys.stderr, 'reconfigure'):
+        sys.stderr.reconfigure(encoding='utf-8')
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.email_ingest.email_processor import EmailProcessor
+from app.email_ingest.notifications import GraphSubscriptions, NotificationQueue, NotificationWorker
+from app.email_ingest.webhook import make_webhook_app, serve_in_background
+from app.settings import settings
+
+def main():
+    parser = argparse.ArgumentParser(description="Graph change-notification listener")
+    parser.add_argument("--host", default="0.0.0.0", help="Interface to listen on (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=settings.WEBHOOK_PORT,
+                       help="Port to listen on (default: WEBHOOK_PORT env or 8765)")
+    parser.add_argument("--mailbox", default=settings.SHARED_MAILBOX,
+                       help="Mailbox to subscribe to (default: from env)")
+    parser.add_argument("--folder", default=settings.MAILBOX_FOLDER,
+                       help="Folder path to subscribe to, e.g. 'Inbox/Referrals' (default: from env)")
+    parser.add_argument("--subscribe", action="store_true",
+                       help="Create a Graph subscription for --mailbox/--folder and keep it renewed")
+    parser.add_argument("--notification-url", default=settings.GRAPH_WEBHOOK_URL,
+                       help="Public HTTPS URL that reaches this listener (default: GRAPH_WEBHOOK_URL env)")
+    parser.add_argument("--no-move", action="store_true",
+                       help="Don't move processed emails to archive folder")
+    parser.add_argument("--archive-folder", default="archive_processed",
+                       help="Archive folder name (default: archive_processed)")
+    parser.add_argument("--include-replies", action="store_true",
+                       help="Include reply emails (default: only original inbound emails)")
+    parser.add_argument("--poll-interval", type=float, default=30.0,
+                       help="Seconds between queue checks when no notification arrives (default: 30)")
+    
+    args = parser.parse_args()
+    
+    if not settings.GRAPH_WEBHOOK_CLIENT_STATE:
+        parser.error("GRAPH_WEBHOOK_CLIENT_STATE must be set so notifications can be authenticated")
+    
+    processor = EmailProcessor()
+    queue = NotificationQueue()
+    subscriptions = GraphSubscriptions(processor.transport, processor.graph_root)
+    wake = threading.Event()
+    
+    app = make_webhook_app(queue, subscriptions, on_enqueue=wake.set)
+    server = serve_in_background(app, args.host, args.port)
+    print(f"👂 Listening for Graph notifications on {args.host}:{server.server_port}")
+    
+    if args.subscribe:
+        if not args.notification_url:
+            parser.error("--subscribe needs --notification-url or GRAPH_WEBHOOK_URL")
+        folder_path = [seg for seg in args.folder.split("/") if seg]
+        folder_id = processor.get_folder_id(args.mailbox, folder_path)
+        sub = subscriptions.create(args.mailbox, "/".join(folder_path), folder_id, args.notification_url)
+        print(f"🔔 Subscribed to {args.mailbox}/{'/'.join(folder_path)} until {sub['expirationDateTime']}")
+    
+    # Renewal runs on its own timer so a busy queue can't let the subscription lapse
+    stop_renewal = subscriptions.renew_in_background()
+    
+    worker = NotificationWorker(processor, queue)
+    try:
+        worker.run_forever(
+            wake=wake,
+            poll_interval=args.poll_interval,
+            dest_folder=args.archive_folder,
+            move_processed=not args.no_move,
+            original_only=not args.include_replies
+        )
+    except KeyboardInterrupt:
+        print("\n👋 Stopping listener")
+        stop_renewal.set()
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
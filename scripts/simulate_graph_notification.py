@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Graph Notification Simulator
+Sends a subscription validation request and change notifications shaped like
+Microsoft Graph's to a running listener, for testing without a public URL.
+"""
+import sys
+import argparse
+import uuid
+from pathlib import Path
+
+import requests
+
+# Add the app directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.email_ingest.notifications import GraphSubscriptions
+from app.settings import settings
+
+def main():
+    parser = argparse.ArgumentParser(description="Send fake Graph change notifications to a listener")
+    parser.add_argument("--url", default=f"http://localhost:{settings.WEBHOOK_PORT}/",
+                       help="Listener URL (default: http://localhost:WEBHOOK_PORT/)")
+    parser.add_argument("--mailbox", default=settings.SHARED_MAILBOX,
+                       help="Mailbox the messages belong to (default: from env)")
+    parser.add_argument("--message-id", action="append", default=[],
+                       help="Graph message ID to announce; repeat for several")
+    parser.add_argument("--subscription-id", default=None,
+                       help="Subscription ID to send; the listener drops unknown ones "
+                            "(default: the mailbox's subscription in the state database)")
+    parser.add_argument("--client-state", default=settings.GRAPH_WEBHOOK_CLIENT_STATE,
+                       help="clientState to send (default: GRAPH_WEBHOOK_CLIENT_STATE env)")
+    parser.add_argument("--skip-validation", action="store_true",
+                       help="Don't send the subscription validation request first")
+    
+    args = parser.parse_args()
+    
+    if not args.skip_validation:
+        token = f"Validation: Testing client application reachability for subscription Request-Id: {uuid.uuid4()}"
+        resp = requests.post(args.url, params={"validationToken": token}, timeout=10)
+        ok = resp.status_code == 200 and resp.text == token
+        print(f"{'✅' if ok else '❌'} Validation: HTTP {resp.status_code}{'' if ok else ', token not echoed'}")
+        if not ok:
+            sys.exit(1)
+    
+    if not args.message_id:
+        return
+    
+    subscription_id = args.subscription_id
+    if not subscription_id:
+        known = GraphSubscriptions().ids_for(args.mailbox)
+        if not known:
+            print(f"❌ No subscription for {args.mailbox} in the state database; pass --subscription-id")
+            sys.exit(1)
+        subscription_id = known[0]
+    payload = {
+        "value": [
+            {
+                "subscriptionId": subscription_id,
+                "subscriptionExpirationDateTime": "2099-01-01T00:00:00.0000000Z",
+                "changeType": "created",
+                "resource": f"Users/{args.mailbox}/Messages/{message_id}",
+                "resourceData": {
+                    "@odata.type": "#Microsoft.Graph.Message",
+                    "@odata.id": f"Users/{args.mailbox}/Messages/{message_id}",
+                    "id": message_id
+                },
+                "clientState": args.client_state,
+                "tenantId": settings.GRAPH_TENANT_ID or ""
+            }
+            for message_id in args.message_id
+        ]
+    }
+    resp = requests.post(args.url, json=payload, timeout=10)
+    print(f"{'✅' if resp.status_code == 202 else '❌'} Notification for {len(args.message_id)} message(s): HTTP {resp.status_code}")
+
+if __name__ == "__main__":
+    main()
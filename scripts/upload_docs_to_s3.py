@@ -26,6 +26,7 @@ if sys.platform.startswith('win'):
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from app.email_ingest.s3_uploader import S3EmailUploader
+from app.storage.email_layout import EmailLayout
 from app.settings import settings
 
 
@@ -35,20 +36,16 @@ def list_email_directories(base_dir: Path, limit: Optional[int] = None) -> List[
         print(f"❌ Email directory not found: {base_dir}")
         return []
     
-    directories = [d for d in sorted(base_dir.iterdir()) if d.is_dir()]
-    
-    if limit:
-        directories = directories[:limit]
-    
-    return directories
+    return EmailLayout(base_dir).list_dirs(limit)
 
 
 def filter_directories(directories: List[Path], 
+                      layout: EmailLayout,
                       has_attachments: bool = None,
                       has_extracted: bool = None,
                       date_from: str = None,
                       date_to: str = None) -> List[Path]:
-    """Filter directories based on criteria."""
+    """Filter directories based on criteria; ``layout`` is the data root's layout, used for save times."""
     filtered = []
     
     for directory in directories:
@@ -65,12 +62,12 @@ def filter_directories(directories: List[Path],
             if has_extracted != extracted_file.exists():
                 continue
         
-        # Check date range (based on directory name timestamp)
+        # Check date range (based on when the email was saved)
         if date_from or date_to:
             try:
-                # Extract timestamp from directory name (format: YYYYMMDD_HHMMSS_...)
-                timestamp_str = directory.name.split('_')[0] + '_' + directory.name.split('_')[1]
-                dir_date = datetime.strptime(timestamp_str, '%Y%m%d_%H%M%S')
+                dir_date = layout.saved_at(directory)
+                if dir_date is None:
+                    raise ValueError(f"No save time for {directory.name}")
                 
                 if date_from:
                     from_date = datetime.strptime(date_from, '%Y-%m-%d')
@@ -82,7 +79,7 @@ def filter_directories(directories: List[Path],
                     if dir_date.date() > to_date.date():
                         continue
                         
-            except (ValueError, IndexError):
+            except ValueError:
                 # If we can't parse the date, skip this directory
                 continue
         
@@ -179,6 +176,7 @@ def main():
     # Apply filters
     filtered_directories = filter_directories(
         directories,
+        EmailLayout(data_dir),
         has_attachments=has_attachments,
         has_extracted=has_extracted,
         date_from=args.date_from,
@@ -0,0 +1,77 @@
+import os
+import sys
+import types
+from pathlib import Path
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+from app.email_ingest import blob_store
+from app.email_ingest.blob_store import BlobStore
+
+
+def attachment_path(tmp_path, email, name="referral.pdf"):
+    path = tmp_path / "emails" / email / "attachments" / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def test_identical_attachments_are_stored_once(tmp_path):
+    store = BlobStore(tmp_path / "blobs", str(tmp_path / "state.db"))
+    first = attachment_path(tmp_path, "email-1")
+    second = attachment_path(tmp_path, "email-2")
+
+    sha = store.add_bytes(b"%PDF same content", first)
+    assert store.add_bytes(b"%PDF same content", second) == sha
+
+    assert first.read_bytes() == second.read_bytes() == b"%PDF same content"
+    assert os.path.samefile(first, store.blob_path(sha))
+    assert store.sha_for(second) == sha
+    assert store.stats() == {"blobs": 1, "stored_bytes": 17, "deduplicated_bytes": 17}
+    assert not list(first.parent.glob("*.part"))
+
+
+def test_blob_is_deleted_with_its_last_reference(tmp_path):
+    store = BlobStore(tmp_path / "blobs", str(tmp_path / "state.db"))
+    first = attachment_path(tmp_path, "email-1")
+    second = attachment_path(tmp_path, "email-2")
+    sha = store.add_bytes(b"shared", first)
+    store.add_bytes(b"shared", second)
+
+    # Replacing a file moves its reference to the new content
+    other = store.add_bytes(b"replaced", second)
+    assert store.stats()["blobs"] == 2
+
+    store.release(first)
+    assert not store.blob_path(sha).exists()
+    assert store.sha_for(first) is None
+
+    assert store.release_dir(second.parent.parent) == 1
+    assert not store.blob_path(other).exists()
+    assert store.stats() == {"blobs": 0, "stored_bytes": 0, "deduplicated_bytes": 0}
+
+
+def test_files_are_copied_when_hardlinks_fail(tmp_path, monkeypatch):
+    store = BlobStore(tmp_path / "blobs", str(tmp_path / "state.db"))
+
+    def no_links(src, dst):
+        raise OSError("cross-device link")
+
+    monkeypatch.setattr(blob_store.os, "link", no_links)
+    dest = attachment_path(tmp_path, "email-1")
+    sha = store.add_bytes(b"copied", dest)
+
+    assert dest.read_bytes() == b"copied"
+    assert not os.path.samefile(dest, store.blob_path(sha))
+    assert store.stats()["blobs"] == 1
+
+
+def test_store_is_shared_per_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store.settings, "BLOB_STORE_DIR", str(tmp_path / "blobs"))
+    monkeypatch.setattr(blob_store.settings, "INGEST_STATE_DB_PATH", str(tmp_path / "state.db"))
+    monkeypatch.setattr(blob_store, "_blob_store", None)
+
+    assert blob_store.get_blob_store() is blob_store.get_blob_store()
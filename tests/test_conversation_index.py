@@ -0,0 +1,57 @@
+import sys
+import types
+from pathlib import Path
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+from app.email_ingest.conversation_index import ConversationIndex
+
+
+def message(message_id, received, conversation_id="conv-1"):
+    return {"id": message_id, "conversationId": conversation_id, "receivedDateTime": received}
+
+
+ORIGINAL = message("m1", "2024-05-01T09:00:00Z")
+REPLY = message("m2", "2024-05-01T10:00:00Z")
+
+
+def test_unknown_conversations_need_a_graph_query(tmp_path):
+    index = ConversationIndex(str(tmp_path / "state.db"))
+    assert index.is_first("intake@x.com", ORIGINAL) is None
+    assert index.is_first("intake@x.com", {"id": "m9"}) is None
+
+
+def test_listed_messages_prove_replies_but_not_originals(tmp_path):
+    index = ConversationIndex(str(tmp_path / "state.db"))
+    index.observe("Intake@x.com", [REPLY, ORIGINAL])
+
+    assert index.is_first("intake@x.com", REPLY) is False
+    # The thread may have started in another folder
+    assert index.is_first("intake@x.com", ORIGINAL) is None
+    # Other mailboxes and conversations are separate
+    assert index.is_first("other@x.com", REPLY) is None
+    assert index.is_first("intake@x.com", message("m2", REPLY["receivedDateTime"], "conv-2")) is None
+
+
+def test_verified_start_answers_both_ways_and_survives_later_sightings(tmp_path):
+    db_path = str(tmp_path / "state.db")
+    index = ConversationIndex(db_path)
+    index.record_conversation("intake@x.com", "conv-1", [REPLY, ORIGINAL])
+    index.observe("intake@x.com", [REPLY, message("m3", "2024-05-02T09:00:00Z")])
+
+    reopened = ConversationIndex(db_path)
+    assert reopened.is_first("intake@x.com", ORIGINAL) is True
+    assert reopened.is_first("intake@x.com", REPLY) is False
+
+
+def test_earlier_sighting_moves_the_start_back(tmp_path):
+    index = ConversationIndex(str(tmp_path / "state.db"))
+    index.observe("intake@x.com", [REPLY])
+    assert index.is_first("intake@x.com", ORIGINAL) is None
+
+    index.observe("intake@x.com", [ORIGINAL])
+    assert index.is_first("intake@x.com", REPLY) is False
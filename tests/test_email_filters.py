@@ -0,0 +1,62 @@
+import sys
+import types
+from pathlib import Path
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+from app.email_ingest.email_processor import EmailProcessor
+from app.settings import settings
+
+
+def make_processor(monkeypatch):
+    monkeypatch.setattr(settings, "INTERNAL_EMAIL_DOMAINS", ["clinic.internal"])
+    processor = EmailProcessor.__new__(EmailProcessor)
+    processor.current_mailbox = "intake@x.com"
+    processor.conversation_index = types.SimpleNamespace(observe=lambda user, page: None)
+    processor.prefetch_conversations = lambda page: None
+    processor._is_first_in_conversation = lambda msg: True
+    return processor
+
+
+def message(msg_id, subject, sender="doc@ext.com"):
+    return {"id": msg_id, "subject": subject, "conversationId": "c-" + msg_id,
+            "from": {"emailAddress": {"address": sender}}}
+
+
+def test_header_rules(monkeypatch):
+    processor = make_processor(monkeypatch)
+    assert processor._passes_header_rules(message("1", "New referral"))
+    assert not processor._passes_header_rules(message("2", "RE: New referral"))
+    assert not processor._passes_header_rules(message("3", "Fwd - scan"))
+    assert not processor._passes_header_rules(message("4", "Referral", sender="Intake@x.com"))
+    assert not processor._passes_header_rules(message("5", "Referral", sender="nurse@clinic.internal"))
+
+
+def test_server_filters_fall_back_to_simpler_expressions(monkeypatch):
+    processor = make_processor(monkeypatch)
+    filters = processor._server_filters("o'neil@x.com")
+    assert filters[0].startswith("from/emailAddress/address ne 'o''neil@x.com'")
+    assert "not endswith(from/emailAddress/address,'@clinic.internal')" in filters[0]
+    assert "endswith" not in filters[1] and "not startswith(subject,'RE:')" in filters[1]
+    assert filters[2] == "from/emailAddress/address ne 'o''neil@x.com'"
+
+
+def test_two_phase_fetches_bodies_only_for_kept_messages(monkeypatch):
+    processor = make_processor(monkeypatch)
+    fetched = []
+
+    def get_messages_batch(user, ids):
+        fetched.extend(ids)
+        return {i: (None if i == "3" else {"id": i, "body": {"content": "full"}}) for i in ids}
+
+    processor.get_messages_batch = get_messages_batch
+    page = [message("1", "Referral"), message("2", "RE: Referral"), message("3", "Deleted meanwhile")]
+
+    kept = processor._select_originals("intake@x.com", page, original_only=True, two_phase=True)
+
+    assert fetched == ["1", "3"]
+    assert kept == [{"id": "1", "body": {"content": "full"}}]
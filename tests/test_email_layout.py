@@ -0,0 +1,64 @@
+import json
+import sys
+import types
+from datetime import datetime
+from pathlib import Path
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+from app.storage.email_layout import EmailLayout, email_key
+
+
+def save(layout, message_id):
+    email_dir = layout.path_for(message_id)
+    (email_dir / "attachments").mkdir(parents=True)
+    (email_dir / "email_metadata.json").write_text(json.dumps({"id": message_id}))
+    layout.register(email_dir, {"id": message_id, "subject": "Referral"})
+    return email_dir
+
+
+def test_paths_are_sharded_by_message_hash(tmp_path):
+    layout = EmailLayout(tmp_path / "emails")
+    key = email_key("AAMkAGI2")
+
+    path = layout.path_for("AAMkAGI2")
+
+    assert path == tmp_path / "emails" / key[:2] / key[2:4] / key
+    assert layout.path_for("AAMkAGI2") == path
+    assert layout.find("AAMkAGI2") is None
+
+
+def test_manifest_lists_new_and_legacy_directories(tmp_path):
+    root = tmp_path / "emails"
+    layout = EmailLayout(root)
+    legacy = root / "20240101_090000_AAMk_Old"
+    (legacy / "attachments").mkdir(parents=True)
+    (legacy / "email_metadata.json").write_text(json.dumps({"id": "old"}))
+    (root / "archive").mkdir()
+
+    first = save(layout, "m1")
+    second = save(layout, "m2")
+
+    assert layout.list_dirs() == [legacy, first, second]
+    assert layout.list_dirs(limit=2) == [legacy, first]
+    assert layout.find("m2") == second
+    assert layout.saved_at(legacy) == datetime(2024, 1, 1, 9, 0, 0)
+
+    assert layout.rebuild() == 3
+    assert layout.find("old") == legacy
+
+
+def test_archive_removes_directory_from_listing(tmp_path):
+    layout = EmailLayout(tmp_path / "emails")
+    email_dir = save(layout, "m1")
+
+    target = layout.archive(email_dir, tmp_path / "archive")
+
+    assert target.exists() and not email_dir.exists()
+    assert target.relative_to(tmp_path / "archive") == email_dir.relative_to(tmp_path / "emails")
+    assert layout.list_dirs() == []
+    assert layout.find("m1") is None
@@ -0,0 +1,47 @@
+import sys
+import types
+from pathlib import Path
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+from app.processing.extraction_cache import ExtractionCache, cache_key
+
+
+def test_cache_key_covers_every_input():
+    base = ("prompt", "model", "body", [b"pdf"], [".pdf"], "text_first=True")
+    key = cache_key(*base)
+
+    assert key == cache_key(*base)
+    assert key == cache_key("prompt", "model", "body", [b"pdf"], [".PDF"], "text_first=True")
+    for changed in (
+        ("prompt 2", "model", "body", [b"pdf"], [".pdf"], "text_first=True"),
+        ("prompt", "model-2", "body", [b"pdf"], [".pdf"], "text_first=True"),
+        ("prompt", "model", "body!", [b"pdf"], [".pdf"], "text_first=True"),
+        ("prompt", "model", "body", [b"pdf2"], [".pdf"], "text_first=True"),
+        ("prompt", "model", "body", [b"pdf"], [".png"], "text_first=True"),
+        ("prompt", "model", "body", [b"pdf", b"pdf"], [".pdf", ".pdf"], "text_first=True"),
+        ("prompt", "model", "body", [b"pdf"], [".pdf"], "text_first=False"),
+    ):
+        assert cache_key(*changed) != key
+
+
+def test_get_put_and_lru_eviction(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "cache.db"), max_bytes=80)
+
+    assert cache.get("a") is None
+    cache.put("a", "m", {"referral": False, "note": "a" * 5})
+    cache.put("b", "m", {"referral": False, "note": "b" * 5})
+    assert cache.get("a") == {"referral": False, "note": "aaaaa"}
+
+    # "b" is now least recently used and goes first
+    cache.put("c", "m", {"referral": False, "note": "c" * 5})
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["bytes"] <= 80
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (2, 2, 1)
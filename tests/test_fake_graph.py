@@ -0,0 +1,179 @@
+import sys
+import types
+from pathlib import Path
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+import asyncio
+
+import pytest
+import requests
+
+from app.email_ingest import blob_store, folder_cache, graph_transport
+from app.email_ingest.async_processor import AsyncEmailProcessor
+from app.email_ingest.email_processor import EmailProcessor
+from app.email_ingest.fake_graph import FakeGraphState, serve_in_background
+from app.settings import settings
+
+MAILBOX = "intake@example.com"
+
+
+@pytest.fixture
+def fake_graph(tmp_path, monkeypatch):
+    state = FakeGraphState(mailboxes=[MAILBOX], messages=30, attachments=2, attachment_size=4096,
+                           throttle_every=7, retry_after=0, token="test-token")
+    server = serve_in_background(state)
+    monkeypatch.setattr(settings, "GRAPH_ROOT", server.graph_root)
+    monkeypatch.setattr(settings, "GRAPH_STATIC_TOKEN", "test-token")
+    monkeypatch.setattr(settings, "GRAPH_RATE_PER_SECOND", 1000.0)
+    monkeypatch.setattr(settings, "EMAIL_DATA_DIR", str(tmp_path / "emails"))
+    monkeypatch.setattr(settings, "INGEST_STATE_DB_PATH", str(tmp_path / "state.db"))
+    monkeypatch.setattr(settings, "BLOB_STORE_DIR", str(tmp_path / "blobs"))
+    # Fresh process-wide transport and folder cache bound to the settings above
+    monkeypatch.setattr(graph_transport, "_transport", None)
+    monkeypatch.setattr(folder_cache, "_folder_cache", None)
+    monkeypatch.setattr(blob_store, "_blob_store", None)
+    yield state, server
+    server.shutdown()
+    server.server_close()
+
+
+def originals(state):
+    return {m["id"] for m in state.messages[MAILBOX].values()
+            if not m["subject"].startswith("RE:") and not m["from"]["emailAddress"]["address"].endswith("@yourcompany.com")}
+
+
+def test_delta_ingestion_end_to_end(fake_graph):
+    state, _ = fake_graph
+    processor = EmailProcessor()
+
+    results = processor.process_emails(mailbox=MAILBOX, src_path=["Inbox"], delta_sync=True)
+
+    expected = originals(state)
+    assert results["processed_messages"] == len(expected)
+    assert results["total_attachments"] == 2 * len(expected)
+    assert results["failed_messages"] == 0
+    assert state.snapshot()["throttled"] > 0
+    assert state.folder_counts(MAILBOX)["archive_processed"] == len(expected)
+    saved = processor.layout.find(sorted(expected)[0])
+    assert (saved / "attachments").is_dir()
+    assert all(p.stat().st_size == 4096 for p in (saved / "attachments").iterdir())
+
+    new_ids = state.add_messages(MAILBOX, 5, reply_ratio=0.0, internal_ratio=0.0)
+    results = processor.process_emails(mailbox=MAILBOX, src_path=["Inbox"], delta_sync=True)
+    assert results["total_messages"] == len(new_ids)
+    assert results["processed_messages"] == len(new_ids)
+
+
+def test_failed_message_is_retried_on_next_delta_run(fake_graph):
+    state, _ = fake_graph
+    processor = EmailProcessor()
+    broken = sorted(originals(state))[0]
+    save_email_data = processor.save_email_data
+
+    def failing_save(email_data, *args, **kwargs):
+        if email_data["id"] == broken:
+            raise OSError("disk full")
+        return save_email_data(email_data, *args, **kwargs)
+
+    processor.save_email_data = failing_save
+    results = processor.process_emails(mailbox=MAILBOX, src_path=["Inbox"], delta_sync=True)
+    assert results["failed_ids"] == [broken]
+    assert processor.delta_store.get(MAILBOX, processor.get_folder_id(MAILBOX, ["Inbox"])) is None
+
+    processor.save_email_data = save_email_data
+    results = processor.process_emails(mailbox=MAILBOX, src_path=["Inbox"], delta_sync=True)
+    assert results["failed_messages"] == 0
+    assert results["processed_messages"] == 1
+    assert processor.delta_store.get(MAILBOX, processor.get_folder_id(MAILBOX, ["Inbox"]))
+
+
+def test_saved_but_unmoved_message_is_resumed(fake_graph):
+    state, _ = fake_graph
+    processor = EmailProcessor()
+    move_messages_batch = processor.move_messages_batch
+    processor.move_messages_batch = lambda user, msg_ids, dest: {msg_id: False for msg_id in msg_ids}
+
+    results = processor.process_emails(mailbox=MAILBOX, src_path=["Inbox"], delta_sync=True)
+    assert results["processed_messages"] == len(originals(state))
+    assert state.folder_counts(MAILBOX)["archive_processed"] == 0
+
+    # The delta round is complete, so only the ledger knows these still need moving
+    processor.move_messages_batch = move_messages_batch
+    results = processor.process_emails(mailbox=MAILBOX, src_path=["Inbox"], delta_sync=True)
+    assert results["failed_messages"] == 0
+    assert state.folder_counts(MAILBOX)["archive_processed"] == len(originals(state))
+    assert processor.ledger.unfinished(MAILBOX, processor.get_folder_id(MAILBOX, ["Inbox"])) == []
+
+
+def test_async_delta_ingestion_end_to_end(fake_graph):
+    state, _ = fake_graph
+
+    async def run():
+        async with AsyncEmailProcessor() as processor:
+            first = await processor.process_emails(mailbox=MAILBOX, src_path=["Inbox"], delta_sync=True)
+            new_ids = state.add_messages(MAILBOX, 5, reply_ratio=0.0, internal_ratio=0.0)
+            second = await processor.process_emails(mailbox=MAILBOX, src_path=["Inbox"], delta_sync=True)
+            return processor, first, second, new_ids
+
+    processor, first, second, new_ids = asyncio.run(run())
+    expected = originals(state) - set(new_ids)
+    assert first["processed_messages"] == len(expected)
+    assert first["total_attachments"] == 2 * len(expected)
+    assert first["failed_messages"] == 0
+    assert state.snapshot()["throttled"] > 0
+    assert second["processed_messages"] == len(new_ids)
+    assert state.folder_counts(MAILBOX)["archive_processed"] == len(expected) + len(new_ids)
+    saved = processor.local.layout.find(sorted(expected)[0])
+    assert all(p.stat().st_size == 4096 for p in (saved / "attachments").iterdir())
+
+
+def test_async_failure_cancels_pending_downloads(fake_graph):
+    state, _ = fake_graph
+    state.throttle_every = 0
+
+    async def run():
+        async with AsyncEmailProcessor() as processor:
+            async def failing_finish(*args, **kwargs):
+                raise RuntimeError("save failed")
+            processor._finish_batch = failing_finish
+            with pytest.raises(RuntimeError):
+                await processor.process_emails(mailbox=MAILBOX, src_path=["Inbox"])
+            return [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+    assert asyncio.run(run()) == []
+
+
+def test_stale_cached_folder_is_resolved_again(fake_graph):
+    processor = EmailProcessor()
+    path = ["Inbox", "archive_processed"]
+    archive_id = processor.get_folder_id(MAILBOX, path)
+
+    # The cached Inbox ID no longer exists on the server (folder recreated)
+    processor.folder_cache.put(MAILBOX, ["Inbox"], "deleted-folder-id")
+    processor.folder_cache.invalidate(MAILBOX, path)
+
+    assert processor.get_folder_id(MAILBOX, path) == archive_id
+    assert processor.folder_cache.get(MAILBOX, ["Inbox"]) != "deleted-folder-id"
+
+
+def test_graph_errors_are_reproduced(fake_graph):
+    state, server = fake_graph
+    state.throttle_every = 0
+    url = f"{server.graph_root}/users/{MAILBOX}/mailFolders/Inbox/messages"
+    auth = {"Authorization": "Bearer test-token"}
+
+    assert requests.get(url).status_code == 401
+    resp = requests.get(url, params={"$filter": "not endswith(from/emailAddress/address,'@x.com')"}, headers=auth)
+    assert resp.status_code == 400
+    resp = requests.get(url, params={"$top": "5"}, headers=auth)
+    assert len(resp.json()["value"]) == 5
+    assert "$skip=5" in resp.json()["@odata.nextLink"]
+
+    batch = {"requests": [{"id": str(i), "method": "GET", "url": f"/users/{MAILBOX}/mailFolders/Inbox"}
+                          for i in range(21)]}
+    assert requests.post(f"{server.graph_root}/$batch", json=batch, headers=auth).status_code == 400
@@ -0,0 +1,50 @@
+import sys
+import types
+from pathlib import Path
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+from app.email_ingest import folder_cache
+from app.email_ingest.folder_cache import FolderCache
+
+
+def test_hits_are_shared_across_path_forms_and_instances(tmp_path):
+    db_path = str(tmp_path / "state.db")
+    cache = FolderCache(ttl_seconds=60, db_path=db_path)
+    cache.put("Intake@x.com", ["Inbox", "Referrals"], "folder-1")
+
+    assert cache.get("intake@x.com", "Inbox/Referrals/") == "folder-1"
+    assert FolderCache(ttl_seconds=60, db_path=db_path).get("intake@x.com", ["Inbox", "Referrals"]) == "folder-1"
+    assert cache.get("intake@x.com", ["Inbox"]) is None
+    assert cache.get("other@x.com", ["Inbox", "Referrals"]) is None
+
+
+def test_entries_expire_after_the_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(folder_cache.time, "time", lambda: now[0])
+    cache = FolderCache(ttl_seconds=60, db_path=str(tmp_path / "state.db"))
+    cache.put("intake@x.com", ["Inbox"], "inbox-id")
+
+    now[0] += 60
+    assert cache.get("intake@x.com", ["Inbox"]) == "inbox-id"
+    now[0] += 1
+    assert cache.get("intake@x.com", ["Inbox"]) is None
+
+
+def test_missing_folders_are_forgotten_with_their_subfolders(tmp_path):
+    cache = FolderCache(ttl_seconds=60, db_path=str(tmp_path / "state.db"))
+    cache.put("intake@x.com", ["Inbox"], "inbox-id")
+    cache.put("intake@x.com", ["Inbox", "Referrals"], "referrals-id")
+    cache.put("intake@x.com", ["Inbox", "Referrals", "archive_processed"], "archive-id")
+    cache.put("intake@x.com", ["Inbox", "Referrals_old"], "old-id")
+
+    cache.invalidate_id("intake@x.com", "referrals-id")
+
+    assert cache.get("intake@x.com", ["Inbox"]) == "inbox-id"
+    assert cache.get("intake@x.com", ["Inbox", "Referrals"]) is None
+    assert cache.get("intake@x.com", ["Inbox", "Referrals", "archive_processed"]) is None
+    assert cache.get("intake@x.com", ["Inbox", "Referrals_old"]) == "old-id"
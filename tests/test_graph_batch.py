@@ -0,0 +1,120 @@
+import json
+import sys
+import types
+from pathlib import Path
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+from app.email_ingest.graph_batch import MAX_BATCH_SIZE, GraphBatch
+
+GRAPH_ROOT = "https://graph.example/v1.0"
+
+
+class FakeScheduler:
+    max_retries = 3
+    base_delay = 1.0
+    max_delay = 8.0
+
+    def __init__(self):
+        self.pauses = []
+
+    def throttle(self, mailbox, seconds):
+        self.pauses.append((mailbox, seconds))
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return self.payload
+
+
+class FakeBatchTransport:
+    """Answers $batch posts by echoing each sub-request's URL; ``throttle`` maps ids to Retry-After once."""
+
+    def __init__(self, throttle=None, status=429):
+        self.scheduler = FakeScheduler()
+        self.throttle = dict(throttle or {})
+        self.status = status
+        self.posts = []
+        self.idempotent = []
+
+    def post(self, url, headers=None, data=None, mailbox=None, cost=1.0, idempotent=None):
+        assert url == f"{GRAPH_ROOT}/$batch"
+        chunk = json.loads(data)["requests"]
+        self.posts.append((mailbox, cost, [r["id"] for r in chunk]))
+        self.idempotent.append(idempotent)
+        responses = []
+        for r in reversed(chunk):  # Graph does not keep request order
+            if r["id"] in self.throttle:
+                responses.append({"id": r["id"], "status": self.status,
+                                  "headers": {"retry-after": self.throttle.pop(r["id"])}, "body": {}})
+            else:
+                responses.append({"id": r["id"], "status": 200, "body": {"url": r["url"]}})
+        return FakeResponse({"responses": responses})
+
+
+def test_requests_are_sent_in_chunks_of_twenty():
+    transport = FakeBatchTransport()
+    batch = GraphBatch(transport, GRAPH_ROOT)
+    for i in range(45):
+        batch.add("GET", f"{GRAPH_ROOT}/users/Intake@x.com/messages/m{i}")
+
+    responses = batch.execute()
+
+    assert len(responses) == 45
+    assert [len(chunk) for _, _, chunk in transport.posts] == [MAX_BATCH_SIZE, MAX_BATCH_SIZE, 5]
+    assert [cost for _, cost, _ in transport.posts] == [20, 20, 5]
+    assert all(mailbox == "intake@x.com" for mailbox, _, _ in transport.posts)
+    assert len(batch) == 0
+
+
+def test_responses_are_matched_to_their_requests():
+    transport = FakeBatchTransport()
+    batch = GraphBatch(transport, GRAPH_ROOT)
+    requested = {batch.add("GET", f"{GRAPH_ROOT}/users/intake@x.com/messages/m{i}"): f"m{i}" for i in range(25)}
+    custom = batch.add("GET", "/users/intake@x.com/messages?$filter=subject eq 'a b'", request_id="filter")
+
+    responses = batch.execute()
+
+    for request_id, msg_id in requested.items():
+        assert responses[request_id]["body"]["url"] == f"/users/intake@x.com/messages/{msg_id}"
+    assert responses[custom]["body"]["url"] == "/users/intake@x.com/messages?$filter=subject%20eq%20'a%20b'"
+
+
+def test_throttled_sub_requests_are_retried_after_retry_after():
+    transport = FakeBatchTransport(throttle={"2": "3", "21": "7"})
+    batch = GraphBatch(transport, GRAPH_ROOT)
+    for i in range(22):
+        batch.add("GET", f"{GRAPH_ROOT}/users/intake@x.com/messages/m{i}")
+
+    responses = batch.execute()
+
+    # Only the two throttled requests go out again, together, after the longest Retry-After
+    assert [chunk for _, _, chunk in transport.posts][2:] == [["2", "21"]]
+    assert transport.scheduler.pauses == [("intake@x.com", 7.0)]
+    assert all(resp["status"] == 200 for resp in responses.values())
+
+
+def test_timed_out_moves_are_not_resent():
+    transport = FakeBatchTransport(throttle={"read": "1", "move": "1"}, status=504)
+    batch = GraphBatch(transport, GRAPH_ROOT)
+    batch.add("GET", f"{GRAPH_ROOT}/users/intake@x.com/messages/m1", request_id="read")
+    batch.add("POST", f"{GRAPH_ROOT}/users/intake@x.com/messages/m2/move",
+              body={"destinationId": "done"}, request_id="move")
+
+    responses = batch.execute()
+
+    # The move may already have happened, so only the read goes out again
+    assert [chunk for _, _, chunk in transport.posts] == [["read", "move"], ["read"]]
+    assert transport.idempotent == [False, True]
+    assert responses["read"]["status"] == 200
+    assert responses["move"]["status"] == 504
@@ -0,0 +1,156 @@
+import asyncio
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+from app.email_ingest.graph_scheduler import (
+    GraphScheduler, TokenBucket, backoff_delay, mailbox_from_url, parse_retry_after
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code, retry_after=None):
+        self.status_code = status_code
+        self.headers = {"Retry-After": retry_after} if retry_after else {}
+
+
+def make_scheduler(clock, **kwargs):
+    return GraphScheduler(rate_per_second=10, burst=10, max_concurrency=4, max_retries=3,
+                          clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_mailbox_from_url():
+    assert mailbox_from_url("https://graph.microsoft.com/v1.0/users/Intake@X.com/messages?$top=5") == "intake@x.com"
+    assert mailbox_from_url("https://graph.microsoft.com/v1.0/$batch") == "default"
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("not a date") is None
+
+
+def test_backoff_delay_is_capped():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, 1.0, 8.0) <= 8.0
+
+
+def test_token_bucket_waits_for_refill():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock, sleep=clock.sleep)
+    bucket.acquire()
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.now == 0.5
+
+
+def test_send_honors_retry_after():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    answers = iter([FakeResponse(429, "5"), FakeResponse(200)])
+
+    resp = scheduler.send("box", lambda: next(answers))
+
+    assert resp.status_code == 200
+    assert clock.now >= 5
+    stats = scheduler.stats()
+    assert stats["throttled"] == 1
+    assert stats["retries"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_send_gives_up_after_max_retries():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    calls = []
+
+    def send():
+        calls.append(1)
+        return FakeResponse(503)
+
+    resp = scheduler.send("box", send)
+
+    assert resp.status_code == 503
+    assert len(calls) == 4
+    assert scheduler.stats()["failures"] == 1
+
+
+def test_send_retries_listed_exceptions():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, retry_exceptions=(ConnectionError,))
+    answers = iter([ConnectionError("reset"), FakeResponse(200)])
+
+    def send():
+        answer = next(answers)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    assert scheduler.send("box", send).status_code == 200
+
+
+def test_token_bucket_reserve_reports_wait():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=1, clock=clock, sleep=clock.sleep)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.5
+
+
+def test_send_async_retries_throttled_responses():
+    scheduler = GraphScheduler(rate_per_second=100, burst=10, max_concurrency=2, max_retries=3)
+    answers = iter([FakeResponse(429, "0"), FakeResponse(503, "0"), FakeResponse(200)])
+
+    async def send():
+        return next(answers)
+
+    resp = asyncio.run(scheduler.send_async("box", send))
+
+    assert resp.status_code == 200
+    stats = scheduler.stats()
+    assert stats["throttled"] == 2
+    assert stats["retries"] == 2
+    assert stats["in_flight"] == 0
+
+
+def test_non_idempotent_send_only_retries_throttling():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, retry_exceptions=(ConnectionError,))
+    calls = []
+
+    def timed_out():
+        calls.append(1)
+        return FakeResponse(504)
+
+    def dropped():
+        calls.append(1)
+        raise ConnectionError("reset")
+
+    # The move may have gone through before the gateway or connection gave up
+    assert scheduler.send("box", timed_out, idempotent=False).status_code == 504
+    with pytest.raises(ConnectionError):
+        scheduler.send("box", dropped, idempotent=False)
+    assert len(calls) == 2
+
+    answers = iter([FakeResponse(429, "1"), FakeResponse(201)])
+    assert scheduler.send("box", lambda: next(answers), idempotent=False).status_code == 201
@@ -0,0 +1,55 @@
+import sys
+import types
+from pathlib import Path
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+import pytest
+
+from app.email_ingest.ingest_ledger import FETCHED, MOVED, SAVED, IngestLedger
+
+
+def test_states_advance_and_keep_directory(tmp_path):
+    ledger = IngestLedger(str(tmp_path / "state.db"))
+    email_dir = tmp_path / "emails" / "m1"
+
+    ledger.mark("Intake@x.com", ["m1"], FETCHED, email_dir)
+    ledger.mark("intake@x.com", ["m1"], SAVED)
+    assert ledger.get("intake@x.com", "m1") == {"state": SAVED, "email_dir": str(email_dir)}
+
+    ledger.mark("intake@x.com", ["m1", "m2"], MOVED)
+    entries = ledger.get_many("INTAKE@x.com", ["m1", "m2", "m3"])
+    assert entries["m1"]["email_dir"] == str(email_dir)
+    assert entries["m2"] == {"state": MOVED, "email_dir": None}
+    assert "m3" not in entries
+    assert ledger.stats() == {MOVED: 2}
+
+    with pytest.raises(ValueError):
+        ledger.mark("intake@x.com", ["m1"], "done")
+
+
+def test_attachments_are_remembered_per_message(tmp_path):
+    ledger = IngestLedger(str(tmp_path / "state.db"))
+    path = tmp_path / "emails" / "m1" / "attachments" / "referral.pdf"
+
+    ledger.record_attachment("intake@x.com", "m1", "att-1", path)
+
+    assert ledger.attachments("intake@x.com", "m1") == {"att-1": path}
+    assert ledger.attachments("intake@x.com", "m2") == {}
+
+
+def test_unfinished_messages_are_listed_per_folder(tmp_path):
+    ledger = IngestLedger(str(tmp_path / "state.db"))
+    ledger.mark("intake@x.com", ["m1", "m2", "m3"], FETCHED, folder_id="inbox")
+    ledger.mark("intake@x.com", ["m4"], FETCHED, folder_id="other")
+    ledger.mark("intake@x.com", ["m2"], SAVED)
+    ledger.mark("intake@x.com", ["m3"], MOVED)
+
+    assert ledger.unfinished("Intake@x.com", "inbox") == ["m1", "m2"]
+
+    ledger.set_folder("intake@x.com", ["m1"], None)
+    assert ledger.unfinished("intake@x.com", "inbox") == ["m2"]
@@ -0,0 +1,64 @@
+import base64
+import io
+import sys
+import types
+from pathlib import Path
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+from PIL import Image
+
+from app.processing.llm_limiter import HEADER_B64_CHARS, LLMRateLimiter, estimate_tokens, image_size
+from app.processing.page_select import image_tokens
+
+
+def jpeg_url(width, height, **save_args):
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(buf, "JPEG", **save_args)
+    return "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode()
+
+
+def test_estimate_counts_text_images_and_completion():
+    messages = [
+        {"role": "system", "content": "x" * 400},
+        {"role": "user", "content": [
+            {"type": "text", "text": "y" * 800},
+            {"type": "image_url", "image_url": {"url": jpeg_url(768, 994)}},
+        ]},
+    ]
+    assert image_tokens(768, 994) == 765
+    assert estimate_tokens(messages, 2048) == 100 + 200 + 765 + 2048
+    # Same page through gpt-4o-mini, which bills images about 33x the base rate
+    assert estimate_tokens(messages, 2048, "gpt-4o-mini") == 100 + 200 + round(765 * 33.33) + 2048
+
+
+def test_unreadable_image_is_costed_at_the_largest_size():
+    messages = [{"role": "user", "content": [
+        {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64,..."}},
+    ]}]
+    assert estimate_tokens(messages) == image_tokens(768, 2048)
+
+
+def test_limiter_holds_back_once_a_minute_budget_is_spent():
+    limiter = LLMRateLimiter(rpm=2, tpm=10000)
+
+    limiter.acquire(6000)
+    assert limiter.tokens.reserve(6000) > 0      # would exceed the tokens per minute
+    assert limiter.requests.reserve(1) == 0      # second request of the minute is still free
+    assert limiter.requests.reserve(1) > 0
+
+    limiter.throttle(30)
+    assert limiter.tokens.reserve(1) >= 29
+
+
+def test_image_size_reads_only_the_header():
+    url = jpeg_url(1200, 1600)
+    start = url.index(",") + 1
+    # Data past the decoded prefix is never looked at
+    assert image_size(url[:start + HEADER_B64_CHARS] + "not base64!") == (1200, 1600)
+    # A header pushed past the decoded prefix is still found
+    assert image_size(jpeg_url(300, 200, exif=b"Exif\x00\x00" + b"\x00" * 20000)) == (300, 200)
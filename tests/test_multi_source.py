@@ -0,0 +1,53 @@
+import sys
+import types
+from pathlib import Path
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+from app.email_ingest import multi_source
+from app.email_ingest.multi_source import MultiSourceIngestor, SourceCheckpointStore, parse_sources
+
+
+def test_parse_sources():
+    sources = parse_sources("intake@x.com:Inbox/Referrals; other@x.com:Intake ;bare@x.com")
+    assert sources[0] == ("intake@x.com", ["Inbox", "Referrals"])
+    assert sources[1] == ("other@x.com", ["Intake"])
+    assert sources[2][0] == "bare@x.com" and sources[2][1]
+    assert parse_sources("") == []
+
+
+def test_run_merges_sources_and_records_checkpoints(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "state.db")
+
+    class FakeProcessor:
+        def __init__(self, download_workers=None):
+            self.download_workers = download_workers
+
+        def process_emails(self, mailbox, src_path, **kwargs):
+            if mailbox == "bad@x.com":
+                raise RuntimeError("folder missing")
+            return {"total_messages": 3, "processed_messages": 2, "failed_messages": 0,
+                    "skipped_messages": 1, "total_attachments": 4, "saved_locations": [mailbox]}
+
+    monkeypatch.setattr(multi_source, "EmailProcessor", FakeProcessor)
+    monkeypatch.setattr(multi_source, "get_transport",
+                        lambda: types.SimpleNamespace(scheduler=types.SimpleNamespace(stats=lambda: {})))
+    monkeypatch.setattr(multi_source, "SourceCheckpointStore", lambda: SourceCheckpointStore(db_path))
+
+    sources = [("a@x.com", ["Inbox"]), ("bad@x.com", ["Inbox"]), ("b@x.com", ["Inbox", "Intake"])]
+    summary = MultiSourceIngestor(sources, max_parallel=2, download_workers=4).run()
+
+    assert [s["mailbox"] for s in summary["sources"]] == ["a@x.com", "bad@x.com", "b@x.com"]
+    assert summary["processed_messages"] == 4
+    assert summary["total_attachments"] == 8
+    assert summary["failed_sources"] == 1
+    assert sorted(summary["saved_locations"]) == ["a@x.com", "b@x.com"]
+
+    checkpoints = SourceCheckpointStore(db_path)
+    assert checkpoints.get("A@x.com", "Inbox")["results"]["processed_messages"] == 2
+    assert checkpoints.get("bad@x.com", "Inbox")["status"] == "failed"
+    assert checkpoints.get("b@x.com", "Inbox/Intake")["status"] == "completed"
@@ -1,13 +1,17 @@
+import os
 import sys
 import types
 from pathlib import Path
 
 # Ensure repository root is on the import path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-# Create a minimal stub for the openai package so that importing the agent does
-# not fail in environments without the dependency installed.
-sys.modules.setdefault('openai', types.ModuleType('openai'))
-sys.modules.setdefault('fitz', types.ModuleType('fitz'))
+# Create minimal stubs for openai/PyMuPDF so that importing the agent does
+# not fail in environments without the dependencies installed.
+for name in ('openai', 'fitz'):
+    try:
+        __import__(name)
+    except ImportError:
+        sys.modules[name] = types.ModuleType(name)
 dotenv_stub = types.ModuleType('dotenv')
 dotenv_stub.load_dotenv = lambda *a, **k: None
 sys.modules.setdefault('dotenv', dotenv_stub)
@@ -30,3 +34,16 @@ def test_parse_fenced_json():
     assert parse_json_from_response(text) == {"a": 1, "b": "c"}
 
 
+def test_prompt_is_memoized_and_rebuilt_when_sample_changes(tmp_path):
+    from app.processing import openai_agent
+
+    sample = tmp_path / "sample.json"
+    sample.write_text('{"referral": true, "patient_name": null}')
+    first = openai_agent.get_prompt(sample)
+    assert "- patient_name" in first
+    assert openai_agent.get_prompt(sample) is first
+
+    sample.write_text('{"referral": true, "patient_name": null, "priority": null}')
+    os.utime(sample, ns=(0, sample.stat().st_mtime_ns + 1_000_000))
+    assert "- priority" in openai_agent.get_prompt(sample)
+    assert openai_agent.get_sample_fields(sample) == ["referral", "patient_name", "priority"]
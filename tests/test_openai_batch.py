@@ -0,0 +1,53 @@
+import json
+import sys
+import types
+from pathlib import Path
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+for name in ('openai', 'fitz'):
+    try:
+        __import__(name)
+    except ImportError:
+        sys.modules[name] = types.ModuleType(name)
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+from app.processing.fake_openai_batch import FakeOpenAIBatch
+from app.processing.openai_agent import collect_extraction_batch, submit_extraction_batch
+from app.processing.openai_batch import BatchFileWriter
+
+
+def request(text):
+    return {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": text}]}
+
+
+def test_writer_splits_files_at_batch_limits(tmp_path):
+    writer = BatchFileWriter(tmp_path, max_requests=2)
+    for i in range(5):
+        writer.add(f"email-{i}", request(str(i)))
+    paths = writer.close()
+
+    assert [p.name for p in paths] == ["requests-001.jsonl", "requests-002.jsonl", "requests-003.jsonl"]
+    line = json.loads(paths[0].read_text().splitlines()[0])
+    assert line["custom_id"] == "email-0" and line["url"] == "/v1/chat/completions"
+
+
+def test_submit_and_collect_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.processing.openai_batch.MAX_BATCH_REQUESTS", 2)
+
+    def respond(body):
+        text = body["messages"][0]["content"]
+        return "not json" if text == "bad" else f'```json\n{{"referral": true, "patient_name": "{text}"}}\n```'
+
+    client = FakeOpenAIBatch(respond, polls_to_complete=3, fail_ids={"c"})
+    pairs = [("a", request("Ann")), ("b", request("Bob")), ("c", request("Cy")), ("d", request("bad"))]
+
+    batch_ids = submit_extraction_batch(iter(pairs), tmp_path, client)
+    results, errors = collect_extraction_batch(batch_ids, client, poll_interval=0)
+
+    assert len(batch_ids) == 2 and client.stats["requests"] == 4
+    assert results == {"a": {"referral": True, "patient_name": "Ann"},
+                       "b": {"referral": True, "patient_name": "Bob"}}
+    assert set(errors) == {"c", "d"} and "server had an error" in errors["c"]
@@ -0,0 +1,66 @@
+import sys
+import types
+from pathlib import Path
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from app.processing import page_select
+
+
+def make_pdf(*pages):
+    """One letter page per entry: None is blank, otherwise the number of text lines."""
+    doc = fitz.open()
+    for lines in pages:
+        page = doc.new_page(width=612, height=792)
+        for n in range(lines or 0):
+            page.insert_text((36, 40 + n * 12), "Patient DOB 01/02/1980 claim 12345 procedure MRI lumbar " * 2, fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def test_image_tokens_follow_high_detail_tiling():
+    assert page_select.image_tokens(1700, 2200) == 765   # scaled to 768x994: 2x2 tiles
+    assert page_select.image_tokens(512, 663) == 425
+    assert page_select.image_tokens(500, 500) == 255
+    assert page_select.size_for(612, 792, 768) == (994, 765)
+
+
+def test_plan_skips_blank_cover_and_fills_budget_by_score():
+    scores = page_select.score_pdf(make_pdf(None, 60, 3, 20))
+    assert scores[0]["ink"] < page_select.MIN_INK
+
+    plan, = page_select.plan_pages([scores], budget=1200)
+    # Dense page 2 large (765), then the next best page small (425); blank cover and page 3 left out
+    assert plan == {1: 994, 3: 663}
+
+
+def test_every_pdf_keeps_a_large_page_and_blank_pdfs_send_page_one():
+    dense = page_select.score_pdf(make_pdf(60, 60))
+    blank = page_select.score_pdf(make_pdf(None, None))
+
+    plans = page_select.plan_pages([dense, dense, blank], budget=0)
+
+    assert plans[0] == {0: 994} and plans[1] == {0: 994}
+    assert plans[2] == {0: 663}
+
+
+def test_pages_past_the_scan_cap_are_reported(capsys):
+    scores = page_select.score_pdf(make_pdf(*[3] * 10), max_pages=8)
+
+    assert [s["page"] for s in scores] == list(range(8))
+    assert "pages 9-10 can't be selected" in capsys.readouterr().out
+
+
+def test_blank_scans_of_text_pdfs_are_not_sent():
+    blank = page_select.score_pdf(make_pdf(None, None))
+
+    assert page_select.plan_pages([blank, blank], budget=0, has_text=[True, False]) == [{}, {0: 663}]
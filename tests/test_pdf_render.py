@@ -0,0 +1,90 @@
+import base64
+import sys
+import types
+from pathlib import Path
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from app.processing import pdf_render, render_cache
+from app.settings import settings
+
+
+@pytest.fixture(autouse=True)
+def temp_render_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "RENDER_CACHE_DIR", str(tmp_path / "render_cache"))
+    monkeypatch.setattr(settings, "INGEST_STATE_DB_PATH", str(tmp_path / "state.db"))
+    monkeypatch.setattr(render_cache, "_cache", None)
+
+
+def make_pdf(*sizes):
+    doc = fitz.open()
+    for width, height in sizes:
+        page = doc.new_page(width=width, height=height)
+        page.insert_text((36, 72), f"Page {doc.page_count}")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def image_size(b64):
+    pix = fitz.Pixmap(base64.b64decode(b64))
+    return pix.width, pix.height
+
+
+def test_render_zoom_caps_longest_side():
+    assert pdf_render.render_zoom(612, 792) == pytest.approx(200 / 72)
+    assert pdf_render.render_zoom(1224, 792) * 1224 == pytest.approx(2200)
+    assert pdf_render.render_zoom(612, 2000) * 2000 == pytest.approx(2200)
+
+
+def test_renders_only_requested_pages_at_target_size():
+    pdf = make_pdf((612, 792), (1224, 792), (612, 792))
+
+    assert len(pdf_render.render_pdf_pages(pdf)) == 3
+    first, wide = pdf_render.render_pdf_pages(pdf, pages=[0, 1, 7])
+    assert image_size(first) == (1700, 2200)
+    assert image_size(wide)[0] == 2200
+
+
+def test_render_many_keeps_order_across_processes(monkeypatch):
+    monkeypatch.setattr(settings, "PDF_RENDER_WORKERS", 2)
+    pdfs = [make_pdf((300 + 100 * i, 300)) for i in range(3)]
+
+    rendered = pdf_render.render_many(pdfs, pages=[0])
+
+    widths = [image_size(images[0])[0] for images in rendered]
+    assert widths == sorted(widths) and len(set(widths)) == 3
+
+
+def test_cached_pages_are_not_rendered_again(monkeypatch):
+    pdf = make_pdf((612, 792), (612, 792))
+    first = pdf_render.render_pdf_pages(pdf, max_dims={1: 994})
+
+    def no_open(*a, **k):
+        raise AssertionError("PDF opened for a cached page")
+    monkeypatch.setattr(fitz, "open", no_open)
+
+    assert pdf_render.render_pdf_pages(pdf, max_dims={1: 994}) == first
+    assert render_cache.get_render_cache().stats()["hits"] == 1
+    with pytest.raises(AssertionError):
+        pdf_render.render_pdf_pages(pdf, max_dims={1: 663})   # other size, other key
+
+
+def test_render_cache_evicts_least_recently_used(tmp_path):
+    cache = render_cache.RenderCache(tmp_path / "pages", str(tmp_path / "index.db"), max_bytes=250)
+    for key in ("a", "b"):
+        cache.put(key, key.encode() * 100)
+    cache.get("a")
+    cache.put("c", b"c" * 100)
+
+    assert cache.get("b") is None and not cache.path_for("b").exists()
+    assert cache.get("a") == b"a" * 100
+    assert cache.stats()["pages"] == 2 and cache.stats()["evictions"] == 1
@@ -0,0 +1,86 @@
+import sys
+import types
+from pathlib import Path
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from app.processing import render_cache
+from app.processing.pdf_text import split_text_layer, text_quality, usable_text_layer
+from app.settings import settings
+
+REFERRAL_TEXT = ("Patient: Jane Doe  DOB: 01/02/1980  Claim #: WC-12345\n"
+                 "Requested procedure: MRI lumbar spine without contrast.\n"
+                 "Adjuster: John Smith, (555) 010-2000, jsmith@carrier.example\n") * 4
+
+
+def make_pdf(text=None, image=False, pages=None):
+    doc = fitz.open()
+    for text, image in pages or [(text, image)]:
+        page = doc.new_page(width=612, height=792)
+        if text:
+            page.insert_textbox(fitz.Rect(36, 36, 576, 500), text, fontsize=9)
+        if image:
+            pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 100, 130), False)
+            pix.set_rect(pix.irect, (60, 60, 60))
+            page.insert_image(fitz.Rect(0, 0, 612, 792), pixmap=pix)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def test_text_quality_flags_garbage():
+    good = text_quality(REFERRAL_TEXT)
+    assert good["word_ratio"] > 0.9 and good["garbage_ratio"] == 0
+    bad = text_quality(" �� ~~~ ^^^ " * 50)
+    assert bad["garbage_ratio"] > 0.2 and bad["word_ratio"] < 0.5
+
+
+def test_digital_pdf_yields_text():
+    text = usable_text_layer(make_pdf(REFERRAL_TEXT))
+    assert text.startswith("--- Page 1 ---")
+    assert "MRI lumbar spine" in text
+
+
+def test_scans_and_short_pages_fall_back_to_rendering():
+    assert usable_text_layer(make_pdf(image=True)) is None
+    assert usable_text_layer(make_pdf("Fax cover")) is None
+    # OCR layer over a full-page scan: the image, not the text, is authoritative
+    assert usable_text_layer(make_pdf(REFERRAL_TEXT, image=True)) is None
+
+
+def test_scanned_pages_behind_digital_pages_are_rendered(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "RENDER_CACHE_DIR", str(tmp_path / "render_cache"))
+    monkeypatch.setattr(settings, "INGEST_STATE_DB_PATH", str(tmp_path / "state.db"))
+    monkeypatch.setattr(render_cache, "_cache", None)
+    from app.processing.openai_agent import build_attachment_content
+
+    pdf = make_pdf(pages=[(REFERRAL_TEXT, False), (None, True), (REFERRAL_TEXT, False), (None, True)])
+    text, scanned = split_text_layer(pdf)
+    assert text.count("--- Page") == 2 and "--- Page 3 ---" in text
+    assert scanned == [1, 3]
+
+    parts = build_attachment_content([pdf], [".pdf"], text_first=True)
+    assert parts[0]["text"].startswith("Attachment 1 (PDF text):")
+    assert parts[1]["text"].startswith("Attachment 1 (scanned PDF pages 2")
+    assert len([p for p in parts if p["type"] == "image_url"]) >= 1
+
+
+def test_blank_pages_behind_digital_pages_are_not_rendered(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "RENDER_CACHE_DIR", str(tmp_path / "render_cache"))
+    monkeypatch.setattr(settings, "INGEST_STATE_DB_PATH", str(tmp_path / "state.db"))
+    monkeypatch.setattr(render_cache, "_cache", None)
+    from app.processing.openai_agent import build_attachment_content
+
+    pdf = make_pdf(pages=[(REFERRAL_TEXT, False), (None, False)])
+    assert split_text_layer(pdf)[1] == [1]
+
+    parts = build_attachment_content([pdf], [".pdf"], text_first=True)
+    assert [p["type"] for p in parts] == ["text"]
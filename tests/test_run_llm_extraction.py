@@ -0,0 +1,32 @@
+import json
+import sys
+import types
+from pathlib import Path
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+from app.processing.openai_agent import SAMPLE_PATH
+from app.processing.structured_output import build_response_schema
+from scripts.run_llm_extraction import get_database_connection, update_referral_in_database
+
+
+def test_schema_shaped_answer_is_stored(tmp_path):
+    # The sample is itself a valid answer under the strict schema, array fields included
+    answer = json.loads(SAMPLE_PATH.read_text())
+    schema = build_response_schema(answer)
+    assert schema["properties"]["intake_requested_procedure"]["type"] == ["array", "null"]
+    conn = get_database_connection(str(tmp_path / "referrals.db"))
+
+    assert update_referral_in_database(conn, "e1", answer, ["a.pdf"], "Referral", "a@x.com")
+    answer["intake_requested_procedure"] = ["MRI of right knee"]
+    assert update_referral_in_database(conn, "e1", answer, ["a.pdf"], "Referral", "a@x.com")
+
+    injury, procedures = conn.execute(
+        "SELECT injury_description, intake_requested_procedure FROM referrals WHERE email_id = 'e1'"
+    ).fetchone()
+    assert json.loads(injury) == answer["injury_description"]
+    assert json.loads(procedures) == ["MRI of right knee"]
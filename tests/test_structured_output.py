@@ -0,0 +1,52 @@
+import sys
+import types
+from pathlib import Path
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+from types import SimpleNamespace
+
+from app.processing.structured_output import (IncrementalObjectParser, build_response_schema,
+                                              stream_completion_text)
+
+
+def chunks(*texts):
+    return [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=t, refusal=None))])
+            for t in texts]
+
+
+def test_schema_follows_sample_types_and_order():
+    schema = build_response_schema({"referral": True, "patient_name": "A", "procedures": ["MRI"]})
+
+    assert list(schema["properties"]) == schema["required"] == ["referral", "patient_name", "procedures"]
+    assert schema["properties"]["referral"] == {"type": "boolean"}
+    assert schema["properties"]["patient_name"] == {"type": ["string", "null"]}
+    assert schema["properties"]["procedures"] == {"type": ["array", "null"], "items": {"type": "string"}}
+    assert schema["additionalProperties"] is False
+
+
+def test_parser_yields_members_as_they_complete_across_chunks():
+    parser = IncrementalObjectParser()
+    text = '{"referral": true, "note": "a, \\"b\\" {c}", "procedures": ["MRI", "EMG"], "priority": null}'
+    seen = []
+    for i in range(0, len(text), 7):
+        seen.extend(parser.feed(text[i:i + 7]))
+
+    assert seen == [("referral", True), ("note", 'a, "b" {c}'), ("procedures", ["MRI", "EMG"]), ("priority", None)]
+    assert parser.result() == dict(seen)
+
+
+def test_referral_false_is_known_before_the_stream_ends():
+    stream = iter(chunks('{"refer', 'ral": false', ', "patient_name"', ': null}'))
+    parser = IncrementalObjectParser()
+    consumed = 0
+    for text in stream_completion_text(stream):
+        consumed += 1
+        if ("referral", False) in parser.feed(text):
+            break
+
+    assert consumed == 3
@@ -0,0 +1,118 @@
+import io
+import json
+import sys
+import threading
+import types
+from pathlib import Path
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+
+# Ensure repository root is on the import path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+dotenv_stub = types.ModuleType('dotenv')
+dotenv_stub.load_dotenv = lambda *a, **k: None
+sys.modules.setdefault('dotenv', dotenv_stub)
+
+from app.email_ingest.notifications import GraphSubscriptions, NotificationQueue, NotificationWorker
+from app.email_ingest.webhook import make_webhook_app
+
+
+def call(app, method="POST", query="", body=None):
+    environ = {}
+    setup_testing_defaults(environ)
+    data = json.dumps(body).encode() if body is not None else b""
+    environ.update({"REQUEST_METHOD": method, "QUERY_STRING": query,
+                    "CONTENT_LENGTH": str(len(data)), "wsgi.input": io.BytesIO(data)})
+    status = {}
+    chunks = app(environ, lambda s, headers: status.update(code=s))
+    return status["code"], b"".join(chunks)
+
+
+def notification(message_id, client_state="secret", subscription_id="sub-1"):
+    return {"subscriptionId": subscription_id, "clientState": client_state, "changeType": "created",
+            "resource": f"Users/user-guid/Messages/{message_id}", "resourceData": {"id": message_id}}
+
+
+def make_app(tmp_path):
+    db_path = str(tmp_path / "state.db")
+    queue = NotificationQueue(db_path)
+    subscriptions = GraphSubscriptions(db_path=db_path)
+    subscriptions.conn.execute(
+        "INSERT INTO graph_subscriptions VALUES ('sub-1', 'intake@x.com', 'Inbox/Referrals', 'r', '2099')"
+    )
+    subscriptions.conn.commit()
+    return make_webhook_app(queue, subscriptions, client_state="secret"), queue
+
+
+def test_validation_token_is_echoed(tmp_path):
+    app, _ = make_app(tmp_path)
+    status, body = call(app, query="validationToken=Validation%3A+abc+123")
+    assert status.startswith("200")
+    assert body == b"Validation: abc 123"
+
+
+def test_notifications_are_queued_once_and_checked(tmp_path):
+    app, queue = make_app(tmp_path)
+    status, _ = call(app, body={"value": [notification("m1"), notification("m2", client_state="wrong")]})
+    assert status.startswith("202")
+    call(app, body={"value": [notification("m1")]})
+
+    rows = queue.claim()
+    assert [(r["mailbox"], r["folder"], r["message_id"]) for r in rows] == [("intake@x.com", "Inbox/Referrals", "m1")]
+
+
+def test_unknown_subscriptions_and_missing_secret_are_rejected(tmp_path):
+    app, queue = make_app(tmp_path)
+    call(app, body={"value": [notification("m3", subscription_id="sub-unknown")]})
+    assert queue.claim() == []
+
+    with pytest.raises(ValueError):
+        make_webhook_app(queue, GraphSubscriptions(db_path=str(tmp_path / "state.db")), client_state="")
+
+
+def test_worker_completes_and_retries(tmp_path):
+    queue = NotificationQueue(str(tmp_path / "state.db"), max_attempts=2)
+    for message_id in ("m1", "m2"):
+        queue.enqueue("intake@x.com", message_id, "Inbox/Referrals")
+
+    class FakeProcessor:
+        def __init__(self):
+            self.calls = []
+
+        def process_message_ids(self, mailbox, message_ids, src_path=None, **kwargs):
+            self.calls.append((mailbox, message_ids, src_path))
+            return {"processed_messages": 1, "failed_ids": ["m2"]}
+
+    processor = FakeProcessor()
+    worker = NotificationWorker(processor, queue)
+    assert worker.run_once()["processed_messages"] == 1
+    assert processor.calls == [("intake@x.com", ["m1", "m2"], ["Inbox", "Referrals"])]
+    assert queue.stats() == {"done": 1, "pending": 1}
+
+    worker.run_once()
+    assert queue.stats() == {"done": 1, "failed": 1}
+
+
+def test_subscriptions_are_renewed_on_a_timer(tmp_path):
+    renewed = threading.Event()
+
+    class FakeTransport:
+        def request(self, method, url, json=None):
+            assert (method, url) == ("PATCH", "https://graph.example/v1.0/subscriptions/sub-1")
+            renewed.set()
+            return types.SimpleNamespace(status_code=200, text="")
+
+    subscriptions = GraphSubscriptions(FakeTransport(), "https://graph.example/v1.0", str(tmp_path / "state.db"))
+    subscriptions.conn.execute(
+        "INSERT INTO graph_subscriptions VALUES ('sub-1', 'intake@x.com', 'Inbox/Referrals', 'r', '2000')"
+    )
+    subscriptions.conn.commit()
+
+    # No worker runs at all; the timer alone keeps the subscription alive
+    stop = subscriptions.renew_in_background(interval=0.01)
+    try:
+        assert renewed.wait(5)
+    finally:
+        stop.set()
+    assert subscriptions.ids_for("intake@x.com") == ["sub-1"]